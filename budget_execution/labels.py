@@ -0,0 +1,61 @@
+"""
+In process cache of the descriptions of the budget dimensions (Grupo,
+Subgrupo, Elemento, Subfuncao, Programa...), so the mosaico serializers and
+breadcrumbs look them up by id instead of joining or lazy loading the
+dimension of each execucao.
+
+The dimensions only change in the execucoes ETL, which updates the
+execucoes DatasetMetadata when it ends, so the cache is versioned by it and
+loaded again after each ETL. Ids missing from the cache also load it again.
+Before the ETL registers the metadata nothing is cached.
+"""
+from budget_execution import models
+from global_app.metadata import EXECUCOES_DATASET, get_dataset_metadata
+
+
+# {(model, field): (version, {id: value})}
+_cache = {}
+
+
+def get_version():
+    """Version of the dimensions: when the execucoes ETL last ended"""
+    metadata = get_dataset_metadata(EXECUCOES_DATASET)
+    return metadata.updated_at if metadata else None
+
+
+def _get_values(model, field, reload=False):
+    """{id: field value} of all the rows of `model`"""
+    key = (model, field)
+    version = get_version()
+    cached = _cache.get(key)
+    if reload or not cached or cached[0] != version:
+        cached = (version, dict(model.objects.values_list('id', field)))
+        _cache[key] = cached
+    return cached[1]
+
+
+def _get_value(model, field, pk):
+    if pk is None:
+        return None
+    if get_version() is None:
+        # without the metadata there's nothing telling when to load it again
+        return model.objects.filter(id=pk).values_list(field, flat=True) \
+            .first()
+    values = _get_values(model, field)
+    if pk not in values:
+        # created after the cache was loaded
+        values = _get_values(model, field, reload=True)
+    return values.get(pk)
+
+
+def get_label(model, pk):
+    """`desc` of the `model` row with id `pk`"""
+    return _get_value(model, 'desc', pk)
+
+
+def get_grupo_id(subgrupo_id):
+    return _get_value(models.Subgrupo, 'grupo_id', subgrupo_id)
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_execution', '0032_auto_20190709_0134'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empenho',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='orcamento',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
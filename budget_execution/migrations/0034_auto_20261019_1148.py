@@ -0,0 +1,32 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_execution', '0033_auto_20261019_1141'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawLoadWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('dt_data_loaded', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='empenhoraw',
+            name='dt_data_loaded',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='orcamentoraw',
+            name='dt_data_loaded',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+# same format as Execucao.build_indexer
+FILL_INDEXER_SQL = """
+UPDATE {table} SET indexer = concat_ws('.',
+    to_char(year, 'YYYY'), orgao_id, projeto_id, categoria_id, gnd_id,
+    modalidade_id, elemento_id, fonte_id,
+    coalesce(subelemento_id::text, 'None'))
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_execution', '0034_auto_20261019_1148'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='execucao',
+            name='indexer',
+            field=models.CharField(db_index=True, editable=False, max_length=80, null=True),
+        ),
+        migrations.AddField(
+            model_name='execucaotemp',
+            name='indexer',
+            field=models.CharField(db_index=True, editable=False, max_length=80, null=True),
+        ),
+        migrations.RunSQL(
+            FILL_INDEXER_SQL.format(table='budget_execution_execucao'),
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            FILL_INDEXER_SQL.format(table='budget_execution_execucaotemp'),
+            migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:58
+
+from django.db import migrations, models
+
+
+# same format as Orcamento and Empenho.build_raw_key_hash
+FILL_RAW_KEY_HASH_SQL = """
+UPDATE {table} SET raw_key_hash = md5(concat_ws('.', {columns}))
+"""
+ORCAMENTO_COLUMNS = [
+    'cd_ano_execucao', 'cd_orgao', 'cd_projeto_atividade',
+    'ds_categoria_despesa', 'cd_grupo_despesa', 'cd_modalidade',
+    'cd_elemento', 'cd_fonte', 'cd_unidade', 'cd_subfuncao']
+EMPENHO_COLUMNS = [
+    'an_empenho', 'cd_orgao', 'cd_projeto_atividade', 'cd_categoria',
+    'cd_grupo', 'cd_modalidade', 'cd_elemento', 'cd_fonte_de_recurso',
+    'cd_unidade', 'cd_subfuncao']
+
+
+def fill_raw_key_hash_sql(table, columns):
+    return FILL_RAW_KEY_HASH_SQL.format(table=table, columns=', '.join(
+        f"coalesce({column}::text, 'None')" for column in columns))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget_execution', '0035_auto_20261019_1156'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empenho',
+            name='raw_key_hash',
+            field=models.CharField(db_index=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='orcamento',
+            name='raw_key_hash',
+            field=models.CharField(db_index=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.RunSQL(
+            fill_raw_key_hash_sql('orcamento', ORCAMENTO_COLUMNS),
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            fill_raw_key_hash_sql('empenhos', EMPENHO_COLUMNS),
+            migrations.RunSQL.noop),
+    ]
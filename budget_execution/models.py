@@ -1,11 +1,20 @@
+import hashlib
 import math
 
 from datetime import date
 from decimal import Decimal
 
-from django.db import models
+from django.db import connections, models
+from django.db.models import DateTimeField, Max, TextField, Value
+from django.db.models.functions import MD5, Cast, Coalesce, Concat
 from django.forms.models import model_to_dict
 from django.urls import reverse_lazy
+from django.utils import timezone
+
+from budget_execution import labels
+from budget_execution.constants import SME_ORGAO_ID
+from global_app.metadata import (
+    EXECUCOES_DATASET, get_dataset_metadata, update_dataset_metadata)
 
 
 class ExecucaoManager(models.Manager):
@@ -171,35 +180,32 @@ class ExecucaoManager(models.Manager):
 
     def get_by_indexer(self, indexer):
         info = map(int, indexer.split('.'))
-        info = list(info)
 
         return self.get_queryset().get(
-                year=date(info[0], 1, 1),
-                orgao_id=info[1],
-                projeto_id=info[2],
-                categoria_id=info[3],
-                gnd_id=info[4],
-                modalidade_id=info[5],
-                elemento_id=info[6],
-                fonte_id=info[7],
-                subelemento_id=info[8])
+            indexer='.'.join(str(code) for code in info))
 
     def filter_by_indexer(self, indexer):
         """Uses indexer without subelemento_id to return a queryset of
         Execucao containing all that matches the indexer."""
-
-        info = map(int, indexer.split('.'))
-        info = list(info)
-
         return self.get_queryset().filter(
-                year=date(info[0], 1, 1),
-                orgao_id=info[1],
-                projeto_id=info[2],
-                categoria_id=info[3],
-                gnd_id=info[4],
-                modalidade_id=info[5],
-                elemento_id=info[6],
-                fonte_id=info[7])
+            indexer__startswith=get_indexer_prefix(indexer))
+
+    def fill_missing_indexers(self, batch_size=5000):
+        """
+        Fills the indexer of execucoes saved without calling `save`, like the
+        ones loaded from fixtures
+        """
+        execucoes = self.get_queryset().filter(indexer__isnull=True) \
+            .order_by('id').iterator(chunk_size=batch_size)
+        batch = []
+        for execucao in execucoes:
+            execucao.indexer = execucao.build_indexer()
+            batch.append(execucao)
+            if len(batch) == batch_size:
+                self.bulk_update(batch, ['indexer'])
+                batch = []
+        if batch:
+            self.bulk_update(batch, ['indexer'])
 
     def filter_by_subelemento_fromto_code(self, code):
         """Uses subelemento fromto code to return a queryset of
@@ -216,13 +222,66 @@ class ExecucaoManager(models.Manager):
                 subelemento_id=info[4])
 
     def get_date_updated(self):
-        last_execucao = self.get_queryset().order_by('-dt_updated') \
-            .first()
-        if last_execucao:
-            return last_execucao.dt_updated.strftime('%d/%m/%Y')
+        last_modified = self.get_last_modified()
+        if last_modified:
+            return last_modified.strftime('%d/%m/%Y')
         else:
             return None
 
+    def get_last_modified(self):
+        """Used as the Last-Modified of the views built from execucoes"""
+        metadata = get_dataset_metadata(EXECUCOES_DATASET)
+        if metadata:
+            return metadata.dt_updated
+        return self.get_queryset().aggregate(
+            last_modified=Max('dt_updated'))['last_modified']
+
+    def get_newest_year(self):
+        """
+        Newest year of the execucoes shown by default (SME's, not minimo
+        legal)
+        """
+        metadata = get_dataset_metadata(EXECUCOES_DATASET)
+        if metadata:
+            return metadata.newest_year
+        last = self.get_queryset() \
+            .filter(orgao_id=SME_ORGAO_ID, is_minimo_legal=False) \
+            .order_by('year').last()
+        return last.year.year if last else None
+
+    def get_years(self):
+        """Years of the execucoes shown by default, oldest first"""
+        metadata = get_dataset_metadata(EXECUCOES_DATASET)
+        if metadata:
+            return metadata.years
+        return [year.year for year in self._get_default_years()]
+
+    def update_metadata(self):
+        """Registers the dataset metadata read by the views. Run by the ETL"""
+        queryset = self.get_queryset()
+        years = self._get_default_years()
+        return update_dataset_metadata(
+            EXECUCOES_DATASET,
+            dt_updated=queryset.aggregate(
+                last_modified=Max('dt_updated'))['last_modified'],
+            years=[year.year for year in years],
+            row_count=queryset.count())
+
+    def _get_default_years(self):
+        return self.get_queryset() \
+            .filter(orgao_id=SME_ORGAO_ID, is_minimo_legal=False) \
+            .dates('year', 'year')
+
+
+def get_indexer_prefix(indexer):
+    """
+    Start of the indexers of the execucoes with the year, orgao, projeto,
+    categoria, gnd, modalidade, elemento and fonte of `indexer`. Any codes
+    after these, like the subelemento of empenhos, are ignored.
+    """
+    info = map(int, indexer.split('.')[:8])
+    return '.'.join(str(code) for code in info) + '.'
+
 
 class Execucao(models.Model):
     year = models.DateField()
@@ -252,6 +311,9 @@ class Execucao(models.Model):
         'SubelementoFriendly', models.SET_NULL, null=True)
     dt_created = models.DateTimeField(auto_now_add=True)
     dt_updated = models.DateTimeField(db_index=True, auto_now=True)
+    # filled on save, so the lookups by indexer use a single index
+    indexer = models.CharField(max_length=80, null=True, db_index=True,
+                               editable=False)
 
     objects = ExecucaoManager()
 
@@ -263,8 +325,11 @@ class Execucao(models.Model):
             'year', 'orgao', 'projeto', 'categoria', 'gnd', 'modalidade',
             'elemento', 'fonte']
 
-    @property
-    def indexer(self):
+    def save(self, *args, **kwargs):
+        self.indexer = self.build_indexer()
+        super().save(*args, **kwargs)
+
+    def build_indexer(self):
         s = self
         return (
             f'{s.year.strftime("%Y")}.{s.orgao_id}.{s.projeto_id}.'
@@ -273,14 +338,15 @@ class Execucao(models.Model):
 
     def get_url(self, area):
         # simples areas
+        grupo_id = labels.get_grupo_id(self.subgrupo_id)
         if area == 'grupos':
             args = []
         elif area == 'subgrupos':
-            args = [self.subgrupo.grupo_id]
+            args = [grupo_id]
         elif area == 'elementos':
-            args = [self.subgrupo.grupo_id, self.subgrupo_id]
+            args = [grupo_id, self.subgrupo_id]
         elif area == 'subelementos':
-            args = [self.subgrupo.grupo_id, self.subgrupo_id, self.elemento_id]
+            args = [grupo_id, self.subgrupo_id, self.elemento_id]
 
         # tecnico areas
         elif area == 'subfuncoes':
@@ -312,6 +378,9 @@ class ExecucaoTemp(models.Model):
 
     dt_created = models.DateTimeField(auto_now_add=True)
     dt_updated = models.DateTimeField(db_index=True, auto_now=True)
+    # filled on save, so the lookups by indexer use a single index
+    indexer = models.CharField(max_length=80, null=True, db_index=True,
+                               editable=False)
 
     objects = ExecucaoManager()
 
@@ -323,8 +392,11 @@ class ExecucaoTemp(models.Model):
             'year', 'orgao', 'projeto', 'categoria', 'gnd', 'modalidade',
             'elemento', 'fonte']
 
-    @property
-    def indexer(self):
+    def save(self, *args, **kwargs):
+        self.indexer = self.build_indexer()
+        super().save(*args, **kwargs)
+
+    def build_indexer(self):
         s = self
         return (
             f'{s.year.strftime("%Y")}.{s.orgao_id}.{s.projeto_id}.'
@@ -430,9 +502,56 @@ class SubelementoFriendly(models.Model):
     desc = models.CharField(max_length=100)
 
 
+# fields of the raw_indexer of the empenhos, in order
+EMPENHO_RAW_KEY_FIELDS = [
+    'an_empenho', 'cd_orgao', 'cd_projeto_atividade', 'cd_categoria',
+    'cd_grupo', 'cd_modalidade', 'cd_elemento', 'cd_fonte_de_recurso',
+    'cd_unidade', 'cd_subfuncao']
+
+
+def get_raw_key_hash(raw_indexer):
+    return hashlib.md5(raw_indexer.encode()).hexdigest()
+
+
+def _get_values_hash_expression(fields, separator):
+    """md5 of the values of `fields` as text joined by `separator`"""
+    parts = []
+    for field in fields:
+        parts += [Coalesce(Cast(field, TextField()), Value('None')),
+                  Value(separator)]
+    return MD5(Concat(*parts[:-1], output_field=TextField()))
+
+
+def get_raw_key_hash_expression(fields):
+    """get_raw_key_hash of the raw_indexer built by the database"""
+    return _get_values_hash_expression(fields, '.')
+
+
+# fields of the raw tables that aren't copied to the loaded ones
+CONTENT_HASH_EXCLUDED_FIELDS = ['id', 'dt_data_loaded']
+
+
+def get_content_hash_fields(raw_model, model):
+    """Fields of the `raw_model` rows copied to `model`, in order"""
+    model_fields = {field.name for field in model._meta.concrete_fields}
+    return [field.name for field in raw_model._meta.concrete_fields
+            if field.name not in CONTENT_HASH_EXCLUDED_FIELDS and
+            field.name in model_fields]
+
+
+def get_content_hash_expression(fields):
+    """
+    Hash of the values of a raw row, stored in the content_hash of the rows
+    loaded from it. Computed by the database, so the loads that copy the rows
+    with INSERT ... SELECT fill it the same way as the others.
+    """
+    return _get_values_hash_expression(fields, '\x1f')
+
+
 class OrcamentoManager(models.Manager):
 
-    def create_or_update_orcamento_from_raw(self, orcamento_raw):
+    def create_or_update_orcamento_from_raw(self, orcamento_raw,
+                                            content_hash=None):
         orcamento = self.get_by_raw_indexer(orcamento_raw.raw_indexer)
         if not orcamento:
             orcamento = self.model()
@@ -452,6 +571,7 @@ class OrcamentoManager(models.Manager):
         orc_raw_dict.pop('id')
         for field, value in orc_raw_dict.items():
             setattr(orcamento, field, value)
+        orcamento.content_hash = content_hash
 
         orcamento.save()
 
@@ -459,20 +579,11 @@ class OrcamentoManager(models.Manager):
 
     def get_by_raw_indexer(self, indexer):
         info = map(int, indexer.split('.'))
-        info = list(info)
+        raw_key_hash = get_raw_key_hash('.'.join(str(code) for code in info))
 
         try:
             orcamento = self.get_queryset().select_related('execucao').get(
-                cd_ano_execucao=info[0],
-                cd_orgao=info[1],
-                cd_projeto_atividade=info[2],
-                ds_categoria_despesa=info[3],
-                cd_grupo_despesa=info[4],
-                cd_modalidade=info[5],
-                cd_elemento=info[6],
-                cd_fonte=info[7],
-                cd_unidade=info[8],
-                cd_subfuncao=info[9])
+                raw_key_hash=raw_key_hash)
         except self.model.DoesNotExist:
             orcamento = None
 
@@ -527,6 +638,13 @@ class Orcamento(models.Model):
     vl_saldo_reserva = models.FloatField(blank=True, null=True)
     vl_saldo_dotacao = models.FloatField(blank=True, null=True)
     dt_extracao = models.DateTimeField(blank=True, null=True)
+    # hash of the orcamento_raw_load row values (get_content_hash_expression),
+    # so the incremental load finds the rows that changed
+    content_hash = models.CharField(max_length=32, blank=True, null=True)
+    # hash of the raw_indexer, filled on save, so get_by_raw_indexer uses a
+    # single index
+    raw_key_hash = models.CharField(max_length=32, null=True, db_index=True,
+                                    editable=False)
     # fk is filled when the routine that generates the Execucao objects
     # is runned.
     execucao = models.ForeignKey('Execucao', models.SET_NULL, blank=True,
@@ -556,6 +674,13 @@ class Orcamento(models.Model):
             f'{s.ds_categoria_despesa}.{s.cd_grupo_despesa}.{s.cd_modalidade}.'
             f'{s.cd_elemento}.{s.cd_fonte}.{s.cd_unidade}.{s.cd_subfuncao}')
 
+    def save(self, *args, **kwargs):
+        self.raw_key_hash = self.build_raw_key_hash()
+        super().save(*args, **kwargs)
+
+    def build_raw_key_hash(self):
+        return get_raw_key_hash(self.raw_indexer)
+
 
 class EmpenhoManager(models.Manager):
 
@@ -586,22 +711,66 @@ class EmpenhoManager(models.Manager):
         empenho.save()
         return empenho
 
+    def copy_from_raw(self, empenhos_raw, batch_size=5000):
+        """
+        Creates an empenho from each row in the `empenhos_raw` queryset, like
+        create_from_empenho_raw, with one INSERT ... SELECT on postgres and
+        bulk_create in batches on other databases. Returns the number of
+        empenhos created.
+        """
+        fields = [field.name for field in EmpenhoRaw._meta.concrete_fields
+                  if not field.primary_key and field.name != 'dt_data_loaded']
+        now = timezone.now()
+        connection = connections[self.db]
+        content_hash = get_content_hash_expression(
+            get_content_hash_fields(EmpenhoRaw, self.model))
+
+        if connection.vendor != 'postgresql':
+            created = 0
+            batch = []
+            empenhos_raw = empenhos_raw.annotate(content_hash=content_hash)
+            for empenho_raw in empenhos_raw.iterator(chunk_size=batch_size):
+                empenho = self.model(
+                    empenho_raw_id=empenho_raw.id,
+                    content_hash=empenho_raw.content_hash,
+                    **{field: getattr(empenho_raw, field) for field in fields})
+                empenho.raw_key_hash = empenho.build_raw_key_hash()
+                batch.append(empenho)
+                if len(batch) == batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            return created + len(self.bulk_create(batch))
+
+        select = empenhos_raw.order_by() \
+            .annotate(loaded_at=Value(now, output_field=DateTimeField())) \
+            .annotate(key_hash=get_raw_key_hash_expression(
+                EMPENHO_RAW_KEY_FIELDS)) \
+            .annotate(content_hash=content_hash) \
+            .values_list(*fields, 'id', 'loaded_at', 'key_hash',
+                         'content_hash')
+        sql, params = select.query.sql_with_params()
+        opts = self.model._meta
+        columns = [opts.get_field(field).column for field in fields] + [
+            opts.get_field('empenho_raw').column,
+            opts.get_field('dt_data_loaded').column,
+            opts.get_field('raw_key_hash').column,
+            opts.get_field('content_hash').column]
+        quoted = ', '.join(connection.ops.quote_name(col) for col in columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {connection.ops.quote_name(opts.db_table)} '
+                f'({quoted}) {sql}', params)
+            return cursor.rowcount
+
     def get_by_raw_indexer(self, indexer):
-        # TODO: add test for the TextField
         info = indexer.split('.')
+        # codes stored as numbers. the others are text
+        for position in (0, 3, 4, 5):
+            info[position] = str(int(info[position]))
 
         try:
             empenho = self.get_queryset().get(
-                an_empenho=int(info[0]),
-                cd_orgao=info[1],
-                cd_projeto_atividade=info[2],
-                cd_categoria=int(info[3]),
-                cd_grupo=int(info[4]),
-                cd_modalidade=int(info[5]),
-                cd_elemento=info[6],
-                cd_fonte_de_recurso=info[7],
-                cd_unidade=info[8],
-                cd_subfuncao=info[9])
+                raw_key_hash=get_raw_key_hash('.'.join(info)))
         except self.model.DoesNotExist:
             empenho = None
 
@@ -652,6 +821,13 @@ class Empenho(models.Model):
     vl_pago_restos = models.FloatField(blank=True, null=True)
     vl_empenhado = models.FloatField(blank=True, null=True)
     dt_data_loaded = models.DateTimeField(auto_now_add=True, null=True)
+    # hash of the empenhos_raw_load row values (get_content_hash_expression),
+    # so the incremental load finds the rows that changed
+    content_hash = models.CharField(max_length=32, blank=True, null=True)
+    # hash of the raw_indexer, filled on save, so get_by_raw_indexer uses a
+    # single index
+    raw_key_hash = models.CharField(max_length=32, null=True, db_index=True,
+                                    editable=False)
     # instance in orcamento_raw_load table, source of the orcamento data
     empenho_raw = models.ForeignKey('EmpenhoRaw', models.SET_NULL,
                                     null=True)
@@ -684,6 +860,13 @@ class Empenho(models.Model):
             f'{s.cd_elemento}.{s.cd_fonte_de_recurso}.{s.cd_unidade}.'
             f'{s.cd_subfuncao}')
 
+    def save(self, *args, **kwargs):
+        self.raw_key_hash = self.build_raw_key_hash()
+        super().save(*args, **kwargs)
+
+    def build_raw_key_hash(self):
+        return get_raw_key_hash(self.raw_indexer)
+
 
 class OrcamentoRaw(models.Model):
     """SME raw_orcamento table replica"""
@@ -735,7 +918,7 @@ class OrcamentoRaw(models.Model):
     vl_saldo_reserva = models.FloatField(blank=True, null=True)
     vl_saldo_dotacao = models.FloatField(blank=True, null=True)
     dt_extracao = models.DateTimeField(blank=True, null=True)
-    dt_data_loaded = models.DateTimeField(auto_now_add=True)
+    dt_data_loaded = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         db_table = 'orcamento_raw_load'
@@ -795,7 +978,7 @@ class EmpenhoRaw(models.Model):
     vl_pago = models.FloatField(blank=True, null=True)
     vl_pago_restos = models.FloatField(blank=True, null=True)
     vl_empenhado = models.FloatField(blank=True, null=True)
-    dt_data_loaded = models.DateTimeField(auto_now_add=True)
+    dt_data_loaded = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         db_table = 'empenhos_raw_load'
@@ -846,6 +1029,34 @@ class MinimoLegal(models.Model):
         unique_together = ('year', 'projeto_id')
 
 
+class RawLoadWatermarkManager(models.Manager):
+
+    def get_watermark(self, source):
+        return self.filter(source=source) \
+            .values_list('dt_data_loaded', flat=True).first()
+
+    def set_watermark(self, source, dt_data_loaded):
+        watermark, _ = self.update_or_create(
+            source=source, defaults={'dt_data_loaded': dt_data_loaded})
+        return watermark
+
+
+class RawLoadWatermark(models.Model):
+    """
+    Newest dt_data_loaded of a raw table (`source`) already loaded by the
+    watermark load of the execucoes. Only the rows loaded after it are read
+    in the next one.
+    """
+    source = models.CharField(max_length=50, unique=True)
+    dt_data_loaded = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RawLoadWatermarkManager()
+
+    def __str__(self):
+        return f'{self.source}: {self.dt_data_loaded}'
+
+
 # TODO: add test for the NaN verification
 def filter_nan(value):
     if (type(value) == float or type(value) == Decimal) and math.isnan(value):
@@ -1,10 +1,15 @@
+import multiprocessing
+import operator
 import os
-import zipfile
 
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
+from functools import reduce
 
 from django.core.management import call_command
-from django.db.models import Sum
+from django.db import connections, transaction
+from django.db.models import Max, Q, Sum
 from django.utils import timezone
 
 from budget_execution import constants
@@ -14,11 +19,30 @@ from budget_execution.constants import (
     ORCAMENTO_EMPENHOS_RAW_DUMP_FILENAME)
 from budget_execution.models import (
     Execucao, ExecucaoTemp, Orcamento, OrcamentoRaw, Orgao,
-    Empenho, EmpenhoRaw, MinimoLegal, ProjetoAtividade)
+    Empenho, EmpenhoRaw, MinimoLegal, ProjetoAtividade, RawLoadWatermark,
+    get_content_hash_expression, get_content_hash_fields)
 from from_to_handler.models import (DotacaoFromTo, FonteDeRecursoFromTo,
                                     SubelementoFromTo, GNDFromTo)
+from global_app.dumps import load_fixture_zip
+from global_app.etl_metrics import etl_stage, record_rows
 
 
+def get_years_to_be_loaded(load_everything=False):
+    """
+    Years loaded from the raw tables: the current one or, with
+    load_everything, every year after 2017 in them.
+    """
+    if not load_everything:
+        return [timezone.now().year]
+
+    orcamento_years = OrcamentoRaw.objects.filter(cd_ano_execucao__gt=2017) \
+        .values_list('cd_ano_execucao', flat=True).distinct()
+    empenho_years = EmpenhoRaw.objects.filter(an_empenho__gt=2017) \
+        .values_list('an_empenho', flat=True).distinct()
+    return sorted(set(orcamento_years) | set(empenho_years))
+
+
+@etl_stage
 def erase_data_to_be_updated(load_everything=False):
     if not load_everything:
         current_year = timezone.now().year
@@ -32,6 +56,7 @@ def erase_data_to_be_updated(load_everything=False):
     ExecucaoTemp.objects.all().delete()
 
 
+@etl_stage
 def load_2003_2017_execucoes_from_json(path="data/2003_2017_everything.json"):
     if (Execucao.objects.count() or Orcamento.objects.count()
             or Orgao.objects.count() or ProjetoAtividade.objects.count()):
@@ -42,14 +67,20 @@ def load_2003_2017_execucoes_from_json(path="data/2003_2017_everything.json"):
             must be empty
             """)
     call_command('loaddata', path)
+    # loaddata doesn't call save, which fills the indexers
+    Execucao.objects.fill_missing_indexers()
 
 
-def load_data_from_orcamento_raw(load_everything=False):
+@etl_stage
+def load_data_from_orcamento_raw(load_everything=False, year=None):
     """
     The load_everything arg means everything after 2017, because data until
-    2017 is loaded via json.
+    2017 is loaded via json. With `year`, only that year is loaded.
     """
-    if not load_everything:
+    if year:
+        print(f"Loading {year} data from orcamento_raw_load")
+        orcamentos_raw = OrcamentoRaw.objects.filter(cd_ano_execucao=year)
+    elif not load_everything:
         print("Loading current year data from orcamento_raw_load")
         orcamentos_raw = OrcamentoRaw.objects.filter(
             cd_ano_execucao=timezone.now().year)
@@ -57,37 +88,280 @@ def load_data_from_orcamento_raw(load_everything=False):
         print("Loading everything newer than 2017 from orcamento_raw_load")
         orcamentos_raw = OrcamentoRaw.objects.filter(cd_ano_execucao__gt=2017)
 
+    # hashed like by sync_from_raw, so the next incremental load finds them
+    orcamentos_raw = orcamentos_raw.annotate(
+        content_hash=get_content_hash_expression(
+            get_content_hash_fields(OrcamentoRaw, Orcamento)))
     orcamentos = []
     for orc_raw in orcamentos_raw:
         orcamentos.append(
-            Orcamento.objects.create_or_update_orcamento_from_raw(orc_raw))
+            Orcamento.objects.create_or_update_orcamento_from_raw(
+                orc_raw, content_hash=orc_raw.content_hash))
 
     return len(orcamentos)
 
 
-def load_data_from_empenhos_raw(load_everything=False):
+@etl_stage
+def load_data_from_empenhos_raw(load_everything=False, year=None):
     """
     The load_everything arg means everything after 2017, because data until
-    2017 is loaded via json.
+    2017 is loaded via json. With `year`, only that year is loaded.
     """
-    if not load_everything:
+    if year:
+        print(f"Loading {year} data from empenhos_raw_load")
+        years = [year]
+    elif not load_everything:
         print("Loading current year data from empenhos_raw_load")
-        empenhos_raw = EmpenhoRaw.objects.filter(
-            an_empenho=timezone.now().year)
+        years = [timezone.now().year]
     else:
         print("Loading everything newer than 2017 from empenhos_raw_load")
-        empenhos_raw = EmpenhoRaw.objects.filter(an_empenho__gt=2017)
+        years = EmpenhoRaw.objects.filter(an_empenho__gt=2017) \
+            .order_by('an_empenho') \
+            .values_list('an_empenho', flat=True).distinct()
+
+    # one INSERT ... SELECT per year
+    created = 0
+    for empenhos_year in years:
+        created += Empenho.objects.copy_from_raw(
+            EmpenhoRaw.objects.filter(an_empenho=empenhos_year))
+
+    return created
+
+
+# fields of the loaded tables forming the indexer of the execucoes generated
+# from their rows, in the order of ExecucaoTemp.objects.filter_by_indexer
+EXECUCAO_INDEXER_FIELDS = {
+    Orcamento: ['cd_ano_execucao', 'cd_orgao', 'cd_projeto_atividade',
+                'ds_categoria_despesa', 'cd_grupo_despesa', 'cd_modalidade',
+                'cd_elemento', 'cd_fonte'],
+    Empenho: ['an_empenho', 'cd_orgao', 'cd_projeto_atividade',
+              'cd_categoria', 'cd_grupo', 'cd_modalidade', 'cd_elemento',
+              'cd_fonte_de_recurso'],
+}
+SYNC_BATCH_SIZE = 1000
+
+
+def get_execucao_indexer(values):
+    """Indexer of the execucao generated from the row values, if any"""
+    try:
+        indexer = tuple(int(value) for value in values)
+    except (TypeError, ValueError):
+        # rows without some code don't generate execucoes
+        return None
+    # the orgao is the second field
+    return indexer if indexer[1] == SME_ORGAO_ID else None
 
-    empenhos = []
-    for emp_raw in empenhos_raw:
-        empenhos.append(
-            Empenho.objects.create_from_empenho_raw(emp_raw))
 
-    return len(empenhos)
+@etl_stage
+def sync_from_raw(raw_queryset, queryset, raw_fk=None):
+    """
+    Hash-diffs the raw rows against the rows loaded from them (`queryset`),
+    creating the new or changed ones and deleting the ones that are gone, in
+    bulk. Rows are matched by the hash of their values, so a changed row is
+    deleted and created again. Returns the indexers of the execucoes to be
+    generated again: the ones of the created and deleted rows and of the rows
+    not imported to ExecucaoTemp yet.
+    """
+    model = queryset.model
+    fields = get_content_hash_fields(raw_queryset.model, model)
+    indexer_fields = EXECUCAO_INDEXER_FIELDS[model]
+
+    existing = defaultdict(list)
+    rows = queryset.values_list(
+        'id', 'content_hash', 'execucao_temp_id', *indexer_fields)
+    for id_, content_hash, execucao_temp_id, *indexer in rows.iterator():
+        existing[content_hash].append((id_, execucao_temp_id, indexer))
+
+    indexers = set()
+    to_create = []
+    raw_rows = raw_queryset.annotate(
+        content_hash=get_content_hash_expression(fields))
+    for raw in raw_rows.values('id', 'content_hash', *fields).iterator():
+        content_hash = raw['content_hash']
+        if existing[content_hash]:
+            _, execucao_temp_id, indexer = existing[content_hash].pop()
+            if execucao_temp_id is None:
+                indexers.add(get_execucao_indexer(indexer))
+            continue
+
+        obj = model(content_hash=content_hash,
+                    **{field: raw[field] for field in fields})
+        obj.raw_key_hash = obj.build_raw_key_hash()
+        if raw_fk:
+            setattr(obj, f'{raw_fk}_id', raw['id'])
+        to_create.append(obj)
+        indexers.add(get_execucao_indexer(
+            raw[field] for field in indexer_fields))
+
+    to_delete = []
+    for rows in existing.values():
+        for id_, _, indexer in rows:
+            to_delete.append(id_)
+            indexers.add(get_execucao_indexer(indexer))
+
+    with transaction.atomic():
+        for i in range(0, len(to_delete), SYNC_BATCH_SIZE):
+            model.objects.filter(
+                id__in=to_delete[i:i + SYNC_BATCH_SIZE]).delete()
+        model.objects.bulk_create(to_create, batch_size=SYNC_BATCH_SIZE)
+
+    indexers.discard(None)
+    print(f'{model.__name__}: {len(to_create)} rows created and '
+          f'{len(to_delete)} deleted')
+    record_rows(rows_out=len(to_create) + len(to_delete))
+    return indexers
+
+
+def get_indexers_filter(indexers):
+    """Filter of the execucoes (or execucoes temp) with the `indexers`"""
+    if not indexers:
+        return Q(pk__in=[])
+
+    return reduce(operator.or_, (
+        Q(indexer__startswith='.'.join(str(code) for code in indexer) + '.')
+        for indexer in indexers))
+
+
+@etl_stage
+def invalidate_execucoes_temp(indexers):
+    """
+    Deletes the ExecucaoTemp rows with the `indexers`. Their orcamentos and
+    empenhos lose the execucao_temp, so they are imported again.
+    """
+    indexers = list(indexers)
+    deleted = 0
+    for i in range(0, len(indexers), SYNC_BATCH_SIZE):
+        indexers_filter = get_indexers_filter(
+            indexers[i:i + SYNC_BATCH_SIZE])
+        deleted += ExecucaoTemp.objects.filter(indexers_filter).delete()[1] \
+            .get(ExecucaoTemp._meta.label, 0)
+    return deleted
 
 
-def import_orcamentos(load_everything=False):
-    if not load_everything:
+def load_changes_from_raw(years):
+    """
+    Incremental alternative to erase_data_to_be_updated and the
+    load_data_from_*_raw functions: only the orcamentos and empenhos that
+    changed in the raw tables are written and only the ExecucaoTemp rows
+    generated from them are deleted. Returns the indexers to be imported and
+    promoted again.
+    """
+    indexers = set()
+    for year in years:
+        print(f"Loading {year} changes from orcamento_raw_load")
+        indexers |= sync_from_raw(
+            OrcamentoRaw.objects.filter(cd_ano_execucao=year),
+            Orcamento.objects.filter(cd_ano_execucao=year))
+        print(f"Loading {year} changes from empenhos_raw_load")
+        indexers |= sync_from_raw(
+            EmpenhoRaw.objects.filter(an_empenho=year),
+            Empenho.objects.filter(an_empenho=year), raw_fk='empenho_raw')
+
+    invalidate_execucoes_temp(indexers)
+    return indexers
+
+
+# raw tables read by the watermark load, with the tables loaded from them
+# and the field of these pointing to the raw rows
+RAW_SOURCES = [
+    (OrcamentoRaw, Orcamento, None),
+    (EmpenhoRaw, Empenho, 'empenho_raw'),
+]
+
+
+def get_rows_filter(fields, keys):
+    """Filter of the rows with the values of `fields` in `keys`"""
+    return reduce(operator.or_, (Q(**dict(zip(fields, key))) for key in keys))
+
+
+def load_new_rows_from_raw():
+    """
+    Watermark alternative to load_changes_from_raw: only the raw rows loaded
+    after the watermark of their table are read, and only the orcamentos and
+    empenhos with their (year, indexer) keys are synced, as rows of a key
+    may have been deleted or replaced by the new ones. Without a watermark
+    everything newer than 2017 is synced.
+
+    Returns the indexers to be imported and promoted again and the new
+    watermarks, to be saved with save_watermarks once they are promoted.
+    """
+    indexers = set()
+    watermarks = {}
+    for raw_model, model, raw_fk in RAW_SOURCES:
+        source = raw_model._meta.db_table
+        key_fields = EXECUCAO_INDEXER_FIELDS[model]
+        year_field = key_fields[0]
+
+        raw_rows = raw_model.objects.all()
+        watermark = RawLoadWatermark.objects.get_watermark(source)
+        if watermark:
+            raw_rows = raw_rows.filter(dt_data_loaded__gt=watermark)
+        new_watermark = raw_rows.aggregate(
+            newest=Max('dt_data_loaded'))['newest']
+        if new_watermark is None:
+            print(f"No new rows in {source}")
+            continue
+        # rows loaded while this runs are left for the next load
+        raw_rows = raw_rows.filter(dt_data_loaded__lte=new_watermark)
+        watermarks[source] = new_watermark
+
+        if not watermark:
+            print(f"Loading everything newer than 2017 from {source}")
+            indexers |= sync_from_raw(
+                raw_model.objects.filter(**{f'{year_field}__gt': 2017}),
+                model.objects.filter(**{f'{year_field}__gt': 2017}), raw_fk)
+            continue
+
+        keys = list(raw_rows.filter(**{f'{year_field}__gt': 2017})
+                    .order_by().values_list(*key_fields).distinct())
+        print(f"Loading {len(keys)} keys with new rows from {source}")
+        for i in range(0, len(keys), SYNC_BATCH_SIZE):
+            keys_filter = get_rows_filter(
+                key_fields, keys[i:i + SYNC_BATCH_SIZE])
+            indexers |= sync_from_raw(
+                raw_model.objects.filter(keys_filter),
+                model.objects.filter(keys_filter), raw_fk)
+
+    # the other loads promote and delete every ExecucaoTemp, so the rows
+    # they left out of it are imported again. Otherwise the totals of the
+    # years in ExecucaoTemp wouldn't match the ones in Execucao.
+    indexers |= get_pending_indexers()
+
+    invalidate_execucoes_temp(indexers)
+    return indexers, watermarks
+
+
+def get_pending_indexers():
+    """
+    Indexers of the SME orcamentos and empenhos newer than 2017 that aren't
+    imported to ExecucaoTemp
+    """
+    indexers = set()
+    for _, model, _ in RAW_SOURCES:
+        fields = EXECUCAO_INDEXER_FIELDS[model]
+        rows = model.objects.filter(
+            **{f'{fields[0]}__gt': 2017},
+            execucao_temp__isnull=True, cd_orgao=SME_ORGAO_ID,
+        ).order_by().values_list(*fields).distinct()
+        indexers |= {get_execucao_indexer(row) for row in rows}
+    indexers.discard(None)
+    return indexers
+
+
+def save_watermarks(watermarks):
+    for source, dt_data_loaded in watermarks.items():
+        RawLoadWatermark.objects.set_watermark(source, dt_data_loaded)
+
+
+@etl_stage
+def import_orcamentos(load_everything=False, year=None):
+    if year:
+        print(f"Importing orcamentos from {year}")
+        orcamentos = Orcamento.objects.filter(
+            cd_ano_execucao=year,
+            execucao_temp__isnull=True, cd_orgao=SME_ORGAO_ID,
+        )
+    elif not load_everything:
         print("Importing orcamentos from current year")
         orcamentos = Orcamento.objects.filter(
             cd_ano_execucao=timezone.now().year,
@@ -100,17 +374,30 @@ def import_orcamentos(load_everything=False):
             execucao_temp__isnull=True, cd_orgao=SME_ORGAO_ID,
         )
 
+    read = imported = 0
     for orcamento in orcamentos:
+        read += 1
         execucao = ExecucaoTemp.objects.get_or_create_by_orcamento(orcamento)
         if isinstance(execucao, ExecucaoTemp):
             orcamento.execucao_temp = execucao
             orcamento.save()
+            imported += 1
         else:
             print(execucao['error'])
 
+    record_rows(rows_in=read)
+    return imported
 
-def import_empenhos(load_everything=False):
-    if not load_everything:
+
+@etl_stage
+def import_empenhos(load_everything=False, year=None):
+    if year:
+        print(f"Importing empenhos from {year}")
+        empenhos = Empenho.objects.filter(
+            an_empenho=year,
+            execucao_temp__isnull=True, cd_orgao=SME_ORGAO_ID,
+        )
+    elif not load_everything:
         print("Importing empenhos from current year")
         empenhos = Empenho.objects.filter(
             an_empenho=timezone.now().year,
@@ -123,15 +410,72 @@ def import_empenhos(load_everything=False):
             execucao_temp__isnull=True, cd_orgao=SME_ORGAO_ID,
         )
 
+    read = imported = 0
     for empenho in empenhos:
+        read += 1
         execucao = ExecucaoTemp.objects.update_by_empenho(empenho)
 
         if execucao:
             empenho.execucao_temp = execucao
             empenho.save()
+            imported += 1
+
+    record_rows(rows_in=read)
+    return imported
 
 
-def update_execucao_table_from_execucao_temp(load_everything=False):
+def import_year(year):
+    """
+    Loads the year from the raw tables and imports it to ExecucaoTemp. Years
+    don't share ExecucaoTemp rows, as the indexer starts with the year, so
+    they can be imported at the same time.
+    """
+    load_data_from_orcamento_raw(year=year)
+    load_data_from_empenhos_raw(year=year)
+    return {
+        'year': year,
+        'orcamentos': import_orcamentos(year=year),
+        'empenhos': import_empenhos(year=year),
+    }
+
+
+def _import_year_in_process(year):
+    try:
+        return import_year(year)
+    finally:
+        connections.close_all()
+
+
+@etl_stage
+def import_years_in_processes(years, processes=None):
+    """
+    Imports each year in its own process, with its own database connection,
+    using up to `processes` processes (all the cores by default). The
+    promotion to Execucao must run after it.
+    """
+    processes = min(processes or os.cpu_count(), len(years))
+    if processes <= 1:
+        results = [import_year(year) for year in years]
+    else:
+        # the connections can't be shared with the forked processes
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(processes, mp_context=context) as executor:
+            results = list(executor.map(_import_year_in_process, years))
+
+    for result in results:
+        print(f"{result['year']}: {result['orcamentos']} orcamentos and "
+              f"{result['empenhos']} empenhos imported")
+    return sum(result['orcamentos'] + result['empenhos'] for result in results)
+
+
+@etl_stage
+def update_execucao_table_from_execucao_temp(load_everything=False,
+                                             indexers=None):
+    """
+    With `indexers` (from load_changes_from_raw), only the execucoes with
+    them are replaced and ExecucaoTemp is kept for the next incremental load.
+    """
     if not load_everything:
         execucoes = Execucao.objects.filter(
             year__year=timezone.now().year,
@@ -151,18 +495,39 @@ def update_execucao_table_from_execucao_temp(load_everything=False):
 
     verify_total_sum(execucoes, execucoes_temp)
 
+    if indexers is not None:
+        indexers = list(indexers)
+        promoted = 0
+        for i in range(0, len(indexers), SYNC_BATCH_SIZE):
+            indexers_filter = get_indexers_filter(
+                indexers[i:i + SYNC_BATCH_SIZE])
+            execucoes.filter(indexers_filter).delete()
+            for exec_temp in execucoes_temp.filter(indexers_filter):
+                create_execucao_from_temp(exec_temp)
+                promoted += 1
+        return promoted
+
     execucoes.delete()
 
+    promoted = 0
     for exec_temp in execucoes_temp:
-        execucao = Execucao()
+        create_execucao_from_temp(exec_temp)
+        exec_temp.delete()
+        promoted += 1
 
-        for field in exec_temp._meta.fields:
-            if field.primary_key is True:
-                continue
-            setattr(execucao, field.name, getattr(exec_temp, field.name))
+    return promoted
 
-        execucao.save()
-        exec_temp.delete()
+
+def create_execucao_from_temp(exec_temp):
+    execucao = Execucao()
+
+    for field in exec_temp._meta.fields:
+        if field.primary_key is True:
+            continue
+        setattr(execucao, field.name, getattr(exec_temp, field.name))
+
+    execucao.save()
+    return execucao
 
 
 def verify_total_sum(execucoes, execucoes_temp):
@@ -206,17 +571,23 @@ def verify_total_sum(execucoes, execucoes_temp):
             raise exceptions.EmpenhadoDifferenceOverLimitException
 
 
+@etl_stage
 def import_minimo_legal():
     mls = MinimoLegal.objects.filter(execucao__isnull=True)
 
+    imported = 0
     for ml in mls:
         execucao = Execucao.objects.create_by_minimo_legal(ml)
 
         if execucao:
             ml.execucao = execucao
             ml.save()
+            imported += 1
+
+    return imported
 
 
+@etl_stage
 def apply_fromto():
     DotacaoFromTo.apply_all()
     FonteDeRecursoFromTo.apply_all()
@@ -224,17 +595,14 @@ def apply_fromto():
     GNDFromTo.apply_all()
 
 
-def populate_orcamento_empenhos_raw_load_with_dump():
-    filepath = f'{ORCAMENTO_EMPENHOS_RAW_DUMP_DIR_PATH}{ORCAMENTO_EMPENHOS_RAW_DUMP_FILENAME}'  # noqa
-    with zipfile.ZipFile(filepath, "r") as zip_ref:
-        zip_ref.extractall(ORCAMENTO_EMPENHOS_RAW_DUMP_DIR_PATH)
+@etl_stage
+def update_execucoes_metadata():
+    Execucao.objects.update_metadata()
 
-    json_filename = zip_ref.filelist[0].filename
-    json_filepath = f'{ORCAMENTO_EMPENHOS_RAW_DUMP_DIR_PATH}{json_filename}'
 
+def populate_orcamento_empenhos_raw_load_with_dump():
+    filepath = f'{ORCAMENTO_EMPENHOS_RAW_DUMP_DIR_PATH}{ORCAMENTO_EMPENHOS_RAW_DUMP_FILENAME}'  # noqa
     try:
-        call_command('loaddata', json_filepath)
+        load_fixture_zip(filepath)
     except Exception as e:
         print(e)
-        os.remove(json_filepath)
-    os.remove(json_filepath)
@@ -0,0 +1,64 @@
+"""
+Celery tasks of the budget ETL. `build_execucoes_pipeline` returns the steps
+of the generate_execucoes script as a canvas: each year is loaded from the
+raw tables and imported to ExecucaoTemp by its own task, in parallel. The
+join task then imports the minimo legal, whose orcamentos were just loaded
+again, and the next one verifies the total sums and promotes every year at
+once.
+"""
+from celery import chain, chord, shared_task
+
+from budget_execution import services
+from global_app.tasks import prerender_pages
+from mosaico.services import generate_download_files
+
+
+@shared_task
+def erase_data_to_be_updated(load_everything=False):
+    services.erase_data_to_be_updated(load_everything)
+
+
+@shared_task
+def import_minimo_legal():
+    return services.import_minimo_legal()
+
+
+@shared_task
+def import_year(year):
+    return services.import_year(year)
+
+
+@shared_task
+def update_execucao_table_from_execucao_temp(load_everything=False):
+    return services.update_execucao_table_from_execucao_temp(load_everything)
+
+
+@shared_task
+def apply_fromto():
+    services.apply_fromto()
+
+
+@shared_task
+def update_execucoes_metadata():
+    services.update_execucoes_metadata()
+
+
+@shared_task
+def generate_mosaico_download_files():
+    generate_download_files()
+
+
+def build_execucoes_pipeline(load_everything=False):
+    years = services.get_years_to_be_loaded(load_everything)
+    imports = [import_year.si(year) for year in years]
+
+    return chain(
+        erase_data_to_be_updated.si(load_everything),
+        chord(imports, import_minimo_legal.si()),
+        update_execucao_table_from_execucao_temp.si(
+            load_everything=load_everything),
+        apply_fromto.si(),
+        update_execucoes_metadata.si(),
+        generate_mosaico_download_files.si(),
+        prerender_pages.si('mosaico', 'geologia'),
+    )
@@ -0,0 +1,73 @@
+import pytest
+
+from model_mommy import mommy
+
+from budget_execution import labels
+from budget_execution.models import Grupo, Programa, Subgrupo
+from global_app import metadata
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(settings):
+    settings.DATASET_METADATA_CACHE_TIMEOUT = 60
+    metadata.clear_cache()
+    labels.clear_cache()
+    yield
+    metadata.clear_cache()
+    labels.clear_cache()
+
+
+def update_metadata():
+    metadata.update_dataset_metadata(
+        metadata.EXECUCOES_DATASET, dt_updated=None, years=[], row_count=0)
+
+
+class TestLabels:
+
+    def test_get_label(self):
+        update_metadata()
+        mommy.make(Programa, id=1, desc='Programa 1')
+        mommy.make(Programa, id=2, desc='Programa 2')
+
+        assert 'Programa 1' == labels.get_label(Programa, 1)
+        assert 'Programa 2' == labels.get_label(Programa, 2)
+        assert labels.get_label(Programa, None) is None
+
+    def test_labels_are_kept_until_the_metadata_is_updated(
+            self, django_assert_num_queries):
+        update_metadata()
+        mommy.make(Programa, id=1, desc='Programa')
+        labels.get_label(Programa, 1)
+        Programa.objects.filter(id=1).update(desc='Novo programa')
+
+        with django_assert_num_queries(0):
+            assert 'Programa' == labels.get_label(Programa, 1)
+
+        update_metadata()
+        assert 'Novo programa' == labels.get_label(Programa, 1)
+
+    def test_missing_id_loads_the_labels_again(self):
+        update_metadata()
+        mommy.make(Programa, id=1)
+        labels.get_label(Programa, 1)
+        mommy.make(Programa, id=2, desc='Programa 2')
+
+        assert 'Programa 2' == labels.get_label(Programa, 2)
+        assert labels.get_label(Programa, 3) is None
+
+    def test_nothing_is_cached_without_metadata(self):
+        mommy.make(Programa, id=1, desc='Programa')
+        assert 'Programa' == labels.get_label(Programa, 1)
+
+        Programa.objects.filter(id=1).update(desc='Novo programa')
+        assert 'Novo programa' == labels.get_label(Programa, 1)
+
+    def test_get_grupo_id(self):
+        update_metadata()
+        subgrupo = mommy.make(Subgrupo, grupo=mommy.make(Grupo, id=3))
+
+        assert 3 == labels.get_grupo_id(subgrupo.id)
+        assert labels.get_grupo_id(None) is None
@@ -1,9 +1,11 @@
 from datetime import date
 from decimal import Decimal
 from itertools import cycle
+from unittest.mock import patch
 
 import pytest
 
+from django.db import connection
 from model_mommy import mommy
 
 from budget_execution.constants import SME_ORGAO_ID
@@ -27,6 +29,7 @@ from budget_execution.models import (
     Subgrupo,
     Subelemento,
     MinimoLegal,
+    get_raw_key_hash,
 )
 
 
@@ -97,6 +100,13 @@ class TestExecucaoManagerQuerySetMethods:
         for e in expected:
             assert e in ret
 
+        # codes after the fonte, like the subelemento of empenhos, are
+        # ignored
+        ret = Execucao.objects.filter_by_indexer(
+            '2018.16.1011.3.3.09.10.10.1')
+
+        assert set(expected) == set(ret)
+
     def test_filter_by_subelemento_fromto_code(self):
         expected = mommy.make(
             Execucao,
@@ -125,6 +135,43 @@ class TestExecucaoManagerQuerySetMethods:
             assert e in ret
 
 
+@pytest.mark.django_db
+class TestExecucaoManagerMetadata:
+
+    def test_update_metadata(self):
+        mommy.make(Execucao, year=date(2018, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=False, _quantity=2)
+        mommy.make(Execucao, year=date(2019, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=False)
+        # not counted as an available year
+        mommy.make(Execucao, year=date(2020, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=True)
+
+        metadata = Execucao.objects.update_metadata()
+
+        assert [2018, 2019] == metadata.years
+        assert 2019 == metadata.newest_year
+        assert 4 == metadata.row_count
+        assert Execucao.objects.latest('dt_updated').dt_updated \
+            == metadata.dt_updated
+
+    def test_reads_newest_year_from_metadata(self):
+        mommy.make(Execucao, year=date(2018, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=False)
+        Execucao.objects.update_metadata()
+
+        # not seen until the metadata is updated again
+        mommy.make(Execucao, year=date(2019, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=False)
+
+        assert 2018 == Execucao.objects.get_newest_year()
+
+    def test_get_newest_year_without_metadata(self):
+        mommy.make(Execucao, year=date(2018, 1, 1), orgao__id=SME_ORGAO_ID,
+                   is_minimo_legal=False)
+        assert 2018 == Execucao.objects.get_newest_year()
+
+
 @pytest.mark.django_db
 class TestExecucaoManagerGetOrCreateByOrcamento:
 
@@ -501,6 +548,29 @@ class TestExecucaoModel:
 
         assert '2018.16.4364.3.1.90.11.0.2' == execucao.indexer
 
+    def test_indexer_is_updated_on_save(self):
+        execucao = mommy.make(
+            Execucao, year=date(2018, 1, 1), orgao__id=16, projeto__id=4364,
+            categoria__id=3, gnd__id=1, modalidade__id=90, elemento__id=11,
+            fonte__id=0, subelemento=None)
+        assert '2018.16.4364.3.1.90.11.0.None' == \
+            Execucao.objects.get().indexer
+
+        execucao.subelemento = mommy.make(Subelemento, id=2)
+        execucao.save()
+
+        assert '2018.16.4364.3.1.90.11.0.2' == Execucao.objects.get().indexer
+
+    def test_fill_missing_indexers(self):
+        execucoes = mommy.make(ExecucaoTemp, _quantity=3)
+        ExecucaoTemp.objects.update(indexer=None)
+
+        ExecucaoTemp.objects.fill_missing_indexers(batch_size=2)
+
+        for execucao in execucoes:
+            assert execucao.indexer == \
+                ExecucaoTemp.objects.get(pk=execucao.pk).indexer
+
 
 @pytest.mark.django_db
 class TestSubgrupoQueryset:
@@ -758,6 +828,23 @@ class TestOrcamentoModel:
 
         assert '2018.16.4364.3.1.90.11.0.2222.311' == orcamento.raw_indexer
 
+    def test_get_by_raw_indexer(self):
+        orcamento = mommy.make(
+            Orcamento, cd_ano_execucao=2018, cd_orgao=16,
+            cd_projeto_atividade=4364, ds_categoria_despesa=3,
+            cd_grupo_despesa=1, cd_modalidade=90, cd_elemento=11, cd_fonte=0,
+            cd_unidade=2222, cd_subfuncao=311,
+            execucao=None, execucao_temp=None, _fill_optional=True,
+        )
+        mommy.make(Orcamento, cd_ano_execucao=2018, _fill_optional=True)
+
+        assert get_raw_key_hash('2018.16.4364.3.1.90.11.0.2222.311') == \
+            Orcamento.objects.get(pk=orcamento.pk).raw_key_hash
+        assert orcamento == Orcamento.objects.get_by_raw_indexer(
+            '2018.16.4364.3.1.90.11.00.2222.311')
+        assert Orcamento.objects.get_by_raw_indexer(
+            '2018.16.4364.3.1.90.11.1.2222.311') is None
+
 
 @pytest.mark.django_db
 class TestEmpenhoManagerCreateFromEmpenhoRaw:
@@ -829,6 +916,47 @@ class TestEmpenhoManagerCreateFromEmpenhoRaw:
         self.assert_fields(emp, empenho_raw)
 
 
+@pytest.mark.django_db
+class TestEmpenhoManagerCopyFromRaw:
+
+    assert_fields = TestEmpenhoManagerCreateFromEmpenhoRaw.assert_fields
+    empenho_raw = TestEmpenhoManagerCreateFromEmpenhoRaw.empenho_raw
+
+    @pytest.fixture
+    def empenhos_raw(self, empenho_raw):
+        mommy.make(EmpenhoRaw, an_empenho=2019, _quantity=2)
+        return list(EmpenhoRaw.objects.order_by('id'))
+
+    def test_copy_from_raw(self, empenhos_raw):
+        created = Empenho.objects.copy_from_raw(EmpenhoRaw.objects.all())
+
+        assert 3 == created
+        for emp_raw in empenhos_raw:
+            emp = Empenho.objects.get(empenho_raw=emp_raw)
+            assert emp.dt_data_loaded is not None
+            assert emp.build_raw_key_hash() == emp.raw_key_hash
+            self.assert_fields(emp, emp_raw)
+
+    def test_copy_from_raw_filtered(self, empenhos_raw):
+        created = Empenho.objects.copy_from_raw(
+            EmpenhoRaw.objects.filter(an_empenho=2019))
+
+        assert 2 == created
+        assert {2019} == set(Empenho.objects.values_list(
+            'an_empenho', flat=True))
+
+    def test_copy_from_raw_without_postgres(self, empenhos_raw):
+        with patch.object(connection, 'vendor', 'sqlite'):
+            created = Empenho.objects.copy_from_raw(
+                EmpenhoRaw.objects.all(), batch_size=2)
+
+        assert 3 == created
+        for emp_raw in empenhos_raw:
+            emp = Empenho.objects.get(empenho_raw=emp_raw)
+            assert emp.build_raw_key_hash() == emp.raw_key_hash
+            self.assert_fields(emp, emp_raw)
+
+
 @pytest.mark.django_db
 class TestEmpenhoModel:
 
@@ -842,6 +970,21 @@ class TestEmpenhoModel:
 
         assert '2018.16.4364.3.1.90.11.0.1' == empenho.indexer
 
+    def test_get_by_raw_indexer(self):
+        empenho = mommy.make(
+            Empenho, an_empenho=2018, cd_orgao='16',
+            cd_projeto_atividade='4364', cd_categoria=3, cd_grupo=1,
+            cd_modalidade=90, cd_elemento='11', cd_fonte_de_recurso='00',
+            cd_unidade='2222', cd_subfuncao='311', execucao=None,
+            execucao_temp=None, _fill_optional=True,
+        )
+
+        # text codes are matched as they are
+        assert empenho == Empenho.objects.get_by_raw_indexer(
+            '2018.16.4364.03.1.90.11.00.2222.311')
+        assert Empenho.objects.get_by_raw_indexer(
+            '2018.16.4364.3.1.90.11.0.2222.311') is None
+
 
 @pytest.mark.django_db
 class TestMinimoLegalManagerCreateOrUpdate:
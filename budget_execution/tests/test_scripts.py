@@ -0,0 +1,58 @@
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from model_mommy import mommy
+
+from budget_execution.models import (
+    Execucao, ExecucaoTemp, MinimoLegal, OrcamentoRaw)
+from global_app.synthetic import SyntheticSources, load_sources
+from scripts import (
+    generate_execucoes, load_2003_2017_execucoes_and_generate_new_ones)
+
+
+# the years may be imported by forked processes
+pytestmark = pytest.mark.django_db(transaction=True)
+
+THIS_YEAR = date.today().year
+
+
+@pytest.fixture(autouse=True)
+def downloads_path(tmpdir):
+    with patch('mosaico.services.GENERATED_DOWNLOADS_PATH', str(tmpdir)):
+        yield
+
+
+@pytest.fixture
+def minimo_legal():
+    load_sources(SyntheticSources(years=2, orcamentos=40, empenhos=100,
+                                  contratos=0, sof_empenhos=0, escolas=0))
+    orcamento_raw = OrcamentoRaw.objects.filter(
+        cd_ano_execucao=THIS_YEAR).order_by('id').first()
+    return mommy.make(MinimoLegal, year=date(THIS_YEAR, 1, 1), execucao=None,
+                      projeto_id=orcamento_raw.cd_projeto_atividade,
+                      _fill_optional=True)
+
+
+def assert_minimo_legal_imported(minimo_legal):
+    minimo_legal.refresh_from_db()
+    assert minimo_legal.execucao.is_minimo_legal
+    assert not ExecucaoTemp.objects.exists()
+    assert {THIS_YEAR - 1, THIS_YEAR} == set(Execucao.objects.get_years())
+
+
+@pytest.mark.parametrize('args', [('load_everything',),
+                                  ('parallel', 'load_everything')])
+def test_generate_execucoes_imports_minimo_legal(minimo_legal, args):
+    generate_execucoes.run(*args)
+
+    assert_minimo_legal_imported(minimo_legal)
+
+
+@patch('budget_execution.services.load_2003_2017_execucoes_from_json')
+def test_load_2003_2017_execucoes_imports_minimo_legal(load_json,
+                                                       minimo_legal):
+    load_2003_2017_execucoes_and_generate_new_ones.run()
+
+    assert_minimo_legal_imported(minimo_legal)
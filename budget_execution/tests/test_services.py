@@ -1,11 +1,12 @@
 import pytest
 
-from datetime import date
+from datetime import date, timedelta
 from decimal import Decimal
 from itertools import cycle
 from unittest.mock import patch
 
-from django.db.models import Sum
+from django.db.models import Max, Sum
+from django.utils import timezone
 from freezegun import freeze_time
 from model_mommy import mommy
 
@@ -21,7 +22,9 @@ from budget_execution.models import (
     Empenho,
     EmpenhoRaw,
     MinimoLegal,
+    RawLoadWatermark,
 )
+from global_app.synthetic import SyntheticSources, load_sources
 
 
 @pytest.mark.django_db
@@ -548,3 +551,234 @@ class TestImportMinimoLegal:
         ml2.refresh_from_db()
         assert orcamento2.execucao == execucoes[1]
         assert ml2.execucao == execucoes[1]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestImportYearsInProcesses:
+
+    def get_execucoes_temp(self):
+        return sorted(ExecucaoTemp.objects.values_list(
+            'year', 'projeto_id', 'elemento_id', 'fonte_id',
+            'orcado_atualizado', 'empenhado_liquido'))
+
+    def test_matches_serial_import(self):
+        load_sources(SyntheticSources(
+            years=3, orcamentos=60, empenhos=150, contratos=0,
+            sof_empenhos=0, escolas=0))
+        years = services.get_years_to_be_loaded(load_everything=True)
+
+        imported = services.import_years_in_processes(years, processes=3)
+        execucoes_temp = self.get_execucoes_temp()
+        assert imported
+        assert 3 == len({row[0] for row in execucoes_temp})
+
+        ExecucaoTemp.objects.all().delete()
+        Orcamento.objects.all().delete()
+        Empenho.objects.all().delete()
+        assert imported == services.import_years_in_processes(
+            years, processes=1)
+        assert execucoes_temp == self.get_execucoes_temp()
+
+
+@pytest.mark.django_db
+class TestLoadChangesFromRaw:
+
+    year = date.today().year
+
+    @pytest.fixture(autouse=True)
+    def raw_data(self):
+        load_sources(SyntheticSources(
+            years=1, orcamentos=30, empenhos=80, contratos=0,
+            sof_empenhos=0, escolas=0))
+
+    def load(self):
+        indexers = services.load_changes_from_raw([self.year])
+        services.import_orcamentos(year=self.year)
+        services.import_empenhos(year=self.year)
+        services.update_execucao_table_from_execucao_temp(indexers=indexers)
+        return indexers
+
+    def get_totals(self, queryset):
+        return queryset.aggregate(orcado=Sum('orcado_atualizado'),
+                                  empenhado=Sum('empenhado_liquido'))
+
+    def test_first_load_imports_everything(self):
+        indexers = self.load()
+
+        assert 30 == Orcamento.objects.filter(content_hash__isnull=False) \
+            .count()
+        assert 80 == Empenho.objects.filter(content_hash__isnull=False) \
+            .count()
+        assert indexers == set(Execucao.objects.values_list(
+            'year__year', 'orgao_id', 'projeto_id', 'categoria_id', 'gnd_id',
+            'modalidade_id', 'elemento_id', 'fonte_id'))
+        # ExecucaoTemp is kept for the next load
+        assert self.get_totals(ExecucaoTemp.objects) == \
+            self.get_totals(Execucao.objects)
+
+    def test_load_without_changes(self):
+        self.load()
+        orcamentos_ids = set(Orcamento.objects.values_list('id', flat=True))
+        execucoes_ids = set(Execucao.objects.values_list('id', flat=True))
+
+        assert set() == self.load()
+        assert orcamentos_ids == set(
+            Orcamento.objects.values_list('id', flat=True))
+        assert execucoes_ids == set(
+            Execucao.objects.values_list('id', flat=True))
+
+    def test_load_after_a_full_load(self):
+        services.erase_data_to_be_updated()
+        services.load_data_from_orcamento_raw()
+        services.load_data_from_empenhos_raw()
+        orcamentos_ids = set(Orcamento.objects.values_list('id', flat=True))
+        empenhos_ids = set(Empenho.objects.values_list('id', flat=True))
+
+        self.load()
+
+        # the rows loaded by the full load are found by their hash
+        assert orcamentos_ids == set(
+            Orcamento.objects.values_list('id', flat=True))
+        assert empenhos_ids == set(
+            Empenho.objects.values_list('id', flat=True))
+        assert set() == self.load()
+
+    def test_load_changed_rows(self):
+        self.load()
+        changed = OrcamentoRaw.objects.order_by('id').first()
+        changed.vl_orcado_atualizado += 100
+        changed.save()
+        deleted = EmpenhoRaw.objects.order_by('id').last()
+        deleted.delete()
+        expected = {
+            (self.year, changed.cd_orgao, changed.cd_projeto_atividade,
+             changed.ds_categoria_despesa, changed.cd_grupo_despesa,
+             changed.cd_modalidade, changed.cd_elemento, changed.cd_fonte),
+            (self.year, int(deleted.cd_orgao),
+             int(deleted.cd_projeto_atividade), deleted.cd_categoria,
+             deleted.cd_grupo, deleted.cd_modalidade,
+             int(deleted.cd_elemento), int(deleted.cd_fonte_de_recurso)),
+        }
+        orcamentos_ids = set(Orcamento.objects.values_list('id', flat=True))
+        kept_ids = set(ExecucaoTemp.objects.exclude(
+            services.get_indexers_filter(expected)).values_list(
+                'id', flat=True))
+
+        assert expected == self.load()
+
+        # the changed orcamento is created again
+        assert 1 == len(orcamentos_ids - set(
+            Orcamento.objects.values_list('id', flat=True)))
+        assert 79 == Empenho.objects.count()
+        # only the execucoes temp of the changed indexers are generated again
+        assert kept_ids == set(ExecucaoTemp.objects.exclude(
+            services.get_indexers_filter(expected)).values_list(
+                'id', flat=True))
+        assert self.get_totals(ExecucaoTemp.objects) == \
+            self.get_totals(Execucao.objects)
+
+
+@pytest.mark.django_db
+class TestLoadNewRowsFromRaw:
+
+    year = date.today().year
+
+    @pytest.fixture(autouse=True)
+    def raw_data(self):
+        load_sources(SyntheticSources(
+            years=2, orcamentos=60, empenhos=160, contratos=0,
+            sof_empenhos=0, escolas=0))
+
+    def load(self):
+        indexers, watermarks = services.load_new_rows_from_raw()
+        for year in {indexer[0] for indexer in indexers}:
+            services.import_orcamentos(year=year)
+            services.import_empenhos(year=year)
+        services.update_execucao_table_from_execucao_temp(
+            load_everything=True, indexers=indexers)
+        services.save_watermarks(watermarks)
+        return indexers
+
+    def full_load(self):
+        services.erase_data_to_be_updated(load_everything=True)
+        services.load_data_from_orcamento_raw(load_everything=True)
+        services.load_data_from_empenhos_raw(load_everything=True)
+        services.import_orcamentos(load_everything=True)
+        services.import_empenhos(load_everything=True)
+        services.update_execucao_table_from_execucao_temp(
+            load_everything=True)
+
+    def change_row(self):
+        changed = OrcamentoRaw.objects.filter(
+            cd_ano_execucao=self.year).order_by('id').first()
+        changed.vl_orcado_atualizado += 100
+        changed.save()
+        OrcamentoRaw.objects.filter(id=changed.id).update(
+            dt_data_loaded=timezone.now() + timedelta(minutes=1))
+        return changed
+
+    def get_totals(self, queryset):
+        return queryset.aggregate(orcado=Sum('orcado_atualizado'),
+                                  empenhado=Sum('empenhado_liquido'))
+
+    def test_first_load_imports_everything(self):
+        self.load()
+
+        assert 60 == Orcamento.objects.count()
+        assert 160 == Empenho.objects.count()
+        assert self.get_totals(ExecucaoTemp.objects) == \
+            self.get_totals(Execucao.objects)
+        assert {
+            'orcamento_raw_load': OrcamentoRaw.objects.aggregate(
+                newest=Max('dt_data_loaded'))['newest'],
+            'empenhos_raw_load': EmpenhoRaw.objects.aggregate(
+                newest=Max('dt_data_loaded'))['newest'],
+        } == dict(RawLoadWatermark.objects.values_list(
+            'source', 'dt_data_loaded'))
+
+    def test_load_without_new_rows(self):
+        self.load()
+        # a row deleted without new rows is only seen by the other loads
+        EmpenhoRaw.objects.order_by('id').last().delete()
+
+        assert (set(), {}) == services.load_new_rows_from_raw()
+        assert 160 == Empenho.objects.count()
+
+    def test_load_new_rows(self):
+        self.load()
+        changed = self.change_row()
+        expected = {
+            (self.year, changed.cd_orgao, changed.cd_projeto_atividade,
+             changed.ds_categoria_despesa, changed.cd_grupo_despesa,
+             changed.cd_modalidade, changed.cd_elemento, changed.cd_fonte),
+        }
+        kept_ids = set(ExecucaoTemp.objects.exclude(
+            services.get_indexers_filter(expected)).values_list(
+                'id', flat=True))
+
+        assert expected == self.load()
+
+        assert kept_ids == set(ExecucaoTemp.objects.exclude(
+            services.get_indexers_filter(expected)).values_list(
+                'id', flat=True))
+        assert self.get_totals(ExecucaoTemp.objects) == \
+            self.get_totals(Execucao.objects)
+        assert set() == self.load()
+
+    def test_load_new_rows_after_a_full_load(self):
+        self.load()
+        # the full load promotes and deletes every ExecucaoTemp
+        self.full_load()
+        assert not ExecucaoTemp.objects.exists()
+        changed = self.change_row()
+
+        indexers = self.load()
+
+        assert {self.year - 1, self.year} == {
+            indexer[0] for indexer in indexers}
+        assert self.get_totals(ExecucaoTemp.objects) == \
+            self.get_totals(Execucao.objects)
+        changed.refresh_from_db()
+        assert changed.dt_data_loaded == RawLoadWatermark.objects.get(
+            source='orcamento_raw_load').dt_data_loaded
+        assert set() == self.load()
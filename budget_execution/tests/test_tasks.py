@@ -0,0 +1,99 @@
+import os
+
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from django.db.models import Sum
+from django.test import override_settings
+from django.urls import include, path
+from model_mommy import mommy
+
+from budget_execution import services, tasks
+from budget_execution.models import (
+    Execucao, ExecucaoTemp, MinimoLegal, OrcamentoRaw)
+from global_app.synthetic import SyntheticSources, load_sources
+
+
+pytestmark = pytest.mark.django_db
+
+THIS_YEAR = date.today().year
+
+# the mosaico downloads are only generated while it is routed
+urlpatterns = [path('mosaico/', include('mosaico.urls'))]
+
+
+@pytest.fixture
+def downloads_path(tmpdir):
+    downloads_path = str(tmpdir)
+    with patch('mosaico.services.GENERATED_DOWNLOADS_PATH', downloads_path), \
+            override_settings(ROOT_URLCONF=__name__):
+        yield downloads_path
+
+
+@pytest.fixture
+def raw_data():
+    load_sources(SyntheticSources(years=2, orcamentos=40, empenhos=100,
+                                  contratos=0, sof_empenhos=0, escolas=0))
+
+
+def test_get_years_to_be_loaded(raw_data):
+    assert [THIS_YEAR] == services.get_years_to_be_loaded()
+    assert [THIS_YEAR - 1, THIS_YEAR] == \
+        services.get_years_to_be_loaded(load_everything=True)
+
+
+def test_pipeline_imports_each_year_in_its_own_task(raw_data):
+    pipeline = tasks.build_execucoes_pipeline(load_everything=True)
+
+    imports = pipeline.tasks[1]
+    assert ['import_year', 'import_year'] == \
+        [task.task.split('.')[-1] for task in imports.tasks]
+    assert [(THIS_YEAR - 1,), (THIS_YEAR,)] == \
+        [task.args for task in imports.tasks]
+    # after the orcamentos of its year are loaded, before the promotion
+    body = [task.task.split('.')[-1] for task in imports.body.tasks]
+    assert 'import_minimo_legal' == body[0]
+    assert 'update_execucao_table_from_execucao_temp' == body[1]
+
+
+def test_pipeline_matches_serial_load(raw_data, downloads_path):
+    for year in services.get_years_to_be_loaded(load_everything=True):
+        services.load_data_from_orcamento_raw(year=year)
+        services.load_data_from_empenhos_raw(year=year)
+        services.import_orcamentos(year=year)
+        services.import_empenhos(year=year)
+    expected = ExecucaoTemp.objects.aggregate(
+        orcado=Sum('orcado_atualizado'), empenhado=Sum('empenhado_liquido'))
+    expected_count = ExecucaoTemp.objects.count()
+    assert expected_count
+
+    tasks.build_execucoes_pipeline(load_everything=True).delay()
+
+    assert not ExecucaoTemp.objects.exists()
+    assert expected_count == Execucao.objects.count()
+    assert expected == Execucao.objects.aggregate(
+        orcado=Sum('orcado_atualizado'), empenhado=Sum('empenhado_liquido'))
+    assert {THIS_YEAR - 1, THIS_YEAR} == set(Execucao.objects.get_years())
+    assert os.listdir(downloads_path)
+
+
+def test_pipeline_imports_minimo_legal(raw_data, downloads_path):
+    orcamento_raw = OrcamentoRaw.objects.filter(
+        cd_ano_execucao=THIS_YEAR).order_by('id').first()
+    minimo_legal = mommy.make(
+        MinimoLegal, year=date(THIS_YEAR, 1, 1), execucao=None,
+        projeto_id=orcamento_raw.cd_projeto_atividade, _fill_optional=True)
+
+    tasks.build_execucoes_pipeline(load_everything=True).delay()
+
+    minimo_legal.refresh_from_db()
+    assert minimo_legal.execucao.is_minimo_legal
+
+
+def test_pipeline_current_year(raw_data, downloads_path):
+    tasks.build_execucoes_pipeline().delay()
+
+    assert [THIS_YEAR] == list(Execucao.objects.get_years())
+    assert OrcamentoRaw.objects.filter(cd_ano_execucao=THIS_YEAR - 1).exists()
@@ -1,4 +1,5 @@
 from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
 
 from openpyxl import load_workbook
 
@@ -23,6 +24,19 @@ class EmpenhosSOFCacheDao:
     def get_all(self):
         return self.model.objects.all()
 
+    def iterate_all(self, chunk_size):
+        return self.model.objects.order_by('id').iterator(
+            chunk_size=chunk_size)
+
+    def iterate_contratos_related_values(self):
+        """
+        Valores usados para gerar as modalidades, objetos e fornecedores dos
+        contratos, sem carregar os empenhos inteiros.
+        """
+        return self.model.objects.values_list(
+            'codModalidadeContrato', 'txtDescricaoModalidadeContrato',
+            'txtObjetoContrato', 'txtRazaoSocial').iterator()
+
     def filter_by_ano_empenho_and_categoria(self, year):
         """
         Este método é utilizado para filtrar e agrupar os dados de contratos
@@ -110,6 +124,12 @@ class ContratosRawDao:
         return self.model.objects.all().order_by("anoExercicioContrato",
                                                  "codContrato")
 
+    def get_all_ids(self):
+        return list(self.get_all().values_list('id', flat=True))
+
+    def filter_by_ids(self, ids):
+        return self.get_all().filter(id__in=ids)
+
     def get(self, **data):
         return self.model.objects.get(**data)
 
@@ -133,6 +153,42 @@ class ExecucoesContratosDao:
     def erase_all(self):
         self.model.objects.all().delete()
 
+    def replace_all(self, execucoes_data, batch_size):
+        """
+        Apaga e recria todas as execuções numa única transação, inserindo-as
+        em lotes. Até o commit as consultas continuam vendo as execuções
+        antigas, então a tabela nunca fica vazia para a ferramenta.
+        """
+        with transaction.atomic():
+            self.erase_all()
+            batch = []
+            for data in execucoes_data:
+                batch.append(self.model(**data))
+                if len(batch) == batch_size:
+                    self.model.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                self.model.objects.bulk_create(batch)
+
+    def apply_categorias_fromto(self):
+        """
+        Aplica todos os de-para de categoria numa única atualização, que
+        relaciona as execuções aos de-para e às categorias pelo banco.
+        """
+        categorias = CategoriaContrato.objects \
+            .filter(name=OuterRef('categoria_name'))
+        fromtos = CategoriaContratoFromTo.objects \
+            .filter(indexer=OuterRef('empenho_indexer')) \
+            .annotate(categoria_id=Subquery(categorias.values('id')[:1]))
+        return self.model.objects \
+            .filter(empenho_indexer__in=CategoriaContratoFromTo.objects
+                    .values('indexer')) \
+            .update(categoria_id=Subquery(
+                fromtos.values('categoria_id')[:1]))
+
+    def update_metadata(self):
+        return self.model.objects.update_metadata()
+
 
 class ModalidadesContratosDao:
 
@@ -142,6 +198,13 @@ class ModalidadesContratosDao:
     def get_or_create(self, **data):
         return self.model.objects.get_or_create(**data)
 
+    def get_all_ids(self):
+        return set(self.model.objects.values_list('id', flat=True))
+
+    def bulk_create(self, data_list):
+        return self.model.objects.bulk_create(
+            [self.model(**data) for data in data_list])
+
 
 class ObjetosContratosDao:
 
@@ -151,6 +214,17 @@ class ObjetosContratosDao:
     def get_or_create(self, **data):
         return self.model.objects.get_or_create(**data)
 
+    def get_ids_by_desc(self):
+        ids = {}
+        for id_, desc in self.model.objects.order_by('id') \
+                .values_list('id', 'desc'):
+            ids.setdefault(desc, id_)
+        return ids
+
+    def bulk_create(self, data_list):
+        return self.model.objects.bulk_create(
+            [self.model(**data) for data in data_list])
+
 
 class FornecedoresDao:
 
@@ -160,6 +234,17 @@ class FornecedoresDao:
     def get_or_create(self, **data):
         return self.model.objects.get_or_create(**data)
 
+    def get_ids_by_razao_social(self):
+        ids = {}
+        for id_, razao_social in self.model.objects.order_by('id') \
+                .values_list('id', 'razao_social'):
+            ids.setdefault(razao_social, id_)
+        return ids
+
+    def bulk_create(self, data_list):
+        return self.model.objects.bulk_create(
+            [self.model(**data) for data in data_list])
+
 
 class CategoriasContratosFromToDao:
 
@@ -169,6 +254,16 @@ class CategoriasContratosFromToDao:
     def get_all(self):
         return self.model.objects.all()
 
+    def get_categorias(self):
+        """
+        Nome e descrição das categorias usadas nos de-para, sem repetição.
+        """
+        categorias = {}
+        for name, desc in self.model.objects.order_by('id') \
+                .values_list('categoria_name', 'categoria_desc'):
+            categorias.setdefault(name, desc)
+        return list(categorias.items())
+
     def extract_spreadsheet(self, ssheet_obj):
         if ssheet_obj.extracted:
             return
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0036_auto_20191216_0133'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='execucaocontrato',
+            name='dt_created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0037_auto_20261019_1200'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='execucaocontrato',
+            name='year',
+            field=models.DateField(db_index=True),
+        ),
+    ]
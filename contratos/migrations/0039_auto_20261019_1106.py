@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-19 11:06
+
+from django.db import migrations, models
+
+
+# same format as EmpenhoSOFCache.build_indexer
+FILL_INDEXER_SQL = """
+UPDATE contratos_empenhosofcache SET indexer = concat_ws('.',
+    coalesce("anoEmpenho"::text, 'None'),
+    coalesce("codOrgao"::text, 'None'),
+    coalesce("codProjetoAtividade"::text, 'None'),
+    coalesce("codCategoria"::text, 'None'),
+    coalesce("codGrupo"::text, 'None'),
+    CASE WHEN "codModalidade" BETWEEN 0 AND 9 THEN '0' || "codModalidade"::text
+         ELSE coalesce("codModalidade"::text, 'None') END,
+    CASE WHEN "codElemento" BETWEEN 0 AND 9 THEN '0' || "codElemento"::text
+         ELSE coalesce("codElemento"::text, 'None') END,
+    CASE WHEN "codFonteRecurso" BETWEEN 0 AND 9 THEN '0' || "codFonteRecurso"::text
+         ELSE coalesce("codFonteRecurso"::text, 'None') END)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0038_auto_20261019_1303'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empenhosofcache',
+            name='indexer',
+            field=models.CharField(db_index=True, editable=False, max_length=80, null=True),
+        ),
+        migrations.RunSQL(FILL_INDEXER_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='execucaocontrato',
+            name='empenho_indexer',
+            field=models.CharField(db_index=True, max_length=28),
+        ),
+    ]
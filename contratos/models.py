@@ -1,22 +1,83 @@
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.db.models import Max
+
+from global_app.metadata import (
+    CONTRATOS_DATASET, get_dataset_metadata, update_dataset_metadata)
 
 
 class ExecucaoContratoManager(models.Manager):
 
     def get_date_updated(self):
-        last_execucao = self.get_queryset().order_by('-dt_created') \
-            .first()
-        if last_execucao:
-            return last_execucao.dt_created.strftime('%d/%m/%Y')
+        last_modified = self.get_last_modified()
+        if last_modified:
+            return last_modified.strftime('%d/%m/%Y')
         else:
             return None
 
+    def get_last_modified(self):
+        """Used as the Last-Modified of the contratos views"""
+        metadata = get_dataset_metadata(CONTRATOS_DATASET)
+        if metadata:
+            return metadata.dt_updated
+        return self.get_queryset().aggregate(
+            last_modified=Max('dt_created'))['last_modified']
+
+    def get_newest_year(self):
+        """Newest year of the execucoes that have a categoria"""
+        metadata = get_dataset_metadata(CONTRATOS_DATASET)
+        if metadata:
+            return metadata.newest_year
+        return self.get_queryset().filter(categoria__isnull=False) \
+            .order_by('-year__year') \
+            .values_list('year__year', flat=True).first()
+
+    def get_years(self):
+        """Years of the execucoes that have a categoria"""
+        metadata = get_dataset_metadata(CONTRATOS_DATASET)
+        if metadata:
+            return metadata.years
+        years = self.get_queryset().filter(categoria__isnull=False) \
+            .dates('year', 'year')
+        return [year.year for year in years]
+
+    def update_metadata(self):
+        """Registers the dataset metadata read by the views"""
+        queryset = self.get_queryset()
+        years = queryset.filter(categoria__isnull=False) \
+            .dates('year', 'year')
+        return update_dataset_metadata(
+            CONTRATOS_DATASET,
+            dt_updated=queryset.aggregate(
+                last_modified=Max('dt_created'))['last_modified'],
+            years=[year.year for year in years],
+            row_count=queryset.count())
+
+
+class EmpenhoSOFCacheManager(models.Manager):
+
+    def fill_missing_indexers(self, batch_size=5000):
+        """
+        Fills the indexer of empenhos saved without calling `save`, like the
+        ones loaded from dumps
+        """
+        empenhos = self.get_queryset().filter(indexer__isnull=True) \
+            .order_by('id').iterator(chunk_size=batch_size)
+        batch = []
+        for empenho in empenhos:
+            empenho.indexer = empenho.build_indexer()
+            batch.append(empenho)
+            if len(batch) == batch_size:
+                self.bulk_update(batch, ['indexer'])
+                batch = []
+        if batch:
+            self.bulk_update(batch, ['indexer'])
+
 
 class ExecucaoContrato(models.Model):
     cod_contrato = models.IntegerField()
-    empenho_indexer = models.CharField(max_length=28)
-    year = models.DateField()
+    empenho_indexer = models.CharField(max_length=28, db_index=True)
+    year = models.DateField(db_index=True)
     valor_empenhado = models.FloatField()
     valor_liquidado = models.FloatField()
     modalidade = models.ForeignKey("ModalidadeContrato",
@@ -27,7 +88,7 @@ class ExecucaoContrato(models.Model):
     # from-to field
     categoria = models.ForeignKey("CategoriaContrato", null=True,
                                   on_delete=models.PROTECT)
-    dt_created = models.DateTimeField(auto_now_add=True)
+    dt_created = models.DateTimeField(auto_now_add=True, db_index=True)
     # used only to filter empenhos without categoria when generating
     # the xlsx files
     empenho = models.OneToOneField("EmpenhoSOFCache", null=True,
@@ -176,8 +237,13 @@ class EmpenhoSOFCache(models.Model):
     valPagoRestos = models.FloatField(blank=True, null=True)
     valTotalEmpenhado = models.FloatField(blank=True, null=True)
 
+    # filled on save, so the categorias from-to can be applied by the database
+    indexer = models.CharField(max_length=80, null=True, db_index=True,
+                               editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = EmpenhoSOFCacheManager()
+
     class Meta:
         verbose_name_plural = 'Empenhos SOF Cache'
         unique_together = (
@@ -212,8 +278,11 @@ class EmpenhoSOFCache(models.Model):
             'valTotalEmpenhado',
         )
 
-    @property
-    def indexer(self):
+    def save(self, *args, **kwargs):
+        self.indexer = self.build_indexer()
+        super().save(*args, **kwargs)
+
+    def build_indexer(self):
         cod_modalidade = str(self.codModalidade)
         if len(cod_modalidade) < 2:
             cod_modalidade = '0' + cod_modalidade
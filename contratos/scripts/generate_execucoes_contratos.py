@@ -1,5 +1,17 @@
+from contratos import tasks
 from contratos.services import domain as services
+from global_app.etl_metrics import etl_run
+from global_app.prerender import prerender_after_etl
 
 
 def run(*args):
-    services.generate_execucoes_contratos_and_apply_fromto()
+    if 'celery' in args:
+        result = tasks.build_execucoes_contratos_pipeline().delay()
+        print('Execucoes contratos pipeline sent to the Celery workers: '
+              f'{result.id}')
+        return
+
+    with etl_run('contratos'):
+        services.generate_execucoes_contratos_and_apply_fromto()
+
+    prerender_after_etl('contratos')
@@ -1,11 +1,18 @@
 from django.core.mail import mail_admins
 
-from contratos import services
+from contratos import services, tasks
+from global_app.etl_metrics import etl_run
 
 
 def run(*args):
+    if 'celery' in args:
+        result = tasks.build_sof_pipeline().delay()
+        print(f'SOF pipeline sent to the Celery workers: {result.id}')
+        return
+
     try:
-        services.get_empenhos_for_contratos_from_sof_api()
+        with etl_run('contratos_sof_api'):
+            services.get_empenhos_for_contratos_from_sof_api()
     except Exception as e:
         subject = 'Erro ao atualizar os empenhos'
         msg = str(e)
@@ -1,5 +1,7 @@
 from contratos.services import sof_api as services
+from global_app.etl_metrics import etl_run
 
 
 def run(*args):
-    services.retry_failed_requests_and_update_sof_cache_table()
+    with etl_run('contratos_sof_api'):
+        services.retry_failed_requests_and_update_sof_cache_table()
@@ -12,9 +12,11 @@ class ExecucaoContratoSerializer:
 
     @property
     def data(self):
+        big_number, destinations = services.serialize_year_data(
+            self.qs_year_filtered)
         return {
-            'big_number': services.serialize_big_number_data(self.qs_year_filtered),
-            'destinations': services.serialize_destinations(self.qs_year_filtered),
+            'big_number': big_number,
+            'destinations': destinations,
             'top5': services.serialize_top5(self.qs),
             'dt_updated': services.serialize_date_updated(),
         }
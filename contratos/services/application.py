@@ -5,25 +5,65 @@ from django.db.models import Sum
 from contratos.models import ExecucaoContrato
 
 
+def get_categorias_sums(queryset):
+    """
+    Totais empenhado e liquidado por ano e categoria, numa única consulta.
+    O total do ano é o rollup dessas linhas.
+    :param queryset: objeto com os dados a serem agregados
+    """
+    return list(
+        queryset
+        .values("year__year", "categoria__name", "categoria__desc",
+                "categoria__slug", "categoria__id")
+        .annotate(total_empenhado=Sum('valor_empenhado'),
+                  total_liquidado=Sum('valor_liquidado'))
+        .order_by("year__year", "categoria__name"))
+
+
+def serialize_year_data(queryset):
+    """
+    Serealiza os dados do ano exibidos na página (big number e destinos)
+    a partir de uma única consulta agrupada
+    :param queryset: objeto com os dados a serem serealizados
+    """
+    categorias_sums = get_categorias_sums(queryset)
+    return (build_big_number_data(categorias_sums),
+            build_destinations(categorias_sums))
+
+
 def serialize_big_number_data(queryset):
     """
     Serealiza o objeto retornado do banco para exibir na página
     :param queryset: objeto com os dados a serem serealizados
     """
-    year_sum_qs = queryset.values('year__year').annotate(
-        total_empenhado=Sum('valor_empenhado'),
-        total_liquidado=Sum('valor_liquidado'))
+    return build_big_number_data(get_categorias_sums(queryset))
+
+
+def serialize_destinations(queryset):
+    """
+    Serealiza o objeto retornado do banco para exibir na página
+    :param queryset: objeto com os dados a serem serealizados
+    """
+    return build_destinations(get_categorias_sums(queryset))
+
 
-    if year_sum_qs:
-        year_sum = year_sum_qs[0]
-    else:
+def get_year_rows(categorias_sums):
+    if not categorias_sums:
+        return []
+    year = categorias_sums[0]['year__year']
+    return [row for row in categorias_sums if row['year__year'] == year]
+
+
+def build_big_number_data(categorias_sums):
+    year_rows = get_year_rows(categorias_sums)
+    if not year_rows:
         return {}
 
-    empenhado = year_sum['total_empenhado']
-    liquidado = year_sum['total_liquidado']
+    empenhado = sum(row['total_empenhado'] for row in year_rows)
+    liquidado = sum(row['total_liquidado'] for row in year_rows)
     percent_liquidado = liquidado / empenhado
     year_dict = {
-        'year': year_sum['year__year'],
+        'year': year_rows[0]['year__year'],
         'empenhado': empenhado,
         'liquidado': liquidado,
         'percent_liquidado': percent_liquidado,
@@ -32,28 +72,15 @@ def serialize_big_number_data(queryset):
     return year_dict
 
 
-def serialize_destinations(queryset):
-    """
-    Serealiza o objeto retornado do banco para exibir na página
-    :param queryset: objeto com os dados a serem serealizados
-    """
-    empenhado_qs = queryset.values('year__year')\
-        .annotate(total_empenhado=Sum('valor_empenhado')) \
-        .distinct()
-    if empenhado_qs:
-        total_empenhado = empenhado_qs[0]['total_empenhado']
-    else:
+def build_destinations(categorias_sums):
+    year_rows = get_year_rows(categorias_sums)
+    if not year_rows:
         return []
 
-    categorias_sums = queryset \
-        .values("year__year", "categoria__name", "categoria__desc",
-                "categoria__slug", "categoria__id") \
-        .annotate(total_empenhado=Sum('valor_empenhado'),
-                  total_liquidado=Sum('valor_liquidado')) \
-        .order_by("categoria__name")
+    total_empenhado = sum(row['total_empenhado'] for row in year_rows)
 
     year_list = []
-    for cat_data in categorias_sums:
+    for cat_data in year_rows:
         empenhado = cat_data['total_empenhado']
         liquidado = cat_data['total_liquidado']
         percent_liquidado = liquidado / empenhado
@@ -1,5 +1,7 @@
 import openpyxl
 
+from django.db import transaction
+
 from contratos.dao.models_dao import (
     CategoriasContratosDao, CategoriasContratosFromToDao, EmpenhosSOFCacheDao,
     ExecucoesContratosDao, FornecedoresDao, ModalidadesContratosDao,
@@ -8,6 +10,7 @@ from contratos.use_cases import (
     ApplyCategoriasContratosFromToUseCase,
     GenerateExecucoesContratosUseCase,
     GenerateXlsxFilesUseCase)
+from global_app.etl_metrics import etl_stage
 
 
 def generate_execucoes_contratos_and_apply_fromto():
@@ -16,28 +19,48 @@ def generate_execucoes_contratos_and_apply_fromto():
     e aplica as junções dos arquivos, gerando ao final a planilha para
     download dos dados
     """
-    print("Generating execucões contratos")
+    generate_execucoes_contratos()
+    generate_xlsx_files()
+
+
+@etl_stage
+def generate_execucoes_contratos():
+    """
+    Gera as execuções e aplica o de-para de categorias, sem gerar as
+    planilhas para download
+    """
     generate_execucoes_uc = GenerateExecucoesContratosUseCase(
         empenhos_dao=EmpenhosSOFCacheDao(),
         execucoes_dao=ExecucoesContratosDao(),
         modalidades_dao=ModalidadesContratosDao(),
         objetos_dao=ObjetosContratosDao(),
         fornecedores_dao=FornecedoresDao())
-    generate_execucoes_uc.execute()
-
-    print("Applying from-to")
     apply_fromto_uc = ApplyCategoriasContratosFromToUseCase(
         execucoes_dao=ExecucoesContratosDao(),
         categorias_fromto_dao=CategoriasContratosFromToDao(),
         categorias_dao=CategoriasContratosDao())
-    apply_fromto_uc.execute()
 
-    generate_xlsx_files()
+    # the tool only shows execucoes with categoria, so the from-to is applied
+    # in the same transaction the execucoes are regenerated
+    with transaction.atomic():
+        print("Generating execucões contratos")
+        generate_execucoes_uc.execute()
+
+        print("Applying from-to")
+        apply_fromto_uc.execute()
 
+    print("Updating execucões contratos metadata")
+    ExecucoesContratosDao().update_metadata()
 
-def generate_xlsx_files():
+
+@etl_stage
+def generate_xlsx_files(years=None):
+    """
+    Gera as planilhas para download dos anos em `years` ou, se não
+    informados, de 2018 até o ano atual
+    """
     print("Generating xlsx files")
     generate_xlsx_uc = GenerateXlsxFilesUseCase(
         empenhos_dao=EmpenhosSOFCacheDao(),
         data_handler=openpyxl)
-    generate_xlsx_uc.execute()
+    generate_xlsx_uc.execute(years)
@@ -9,6 +9,7 @@ from contratos.dao.models_dao import (
     EmpenhosFailedRequestsDao,
 )
 from contratos.exceptions import ContratosEmpenhosDifferenceOverLimit
+from global_app.etl_metrics import etl_stage, record_rows
 
 
 def get_empenhos_for_contratos_from_sof_api():
@@ -23,8 +24,9 @@ def get_empenhos_for_contratos_from_sof_api():
     empenhos_temp_dao = EmpenhosSOFCacheTempDao()
     empenhos_failed_requests_dao = EmpenhosFailedRequestsDao()
 
-    empenhos_temp_dao.erase_all()
-    empenhos_failed_requests_dao.erase_all()
+    erase_temp_tables(
+        empenhos_temp_dao=empenhos_temp_dao,
+        empenhos_failed_requests_dao=empenhos_failed_requests_dao)
 
     print("Fetching empenhos from SOF API and saving to temp table")
     fetch_empenhos_from_sof_and_save_to_temp_table(
@@ -45,21 +47,40 @@ def get_empenhos_for_contratos_from_sof_api():
         empenhos_dao=empenhos_dao, empenhos_temp_dao=empenhos_temp_dao)
 
 
+def erase_temp_tables(*, empenhos_temp_dao, empenhos_failed_requests_dao):
+    empenhos_temp_dao.erase_all()
+    empenhos_failed_requests_dao.erase_all()
+
+
+@etl_stage
 def fetch_empenhos_from_sof_and_save_to_temp_table(
-        contratos_raw_dao, empenhos_temp_dao):
+        contratos_raw_dao, empenhos_temp_dao, contratos_ids=None):
     """
     Para cada registro de contrato, realiza a conexão com API SOF
     e baixa os dados de empenhos em /getempenhos e salva na tabela
     empenhos_sof_cache (tabela temporária criada para, antes de
     exibir os dados, validar se há discrepância percentual dos
     resultados).
-    :param contrato: objeto contrato
+    :param contratos_raw_dao: objeto de origem dos contratos
     :param empenhos_temp_dao: objeto de destino dos dados de empenhos
+    :param contratos_ids: ids dos contratos a serem consultados. Se não
+    informados, todos os contratos são consultados.
     """
-    for contrato in contratos_raw_dao.get_all():
+    if contratos_ids is None:
+        contratos_raw = contratos_raw_dao.get_all()
+    else:
+        contratos_raw = contratos_raw_dao.filter_by_ids(contratos_ids)
+
+    contratos = saved = 0
+    for contrato in contratos_raw:
         count = get_empenhos_for_contrato_and_save(
             contrato=contrato, empenhos_temp_dao=empenhos_temp_dao)
         print(f'{count} empenhos saved for contrato {contrato.codContrato}')
+        contratos += 1
+        saved += count
+
+    record_rows(rows_in=contratos)
+    return saved
 
 
 def get_empenhos_for_contrato_and_save(*, contrato, empenhos_temp_dao,
@@ -123,12 +144,14 @@ def save_empenhos_sof_cache(*, empenhos_data, empenhos_temp_dao):
     return len(empenhos_data)
 
 
+@etl_stage
 def retry_empenhos_sof_failed_api_requests(
         contratos_raw_dao, empenhos_failed_requests_dao, empenhos_temp_dao):
     """
     Este método conecta à api sof para tentar novamente a consulta por
     empenhos que falharam na primeira tentativa.
     """
+    retried = saved = 0
     for failed_request in empenhos_failed_requests_dao.get_all():
         contrato = contratos_raw_dao.get(
             codContrato=failed_request.cod_contrato,
@@ -143,16 +166,26 @@ def retry_empenhos_sof_failed_api_requests(
         print(
             f'{count} empenhos saved for contrato {failed_request.cod_contrato}'
         )
+        retried += 1
+        saved += count
+
+    record_rows(rows_in=retried)
+    return saved
 
 
+@etl_stage
 def update_empenho_sof_cache_from_temp_table(*, empenhos_dao,
                                              empenhos_temp_dao):
+    copied = 0
     for empenho_temp in empenhos_temp_dao.get_all():
         empenhos_dao.create_from_temp_table_obj(empenho_temp)
         empenhos_temp_dao.delete(empenho_temp)
+        copied += 1
     print("Empenhos copied from temp table to EmpenhoSOFCache table")
+    return copied
 
 
+@etl_stage
 def verify_table_lines_count(*, empenhos_dao, empenhos_temp_dao):
     try:
         limit = float(CONTRATOS_EMPENHOS_DIFFERENCE_PERCENT_LIMIT)
@@ -0,0 +1,74 @@
+"""
+Tarefas Celery das cargas de contratos. Em `build_sof_pipeline`, os
+contratos são divididos em lotes de ETL_SOF_CONTRATOS_PER_TASK, consultados
+na API SOF em paralelo, e a tarefa final refaz as requisições que falharam,
+valida a contagem de linhas e atualiza a tabela de empenhos. Em
+`build_execucoes_contratos_pipeline`, as planilhas de cada ano são geradas
+em paralelo após as execuções.
+"""
+from datetime import date
+
+from celery import chain, chord, group, shared_task
+from django.conf import settings
+
+from contratos.dao.models_dao import (
+    ContratosRawDao, EmpenhosFailedRequestsDao, EmpenhosSOFCacheTempDao)
+from contratos.services import domain, sof_api
+from global_app.tasks import prerender_pages
+
+
+@shared_task
+def erase_temp_tables():
+    sof_api.erase_temp_tables(
+        empenhos_temp_dao=EmpenhosSOFCacheTempDao(),
+        empenhos_failed_requests_dao=EmpenhosFailedRequestsDao())
+
+
+@shared_task
+def fetch_empenhos_from_sof(contratos_ids):
+    return sof_api.fetch_empenhos_from_sof_and_save_to_temp_table(
+        contratos_raw_dao=ContratosRawDao(),
+        empenhos_temp_dao=EmpenhosSOFCacheTempDao(),
+        contratos_ids=contratos_ids)
+
+
+@shared_task
+def update_empenho_sof_cache(saved_counts=None):
+    sof_api.retry_failed_requests_and_update_sof_cache_table()
+
+
+@shared_task
+def generate_execucoes_contratos():
+    domain.generate_execucoes_contratos()
+
+
+@shared_task
+def generate_xlsx_file(year):
+    domain.generate_xlsx_files(years=[year])
+
+
+def build_sof_pipeline():
+    ids = ContratosRawDao().get_all_ids()
+    size = settings.ETL_SOF_CONTRATOS_PER_TASK
+    fetches = [fetch_empenhos_from_sof.si(ids[i:i + size])
+               for i in range(0, len(ids), size)]
+
+    if not fetches:
+        return chain(erase_temp_tables.si(), update_empenho_sof_cache.si())
+    return chain(
+        erase_temp_tables.si(),
+        chord(fetches, update_empenho_sof_cache.s()),
+    )
+
+
+def build_execucoes_contratos_pipeline():
+    years = range(2018, date.today().year + 1)
+    return chain(
+        generate_execucoes_contratos.si(),
+        group(generate_xlsx_file.si(year) for year in years),
+        prerender_pages.si('contratos'),
+    )
+
+
+def build_contratos_pipeline():
+    return chain(build_sof_pipeline(), build_execucoes_contratos_pipeline())
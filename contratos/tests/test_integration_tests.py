@@ -39,6 +39,30 @@ def test_generate_execucoes_contratos():
     assert 1 == Fornecedor.objects.count()
 
 
+@pytest.mark.django_db
+def test_generate_execucoes_contratos_replaces_old_execucoes():
+    old_execucao = mommy.make(ExecucaoContrato)
+    objeto = mommy.make(ObjetoContrato)
+
+    for data in GENERATE_EXECUCOES_CONTRATOS_EMPENHOS_DATA:
+        mommy.make(EmpenhoSOFCache,
+                   **dict(data, txtObjetoContrato=objeto.desc))
+
+    uc = GenerateExecucoesContratosUseCase(
+        empenhos_dao=EmpenhosSOFCacheDao(),
+        execucoes_dao=ExecucoesContratosDao(),
+        modalidades_dao=ModalidadesContratosDao(),
+        objetos_dao=ObjetosContratosDao(),
+        fornecedores_dao=FornecedoresDao())
+    uc.batch_size = 1
+    uc.execute()
+
+    assert 2 == ExecucaoContrato.objects.count()
+    assert not ExecucaoContrato.objects.filter(id=old_execucao.id).exists()
+    # existing objeto is reused
+    assert 2 == ExecucaoContrato.objects.filter(objeto_contrato=objeto).count()
+
+
 @pytest.mark.django_db
 def test_apply_categoria_contrato_fromto():
     assert 0 == CategoriaContrato.objects.count()
@@ -1,3 +1,5 @@
+import pytest
+
 from model_mommy import mommy
 
 from contratos.models import EmpenhoSOFCache
@@ -16,4 +18,22 @@ class TestEmpenhoSOFCacheModel:
             f'0{emp.codElemento}.0{emp.codFonteRecurso}'
         )
 
-        assert expected == emp.indexer
+        assert expected == emp.build_indexer()
+
+    @pytest.mark.django_db
+    def test_indexer_is_stored_on_save(self):
+        emp = mommy.make(
+            EmpenhoSOFCache, codModalidade=2, codElemento=3, codFonteRecurso=1,
+            _fill_optional=True)
+        emp.refresh_from_db()
+        assert emp.build_indexer() == emp.indexer
+
+    @pytest.mark.django_db
+    def test_fill_missing_indexers(self):
+        emp = mommy.make(EmpenhoSOFCache, _fill_optional=True)
+        EmpenhoSOFCache.objects.update(indexer=None)
+
+        EmpenhoSOFCache.objects.fill_missing_indexers(batch_size=1)
+
+        emp.refresh_from_db()
+        assert emp.build_indexer() == emp.indexer
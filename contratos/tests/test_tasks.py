@@ -0,0 +1,53 @@
+from copy import deepcopy
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from django.test import override_settings
+from model_mommy import mommy
+
+from contratos import tasks
+from contratos.models import ContratoRaw, EmpenhoSOFCache, EmpenhoSOFCacheTemp
+from contratos.tests.fixtures import CONTRATO_RAW_DATA, SOF_API_EMPENHOS_DATA
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def contratos():
+    return [mommy.make(ContratoRaw, **dict(CONTRATO_RAW_DATA, codContrato=cod))
+            for cod in (111, 222, 333)]
+
+
+@override_settings(ETL_SOF_CONTRATOS_PER_TASK=2)
+def test_sof_pipeline_fetches_contratos_in_batches(contratos):
+    pipeline = tasks.build_sof_pipeline()
+
+    fetches = pipeline.tasks[1].tasks
+    assert [([contratos[0].id, contratos[1].id],), ([contratos[2].id],)] == \
+        [fetch.args for fetch in fetches]
+
+
+@override_settings(ETL_SOF_CONTRATOS_PER_TASK=2)
+@patch('contratos.dao.sof_api_dao.get_by_codcontrato_and_anoexercicio')
+def test_sof_pipeline_updates_empenhos(mock_get_empenhos, contratos):
+    mock_get_empenhos.side_effect = \
+        lambda **kwargs: deepcopy(SOF_API_EMPENHOS_DATA)
+    mommy.make(EmpenhoSOFCacheTemp, _quantity=2)
+
+    tasks.build_sof_pipeline().delay()
+
+    assert 3 == mock_get_empenhos.call_count
+    assert 3 * len(SOF_API_EMPENHOS_DATA) == EmpenhoSOFCache.objects.count()
+    assert {111, 222, 333} == set(
+        EmpenhoSOFCache.objects.values_list('codContrato', flat=True))
+    assert not EmpenhoSOFCacheTemp.objects.exists()
+
+
+def test_execucoes_contratos_pipeline_generates_each_year_xlsx():
+    pipeline = tasks.build_execucoes_contratos_pipeline()
+
+    xlsx_years = [task.args[0] for task in pipeline.tasks[1].tasks]
+    assert list(range(2018, date.today().year + 1)) == xlsx_years
@@ -11,8 +11,8 @@ from contratos.dao.models_dao import (
     EmpenhosSOFCacheDao, ExecucoesContratosDao,
     ModalidadesContratosDao, ObjetosContratosDao)
 from contratos.models import (
-    CategoriaContrato, CategoriaContratoFromTo, ExecucaoContrato, Fornecedor,
-    EmpenhoSOFCache, ModalidadeContrato, ObjetoContrato)
+    CategoriaContrato, Fornecedor,
+    EmpenhoSOFCache, ObjetoContrato)
 from contratos.use_cases import (
     ApplyCategoriasContratosFromToUseCase,
     GenerateExecucoesContratosUseCase)
@@ -40,44 +40,68 @@ class TestGenerateExecucoesContratosUseCase(TestCase):
         assert self.uc.objetos_dao == self.m_objetos_dao
         assert self.uc.fornecedores_dao == self.m_fornecedores_dao
 
-    def test_execute_erases_execucoes_and_calls_create_execucao_for_each_empenho(self):  # noqa
-        empenhos = mommy.prepare(EmpenhoSOFCache, _fill_optional=True,
-                                 _quantity=2)
-        self.m_empenhos_dao.get_all.return_value = empenhos
-        self.uc._create_execucao_by_empenho = Mock()
+    def test_execute_replaces_execucoes_with_one_per_empenho(self):
+        empenhos = mommy.prepare(EmpenhoSOFCache, anoEmpenho=2019,
+                                 _fill_optional=True, _quantity=2)
+        self.m_empenhos_dao.iterate_all.return_value = iter(empenhos)
+        objetos_ids = {empenho.txtObjetoContrato: 22 for empenho in empenhos}
+        fornecedores_ids = {
+            empenho.txtRazaoSocial: 33 for empenho in empenhos}
+        self.uc._create_related_objects = Mock(
+            return_value=(objetos_ids, fornecedores_ids))
 
-        self.uc.execute()
-
-        self.m_execucoes_dao.erase_all.assert_called_once_with()
-
-        self.m_empenhos_dao.get_all.assert_called_once_with()
-        assert 2 == self.uc._create_execucao_by_empenho.call_count
-        for empenho in empenhos:
-            self.uc._create_execucao_by_empenho.assert_any_call(
-                empenho=empenho)
+        replaced = []
+        self.m_execucoes_dao.replace_all.side_effect = \
+            lambda data, batch_size: replaced.extend(data)
 
-    def test_create_execucao_by_empenho(self):
-        m_modalidade = mommy.prepare(ModalidadeContrato, _fill_optional=True)
-        m_objeto = mommy.prepare(ObjetoContrato, id=22, _fill_optional=True)
-        m_fornecedor = mommy.prepare(Fornecedor, id=33, _fill_optional=True)
-
-        self.m_modalidades_dao.get_or_create.return_value = (m_modalidade, True)
-        self.m_objetos_dao.get_or_create.return_value = (m_objeto, True)
-        self.m_fornecedores_dao.get_or_create.return_value = (
-            m_fornecedor, True)
+        self.uc.execute()
 
+        self.m_empenhos_dao.iterate_all.assert_called_once_with(
+            self.uc.batch_size)
+        assert 1 == self.m_execucoes_dao.replace_all.call_count
+        assert 2 == len(replaced)
+        for empenho, execucao_data in zip(empenhos, replaced):
+            assert empenho.id == execucao_data['empenho_id']
+            assert 22 == execucao_data['objeto_contrato_id']
+            assert 33 == execucao_data['fornecedor_id']
+
+    def test_create_related_objects_creates_only_missing_ones(self):
+        self.m_empenhos_dao.iterate_contratos_related_values.return_value = [
+            (1, 'modalidade 1', 'objeto 1', 'fornecedor 1'),
+            (1, 'modalidade 1', 'objeto 2', 'fornecedor 1'),
+            (2, 'modalidade 2', 'objeto 1', 'fornecedor 2'),
+        ]
+        self.m_modalidades_dao.get_all_ids.return_value = {1}
+        self.m_objetos_dao.get_ids_by_desc.return_value = {'objeto 1': 10}
+        self.m_objetos_dao.bulk_create.return_value = [
+            mommy.prepare(ObjetoContrato, id=11, desc='objeto 2')]
+        self.m_fornecedores_dao.get_ids_by_razao_social.return_value = {}
+        self.m_fornecedores_dao.bulk_create.side_effect = \
+            lambda data_list: [
+                mommy.prepare(Fornecedor, id=20 + i, **data)
+                for i, data in enumerate(data_list)]
+
+        objetos_ids, fornecedores_ids = self.uc._create_related_objects()
+
+        self.m_modalidades_dao.bulk_create.assert_called_once_with(
+            [{"id": 2, "desc": 'modalidade 2'}])
+        self.m_objetos_dao.bulk_create.assert_called_once_with(
+            [{"desc": 'objeto 2'}])
+        created_fornecedores = \
+            self.m_fornecedores_dao.bulk_create.call_args[0][0]
+        assert 2 == len(created_fornecedores)
+
+        assert {'objeto 1': 10, 'objeto 2': 11} == objetos_ids
+        assert {'fornecedor 1', 'fornecedor 2'} == set(fornecedores_ids)
+
+    def test_build_execucao_data(self):
         empenho = mommy.prepare(EmpenhoSOFCache, anoEmpenho=2019,
                                 _fill_optional=True, id=1)
+        objetos_ids = {empenho.txtObjetoContrato: 22}
+        fornecedores_ids = {empenho.txtRazaoSocial: 33}
 
-        self.uc._create_execucao_by_empenho(empenho)
-
-        self.m_modalidades_dao.get_or_create.assert_called_once_with(
-            id=empenho.codModalidadeContrato,
-            desc=empenho.txtDescricaoModalidadeContrato)
-        self.m_objetos_dao.get_or_create.assert_called_once_with(
-            desc=empenho.txtObjetoContrato)
-        self.m_fornecedores_dao.get_or_create.assert_called_once_with(
-            razao_social=empenho.txtRazaoSocial)
+        ret = self.uc._build_execucao_data(
+            empenho, objetos_ids, fornecedores_ids)
 
         expected_execucao_data = {
             "cod_contrato": empenho.codContrato,
@@ -85,14 +109,12 @@ class TestGenerateExecucoesContratosUseCase(TestCase):
             "year": datetime.strptime(str(empenho.anoEmpenho), "%Y"),
             "valor_empenhado": empenho.valEmpenhadoLiquido,
             "valor_liquidado": empenho.valLiquidado,
-            "modalidade_id": m_modalidade.id,
-            "objeto_contrato_id": m_objeto.id,
-            "fornecedor_id": m_fornecedor.id,
+            "modalidade_id": empenho.codModalidadeContrato,
+            "objeto_contrato_id": 22,
+            "fornecedor_id": 33,
             "empenho_id": empenho.id,
         }
-
-        self.m_execucoes_dao.create.assert_called_once_with(
-            **expected_execucao_data)
+        assert expected_execucao_data == ret
 
 
 class TestApplyCategoriasContratosFromToUseCase(TestCase):
@@ -111,47 +133,38 @@ class TestApplyCategoriasContratosFromToUseCase(TestCase):
         assert self.uc.categorias_fromto_dao == self.m_categorias_fromto_dao
         assert self.uc.categorias_dao == self.m_categorias_dao
 
-    def test_execute_calls_apply_fromto_for_each_fromto(self):
-        fromtos = mommy.prepare(CategoriaContratoFromTo, _fill_optional=True,
-                                _quantity=2)
-        self.m_categorias_fromto_dao.get_all.return_value = fromtos
-        self.uc._apply_fromto = Mock()
+    def test_execute_creates_categorias_and_applies_fromtos_at_once(self):
+        categorias = [('cat1', 'desc 1'), ('cat2', 'desc 2')]
+        self.m_categorias_fromto_dao.get_categorias.return_value = categorias
+        self.uc._get_or_create_categoria = Mock()
 
         self.uc.execute()
 
-        self.m_categorias_fromto_dao.get_all.assert_called_once_with()
-        assert 2 == self.uc._apply_fromto.call_count
-        for fromto in fromtos:
-            self.uc._apply_fromto.assert_any_call(fromto)
+        self.m_categorias_fromto_dao.get_categorias.assert_called_once_with()
+        assert 2 == self.uc._get_or_create_categoria.call_count
+        for name, desc in categorias:
+            self.uc._get_or_create_categoria.assert_any_call(name, desc)
+        self.m_execucoes_dao.apply_categorias_fromto.assert_called_once_with()
 
-    def test_apply_fromto(self):
+    def test_get_or_create_categoria(self):
         slugs_dict = deepcopy(CATEGORIA_FROM_TO_SLUG)
         categoria_name, categoria_slug = slugs_dict.popitem()
         m_categoria = mommy.prepare(
             CategoriaContrato, name=categoria_name, _fill_optional=True)
         self.m_categorias_dao.get_or_create.return_value = (m_categoria, True)
 
-        m_execucao = mommy.prepare(ExecucaoContrato, categoria=None,
-                                   _fill_optional=True)
-        self.m_execucoes_dao.filter_by_indexer.return_value = [m_execucao]
-
-        fromto = mommy.prepare(
-            CategoriaContratoFromTo, categoria_name=categoria_name,
-            _fill_optional=True)
-        self.uc._apply_fromto(fromto)
+        ret = self.uc._get_or_create_categoria(categoria_name, 'desc')
 
+        assert m_categoria == ret
         self.m_categorias_dao.get_or_create.assert_called_once_with(
-            name=fromto.categoria_name,
+            name=categoria_name,
             defaults={
-                'desc': fromto.categoria_desc,
+                'desc': 'desc',
                 'slug': categoria_slug,
             })
-        self.m_execucoes_dao.filter_by_indexer.assert_called_once_with(
-            fromto.indexer)
-        self.m_execucoes_dao.update_with.assert_called_once_with(
-            execucao=m_execucao, categoria_id=m_categoria.id)
+        self.m_categorias_dao.update_with.assert_not_called()
 
-    def test_apply_fromto_fills_slug_when_category_exists(self):
+    def test_get_or_create_categoria_fills_slug_when_category_exists(self):
         slugs_dict = deepcopy(CATEGORIA_FROM_TO_SLUG)
         categoria_name, categoria_slug = slugs_dict.popitem()
         m_categoria = mommy.prepare(
@@ -159,26 +172,14 @@ class TestApplyCategoriasContratosFromToUseCase(TestCase):
             _fill_optional=True)
         self.m_categorias_dao.get_or_create.return_value = (m_categoria, False)
 
-        m_execucao = mommy.prepare(ExecucaoContrato, categoria=None,
-                                   _fill_optional=True)
-        self.m_execucoes_dao.filter_by_indexer.return_value = [m_execucao]
-
-        fromto = mommy.prepare(
-            CategoriaContratoFromTo, categoria_name=categoria_name,
-            _fill_optional=True)
-        self.uc._apply_fromto(fromto)
+        self.uc._get_or_create_categoria(categoria_name, 'desc')
 
         self.m_categorias_dao.get_or_create.assert_called_once_with(
-            name=fromto.categoria_name,
+            name=categoria_name,
             defaults={
-                'desc': fromto.categoria_desc,
+                'desc': 'desc',
                 'slug': categoria_slug,
             })
         # assert fills slug
         self.m_categorias_dao.update_with.assert_called_once_with(
             m_categoria, slug=categoria_slug)
-
-        self.m_execucoes_dao.filter_by_indexer.assert_called_once_with(
-            fromto.indexer)
-        self.m_execucoes_dao.update_with.assert_called_once_with(
-            execucao=m_execucao, categoria_id=m_categoria.id)
@@ -1,12 +1,14 @@
 from datetime import date
-from django.test import RequestFactory
+from itertools import cycle
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 
 from model_mommy import mommy
 from rest_framework.test import APITestCase
 
-from contratos.models import EmpenhoSOFCache
+from contratos.models import EmpenhoSOFCache, ExecucaoContrato
 from contratos.serializers import EmpenhoSOFCacheSerializer
+from global_app import metadata
 
 
 class TestHomeView(APITestCase):
@@ -85,6 +87,57 @@ class TestHomeView(APITestCase):
         assert 400 == response.status_code
 
 
+class TestHomeViewQueries(APITestCase):
+
+    def get(self, **kwargs):
+        url = reverse('contratos:home')
+        return self.client.get(url, kwargs)
+
+    def setUp(self):
+        metadata.clear_cache()
+
+    def tearDown(self):
+        metadata.clear_cache()
+
+    @override_settings(DATASET_METADATA_CACHE_TIMEOUT=60)
+    def test_number_of_queries_doesnt_depend_on_data(self):
+        categorias = mommy.make('CategoriaContrato', _quantity=3)
+        mommy.make('ExecucaoContrato', year=date(2019, 1, 1),
+                   categoria=cycle(categorias), _quantity=6)
+        ExecucaoContrato.objects.update_metadata()
+
+        # year totals by categoria and top5
+        with self.assertNumQueries(2):
+            response = self.get(format='json')
+
+        assert 3 == len(response.data['destinations'])
+        assert 5 == len(response.data['top5'])
+
+
+class TestHomeViewConditionalGet(APITestCase):
+
+    def get(self, **kwargs):
+        url = reverse('contratos:home')
+        return self.client.get(url, **kwargs)
+
+    def test_returns_not_modified_when_etag_matches(self):
+        mommy.make('ExecucaoContrato', _fill_optional=True)
+        response = self.get()
+        assert 200 == response.status_code
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        assert 304 == response.status_code
+
+    def test_etag_changes_when_data_is_updated(self):
+        mommy.make('ExecucaoContrato', _fill_optional=True)
+        etag = self.get()['ETag']
+
+        mommy.make('ExecucaoContrato', _fill_optional=True)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        assert 200 == response.status_code
+        assert etag != response['ETag']
+
+
 class TestHomeViewCategory(APITestCase):
 
     def get(self, **kwargs):
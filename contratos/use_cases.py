@@ -8,6 +8,7 @@ from contratos.constants import CATEGORIA_FROM_TO_SLUG, GENERATED_XLSX_PATH
 
 
 class GenerateExecucoesContratosUseCase:
+    batch_size = 5000
 
     def __init__(self, empenhos_dao, execucoes_dao, modalidades_dao,
                  objetos_dao, fornecedores_dao):
@@ -18,32 +19,60 @@ class GenerateExecucoesContratosUseCase:
         self.fornecedores_dao = fornecedores_dao
 
     def execute(self):
-        self.execucoes_dao.erase_all()
-
-        for empenho in self.empenhos_dao.get_all():
-            self._create_execucao_by_empenho(empenho=empenho)
-
-    def _create_execucao_by_empenho(self, empenho):
-        modalidade, _ = self.modalidades_dao.get_or_create(
-            id=empenho.codModalidadeContrato,
-            desc=empenho.txtDescricaoModalidadeContrato)
-        objeto_contrato, _ = self.objetos_dao.get_or_create(
-            desc=empenho.txtObjetoContrato)
-        fornecedor, _ = self.fornecedores_dao.get_or_create(
-            razao_social=empenho.txtRazaoSocial)
-
-        execucao_data = {
+        objetos_ids, fornecedores_ids = self._create_related_objects()
+
+        execucoes_data = (
+            self._build_execucao_data(empenho, objetos_ids, fornecedores_ids)
+            for empenho in self.empenhos_dao.iterate_all(self.batch_size))
+        self.execucoes_dao.replace_all(execucoes_data,
+                                       batch_size=self.batch_size)
+
+    def _create_related_objects(self):
+        """
+        Cria de uma vez as modalidades, objetos e fornecedores que ainda não
+        existem. Retorna os ids de objetos e fornecedores indexados pela
+        descrição e razão social.
+        """
+        modalidades = {}
+        objetos = set()
+        fornecedores = set()
+        for values in self.empenhos_dao.iterate_contratos_related_values():
+            modalidade_id, modalidade_desc, objeto, fornecedor = values
+            modalidades.setdefault(modalidade_id, modalidade_desc)
+            objetos.add(objeto)
+            fornecedores.add(fornecedor)
+
+        existing_modalidades = self.modalidades_dao.get_all_ids()
+        self.modalidades_dao.bulk_create([
+            {"id": id_, "desc": desc} for id_, desc in modalidades.items()
+            if id_ not in existing_modalidades])
+
+        objetos_ids = self.objetos_dao.get_ids_by_desc()
+        created = self.objetos_dao.bulk_create([
+            {"desc": desc} for desc in objetos if desc not in objetos_ids])
+        objetos_ids.update({objeto.desc: objeto.id for objeto in created})
+
+        fornecedores_ids = self.fornecedores_dao.get_ids_by_razao_social()
+        created = self.fornecedores_dao.bulk_create([
+            {"razao_social": razao_social} for razao_social in fornecedores
+            if razao_social not in fornecedores_ids])
+        fornecedores_ids.update(
+            {fornecedor.razao_social: fornecedor.id for fornecedor in created})
+
+        return objetos_ids, fornecedores_ids
+
+    def _build_execucao_data(self, empenho, objetos_ids, fornecedores_ids):
+        return {
             "cod_contrato": empenho.codContrato,
             "empenho_indexer": empenho.indexer,
             "year": datetime.strptime(str(empenho.anoEmpenho), "%Y"),
             "valor_empenhado": empenho.valEmpenhadoLiquido,
             "valor_liquidado": empenho.valLiquidado,
-            "modalidade_id": modalidade.id,
-            "objeto_contrato_id": objeto_contrato.id,
-            "fornecedor_id": fornecedor.id,
+            "modalidade_id": empenho.codModalidadeContrato,
+            "objeto_contrato_id": objetos_ids[empenho.txtObjetoContrato],
+            "fornecedor_id": fornecedores_ids[empenho.txtRazaoSocial],
             "empenho_id": empenho.id,
         }
-        return self.execucoes_dao.create(**execucao_data)
 
 
 class ApplyCategoriasContratosFromToUseCase:
@@ -54,25 +83,23 @@ class ApplyCategoriasContratosFromToUseCase:
         self.categorias_dao = categorias_dao
 
     def execute(self):
-        for fromto in self.categorias_fromto_dao.get_all():
-            self._apply_fromto(fromto)
+        for name, desc in self.categorias_fromto_dao.get_categorias():
+            self._get_or_create_categoria(name, desc)
+
+        self.execucoes_dao.apply_categorias_fromto()
 
-    def _apply_fromto(self, fromto):
-        categoria_slug = CATEGORIA_FROM_TO_SLUG.get(fromto.categoria_name, None)
+    def _get_or_create_categoria(self, name, desc):
+        categoria_slug = CATEGORIA_FROM_TO_SLUG.get(name, None)
         categoria, created = self.categorias_dao.get_or_create(
-            name=fromto.categoria_name,
+            name=name,
             defaults={
-                "desc": fromto.categoria_desc,
+                "desc": desc,
                 "slug": categoria_slug,
             })
         if not created and not categoria.slug:
             self.categorias_dao.update_with(
                 categoria, slug=categoria_slug)
-
-        execucoes = self.execucoes_dao.filter_by_indexer(fromto.indexer)
-        data = {"categoria_id": categoria.id}
-        for execucao in execucoes:
-            self.execucoes_dao.update_with(execucao=execucao, **data)
+        return categoria
 
 
 class GenerateXlsxFilesUseCase:
@@ -81,45 +108,50 @@ class GenerateXlsxFilesUseCase:
         self.empenhos_dao = empenhos_dao
         self.data_handler = data_handler
 
-    def execute(self):
-        curr_year = date.today().year
-        for year in range(2018, curr_year + 1):
+    def execute(self, years=None):
+        if years is None:
+            years = range(2018, date.today().year + 1)
+        for year in years:
             print(f'Genarating for year {year}')
-
-            empenhos = self.empenhos_dao \
-                .filter_by_ano_empenho_and_categoria(year) \
-                .order_by('codContrato')
-            if not empenhos:
+            if not self._generate_spreadsheet_for_year(year):
                 return
 
-            filename = f'contratos_{year}.xlsx'
-            filepath = os.path.join(GENERATED_XLSX_PATH, filename)
-            workbook = self.data_handler.Workbook(write_only=True)
-            sheet = workbook.create_sheet(index=0, title=str(year))
-
-            fields_names = [field.name for field in empenhos.model._meta.fields]
-            fields_names.pop(0)  # removing id
-
-            fields_list = [field if 'Contrato' in field else f'{field}_empenho'
-                           for field in fields_names]
-            fields_list.append('Categoria')
-            sheet.append(fields_list)
-
-            paginator = Paginator(empenhos, 5000)
-            for page_num in range(paginator.num_pages):
-                page = paginator.get_page(page_num)
-                empenhos = page.object_list
-                print(f'getting chunk {page_num + 1}/{paginator.num_pages}')
-                for empenho in empenhos:
-                    empenho_row = [getattr(empenho, field)
-                                   for field in fields_names]
-                    execucao = empenho.execucaocontrato
-                    if execucao and execucao.categoria:
-                        categoria = execucao.categoria.name
-                    else:
-                        categoria = ""
-                    empenho_row.append(categoria)
-                    sheet.append(empenho_row)
-            print('Writing to file')
-            workbook.save(filepath)
-            print(f'Spreadsheet generated: {filepath}')
+    def _generate_spreadsheet_for_year(self, year):
+        empenhos = self.empenhos_dao \
+            .filter_by_ano_empenho_and_categoria(year) \
+            .order_by('codContrato')
+        if not empenhos:
+            return False
+
+        filename = f'contratos_{year}.xlsx'
+        filepath = os.path.join(GENERATED_XLSX_PATH, filename)
+        workbook = self.data_handler.Workbook(write_only=True)
+        sheet = workbook.create_sheet(index=0, title=str(year))
+
+        fields_names = [field.name for field in empenhos.model._meta.fields]
+        fields_names.pop(0)  # removing id
+
+        fields_list = [field if 'Contrato' in field else f'{field}_empenho'
+                       for field in fields_names]
+        fields_list.append('Categoria')
+        sheet.append(fields_list)
+
+        paginator = Paginator(empenhos, 5000)
+        for page_num in range(paginator.num_pages):
+            page = paginator.get_page(page_num)
+            empenhos = page.object_list
+            print(f'getting chunk {page_num + 1}/{paginator.num_pages}')
+            for empenho in empenhos:
+                empenho_row = [getattr(empenho, field)
+                               for field in fields_names]
+                execucao = empenho.execucaocontrato
+                if execucao and execucao.categoria:
+                    categoria = execucao.categoria.name
+                else:
+                    categoria = ""
+                empenho_row.append(categoria)
+                sheet.append(empenho_row)
+        print('Writing to file')
+        workbook.save(filepath)
+        print(f'Spreadsheet generated: {filepath}')
+        return True
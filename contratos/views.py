@@ -2,32 +2,48 @@ import os
 
 from datetime import date
 
-from django.http import HttpResponse, Http404
-from django_filters import rest_framework as filters
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django_filters import rest_framework as filters, utils
 from rest_framework import generics
 from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
+from rest_framework.response import Response
 
 from contratos.constants import GENERATED_XLSX_PATH
 from contratos.models import ExecucaoContrato, CategoriaContrato
 from contratos.serializers import ExecucaoContratoSerializer
+from global_app.http import conditional_view, serve_file
+from global_app.profiling import profile_section
+
+
+def execucoes_last_modified(request, *args, **kwargs):
+    return ExecucaoContrato.objects.get_last_modified()
 
 
 class ExecucaoContratoFilter(filters.FilterSet):
-    year = filters.AllValuesFilter(field_name='year__year', empty_label=None)
+    year = filters.ChoiceFilter(method='filter_year', empty_label=None)
     category = filters.ModelChoiceFilter(
         queryset=CategoriaContrato.objects.all(), field_name='categoria',
         empty_label='Todas categorias')
 
     def __init__(self, data=None, queryset=None, *args, **kwargs):
         super().__init__(data=data, queryset=queryset, *args, **kwargs)
+        # years come from the dataset metadata, not from a distinct query
+        self.filters['year'].extra['choices'] = [
+            (year, year) for year in ExecucaoContrato.objects.get_years()]
         if 'year' not in self.data:
-            ordered = queryset.order_by('-year__year')
-            year = ordered.values_list('year__year', flat=True).first()
+            year = ExecucaoContrato.objects.get_newest_year()
 
             data = self.data.copy()
             data['year'] = year
             self.data = data
 
+    def filter_year(self, queryset, name, value):
+        # a date range instead of `year__year` so the index on year is used
+        year = int(value)
+        return queryset.filter(year__gte=date(year, 1, 1),
+                               year__lt=date(year + 1, 1, 1))
+
     class Meta:
         model = ExecucaoContrato
         fields = ['year', 'category']
@@ -42,16 +58,12 @@ class FilteredTemplateHTMLRenderer(TemplateHTMLRenderer):
         """
         data = super().get_template_context(data, renderer_context)
         view = renderer_context['view']
-        request = renderer_context['request']
-
-        filter_backend = view.filter_backends[0]()
-        qs = view.get_queryset()
-        filterset = filter_backend.get_filterset(request, qs, view)
-        data['filter_form'] = filterset.form
+        data['filter_form'] = view.filterset.form
 
         return data
 
 
+@method_decorator(conditional_view(execucoes_last_modified), name='dispatch')
 class HomeView(generics.ListAPIView):
     renderer_classes = [FilteredTemplateHTMLRenderer, JSONRenderer]
     filter_backends = (filters.DjangoFilterBackend, )
@@ -60,41 +72,61 @@ class HomeView(generics.ListAPIView):
     serializer_class = ExecucaoContratoSerializer
     template_name = 'contratos/home.html'
 
+    def filter_queryset(self, queryset):
+        """
+        Mantém o filterset construído para que o renderer use o mesmo
+        formulário, sem construí-lo novamente
+        """
+        filter_backend = self.filter_backends[0]()
+        self.filterset = filter_backend.get_filterset(
+            self.request, queryset, self)
+        if not self.filterset.is_valid():
+            raise utils.translate_validation(self.filterset.errors)
+        return self.filterset.qs
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(queryset)
+        with profile_section('serializer'):
+            data = serializer.data
+        return Response(data)
+
     def get_serializer(self, qs_category_filtered, *args, **kwargs):
         """
         Serealiza o objeto filtrado recebido do banco
         :param qs_category_filtered: categoria filtrada
         """
-        original_qs = self.queryset
-        year = self.request.GET.get('year')
-        if not year:
-            ordered = qs_category_filtered.order_by('-year__year')
-            year = ordered.values_list('year__year', flat=True).first()
-        qs_year_filtered = self.filterset_class(dict(year=year), original_qs).qs
+        year = self.filterset.form.cleaned_data['year']
+        queryset = self.get_queryset()
+        if year:
+            qs_year_filtered = self.filterset.filter_year(
+                queryset, 'year', year)
+        else:
+            qs_year_filtered = queryset.none()
 
         serializer_class = self.get_serializer_class()
         return serializer_class(qs_year_filtered, qs_category_filtered)
 
 
-def download_view(request):
-    """
-    Inicia o download do arquivo gerado no servidor contendo os dados
-    extendidos utilizados na ferramenta.
-    :param request: objeto HTTP request.
-    """
+def get_download_filepath(request):
     if 'year' in request.GET:
         year = request.GET['year']
     else:
         year = date.today().year
 
     filename = f'contratos_{year}.xlsx'
-    filepath = os.path.join(GENERATED_XLSX_PATH, filename)
+    return os.path.join(GENERATED_XLSX_PATH, filename)
+
+
+def download_view(request):
+    """
+    Inicia o download do arquivo gerado no servidor contendo os dados
+    extendidos utilizados na ferramenta.
+    :param request: objeto HTTP request.
+    """
+    filepath = get_download_filepath(request)
     if not os.path.exists(filepath):
         raise Http404
 
-    with open(filepath, 'rb') as fh:
-        response = HttpResponse(
-            fh.read(), content_type="application/vnd.ms-excel")
-        response['Content-Disposition'] = (
-            'inline; filename=' + os.path.basename(filepath))
-        return response
+    return serve_file(request, filepath,
+                      content_type="application/vnd.ms-excel")
@@ -0,0 +1,16 @@
+"""
+Celery application running the ETL pipelines defined in the apps' `tasks`
+modules. Start a worker with:
+
+$ celery -A core worker -l info
+"""
+import os
+
+from celery import Celery
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings.base')
+
+app = Celery('core')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -15,6 +15,7 @@ import os
 
 from decouple import config, Csv
 from dj_database_url import parse as db_url
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -56,6 +57,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'global_app.profiling.RequestProfilingMiddleware',
+    'global_app.db_routing.ReplicaMiddleware',
+    'global_app.prerender.PrerenderedPagesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +109,20 @@ DATABASES = {
     )
 }
 
+# Optional read replica. GET requests to the views of DATABASE_REPLICA_APPS
+# read from it, the ETL, the admin and the writes use the default database.
+# After a write the client reads from the default database for
+# DATABASE_REPLICA_PIN_SECONDS, while the replica catches up.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = db_url(DATABASE_REPLICA_URL)
+    # the tests read the replica from the test database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['global_app.db_routing.ReplicaRouter']
+DATABASE_REPLICA_APPS = ['mosaico', 'geologia', 'contratos', 'regionalizacao']
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS',
+                                      default=10, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -173,6 +191,9 @@ ORCAMENTO_EMPENHOS_RAW_DUMP_DIR_PATH = config(
 ORCAMENTO_EMPENHOS_RAW_DUMP_FILENAME = config(
     'ORCAMENTO_EMPENHOS_RAW_DUMP_FILENAME',
     default='orcamento_empenhos_dump.zip')
+# columnar dumps written by the export_dumps script and read by import_dumps
+COLUMNAR_DUMPS_DIR = config('COLUMNAR_DUMPS_DIR',
+                            default=os.path.join(BASE_DIR, '../data/dumps'))
 categoria_from_to_json = config(
     'CATEGORIA_FROM_TO_SLUG_STR',
     default=(
@@ -186,6 +207,90 @@ categoria_from_to_json = config(
 )
 CATEGORIA_FROM_TO_SLUG = json.loads(categoria_from_to_json)
 
+# Seconds the dataset metadata registry is kept in each process before it's
+# read again from the database
+DATASET_METADATA_CACHE_TIMEOUT = config(
+    'DATASET_METADATA_CACHE_TIMEOUT', default=300, cast=int)
+
+
+# Generated spreadsheets can be sent by the web server instead of Django.
+# 'nginx' uses X-Accel-Redirect to DOWNLOADS_SENDFILE_URL, an internal
+# location pointing to DOWNLOADS_SENDFILE_ROOT. 'apache' uses X-Sendfile.
+DOWNLOADS_SENDFILE = config('DOWNLOADS_SENDFILE', default='')
+if DOWNLOADS_SENDFILE not in ('', 'nginx', 'apache'):
+    raise ImproperlyConfigured(
+        "DOWNLOADS_SENDFILE must be 'nginx', 'apache' or empty, not "
+        f"{DOWNLOADS_SENDFILE!r}")
+DOWNLOADS_SENDFILE_ROOT = config('DOWNLOADS_SENDFILE_ROOT',
+                                 default=os.path.dirname(BASE_DIR))
+DOWNLOADS_SENDFILE_URL = config('DOWNLOADS_SENDFILE_URL',
+                                default='/protected/')
+
+# Spreadsheets built on request are kept in memory up to this size (in bytes)
+# and then spooled to a temporary file
+DOWNLOADS_SPOOL_MAX_SIZE = config('DOWNLOADS_SPOOL_MAX_SIZE',
+                                  default=10 * 1024 * 1024, cast=int)
+
+# The pages of the public views are pre-rendered to this directory after
+# each ETL (when it's set) and served from it until the data changes. At
+# most PRERENDER_MAX_PAGES pages of each app are rendered and the
+# PRERENDER_KEEP_VERSIONS newest versions are kept.
+PRERENDER_ROOT = config('PRERENDER_ROOT', default='')
+PRERENDER_MAX_PAGES = config('PRERENDER_MAX_PAGES', default=100000, cast=int)
+PRERENDER_KEEP_VERSIONS = config('PRERENDER_KEEP_VERSIONS', default=2,
+                                 cast=int)
+
+# Per request profiling (queries, database time, view, serializer and render
+# times, response size), sent in the Server-Timing header and logged as JSON.
+# Budgets are limits by url name ('*' for any view), like
+# {"geologia:home": {"queries": 20, "db": 200, "total": 1000, "size": 500000}}
+# with times in milliseconds and size in bytes. Views over their budget are
+# logged as warnings or, when strict, raise an error.
+REQUEST_PROFILING = config('REQUEST_PROFILING', default=False, cast=bool)
+REQUEST_PROFILING_BUDGETS = json.loads(
+    config('REQUEST_PROFILING_BUDGETS', default='{}'))
+REQUEST_PROFILING_STRICT = config('REQUEST_PROFILING_STRICT', default=False,
+                                  cast=bool)
+REQUEST_PROFILING_SLOWEST_QUERIES = config(
+    'REQUEST_PROFILING_SLOWEST_QUERIES', default=3, cast=int)
+
+# Each ETL script run writes a JSON report with the duration, rows, rows per
+# second, queries and peak memory of its stages to this directory. With a
+# Pushgateway url, the same metrics are pushed to Prometheus.
+ETL_REPORTS_DIR = config('ETL_REPORTS_DIR',
+                         default=os.path.join(BASE_DIR, '../etl_reports'))
+ETL_METRICS_PUSHGATEWAY_URL = config('ETL_METRICS_PUSHGATEWAY_URL',
+                                     default='')
+
+# Celery runs the ETL pipelines (budget_execution, contratos and
+# regionalizacao `tasks` modules) splitting independent work, like each year's
+# imports, between the workers. Chords need a result backend shared by the
+# workers, like redis or a database.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://')
+CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND',
+                               default='cache+memory://')
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False,
+                                  cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+# contratos sent to the SOF API by each task
+ETL_SOF_CONTRATOS_PER_TASK = config('ETL_SOF_CONTRATOS_PER_TASK', default=200,
+                                    cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'global_app.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # REGIONALIZACAO CONFIG
 EOL_API_URL = config(
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from .base import *
 
 
@@ -5,3 +8,18 @@ MIGRATION_MODULES = {
     'from_to_handler': None,
     'budget_execution': None,
 }
+
+# test cases run inside transactions that are rolled back, so the metadata
+# registry must not outlive them
+DATASET_METADATA_CACHE_TIMEOUT = 0
+
+# views over a budget set by the tests fail instead of only being logged
+REQUEST_PROFILING_STRICT = True
+
+# the ETL pipelines run in the test process, one task after the other
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+CELERY_TASK_ALWAYS_EAGER = True
+
+# the reports of the ETL runs made by the tests are kept out of the repo
+ETL_REPORTS_DIR = os.path.join(tempfile.gettempdir(), 'etl_reports')
@@ -3,7 +3,8 @@ from decimal import Decimal
 from django.db.models import Sum
 from rest_framework import serializers
 
-from budget_execution.models import Execucao, GndGeologia, Subfuncao
+from budget_execution import labels
+from budget_execution.models import Execucao, GndGeologia, Subfuncao, Subgrupo
 from from_to_handler.models import Deflator
 from geologia.exceptions import InvalidChartOptionException
 
@@ -165,7 +166,7 @@ class GeologiaSerializer:
         return ret
 
     def get_subgrupo_orcado_data(self, qs):
-        subgrupo = qs[0].subgrupo
+        subgrupo_id = qs[0].subgrupo_id
         year = qs[0].year
 
         orcado_by_gnd = qs.values('gnd_geologia__desc', 'gnd_geologia__slug') \
@@ -177,13 +178,13 @@ class GeologiaSerializer:
                                                  year)
 
         return {
-            "subgrupo": subgrupo.desc,
+            "subgrupo": labels.get_label(Subgrupo, subgrupo_id),
             "total": orcado_total,
             "gnds": orcado_gnds,
         }
 
     def get_subgrupo_empenhado_data(self, qs):
-        subgrupo = qs[0].subgrupo
+        subgrupo_id = qs[0].subgrupo_id
         year = qs[0].year
 
         empenhado_by_gnd = qs \
@@ -196,7 +197,7 @@ class GeologiaSerializer:
             empenhado_by_gnd, empenhado_total, year)
 
         return {
-            "subgrupo": subgrupo.desc,
+            "subgrupo": labels.get_label(Subgrupo, subgrupo_id),
             "total": empenhado_total,
             "gnds": empenhado_gnds,
         }
@@ -1,3 +1,4 @@
+from django.utils.decorators import method_decorator
 from drf_renderer_xlsx.renderers import XLSXRenderer
 from rest_framework import generics
 from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
@@ -7,8 +8,15 @@ from rest_framework_csv.renderers import CSVRenderer
 from budget_execution.constants import SME_ORGAO_ID
 from budget_execution.models import Execucao
 from geologia.serializers import GeologiaSerializer, GeologiaDownloadSerializer
+from global_app.http import conditional_view
+from global_app.profiling import profile_section
 
 
+def execucoes_last_modified(request, *args, **kwargs):
+    return Execucao.objects.get_last_modified()
+
+
+@method_decorator(conditional_view(execucoes_last_modified), name='dispatch')
 class HomeView(generics.ListAPIView):
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
     template_name = 'geologia/base.html'
@@ -20,9 +28,12 @@ class HomeView(generics.ListAPIView):
         qs = self.get_queryset()
         subfuncao_id = self.request.GET.get('subfuncao_id', None)
         serializer = self.get_serializer(qs, subfuncao_id=subfuncao_id)
-        return Response(serializer.data)
+        with profile_section('serializer'):
+            data = serializer.data
+        return Response(data)
 
 
+@method_decorator(conditional_view(execucoes_last_modified), name='dispatch')
 class DownloadView(generics.ListAPIView):
     renderer_classes = [XLSXRenderer, CSVRenderer]
     queryset = Execucao.objects.filter(is_minimo_legal=False,
@@ -46,5 +57,7 @@ class DownloadView(generics.ListAPIView):
         headers = {
             'Content-Disposition': f'attachment; filename={filename}'
         }
-        response = Response(serializer.data, headers=headers)
+        with profile_section('serializer'):
+            data = serializer.data
+        response = Response(data, headers=headers)
         return response
@@ -0,0 +1,330 @@
+"""
+Benchmarks of the public views and of the ETL stages, run by
+scripts/benchmark.py. Each case is measured for wall time, number of
+queries and peak memory (traced by tracemalloc), and the results are written
+as JSON so runs can be compared.
+"""
+import json
+import platform
+import time
+import tracemalloc
+
+from collections import namedtuple
+from datetime import datetime
+from statistics import median
+
+from django.db import connection
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+
+from global_app.queries import QueryCounter
+
+
+BenchmarkCase = namedtuple('BenchmarkCase', ['group', 'name', 'func', 'setup'])
+BenchmarkCase.__new__.__defaults__ = (None, )
+
+MOSAICO_DOWNLOAD_SECTIONS = ['grupos', 'subgrupos', 'elementos',
+                             'subelementos', 'subfuncoes', 'programas',
+                             'projetos']
+GEOLOGIA_CHARTS = ['camadas', 'subfuncao', 'subgrupo']
+
+
+class SkipCase(Exception):
+    """Raised by a case that can't run with the current data or urls"""
+
+
+def measure(func, repeat=1, trace_memory=True):
+    """
+    Runs `func` `repeat` times. Returns the median and every wall time (in
+    seconds), the queries of the last run and the highest peak memory (in
+    bytes) allocated by python. Tracing the memory slows down the runs, so
+    it can be turned off when only times are compared.
+    """
+    wall_times = []
+    queries = None
+    peak_memory = None
+    for _ in range(repeat):
+        counter = QueryCounter()
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                func()
+                wall_times.append(time.perf_counter() - start)
+        finally:
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                peak_memory = max(peak_memory or 0, peak)
+                tracemalloc.stop()
+        queries = counter.count
+
+    return {
+        'wall_time': median(wall_times),
+        'wall_times': wall_times,
+        'queries': queries,
+        'peak_memory': peak_memory,
+    }
+
+
+def run_cases(cases, repeat=1, trace_memory=True):
+    results = []
+    for case in cases:
+        result = {'group': case.group, 'name': case.name}
+        try:
+            if case.setup:
+                case.setup()
+            result.update(measure(case.func, repeat, trace_memory))
+            result['status'] = 'ok'
+        except SkipCase as e:
+            result.update(status='skipped', reason=str(e))
+        except Exception as e:
+            result.update(status='error', reason=repr(e))
+
+        print(_format_result(result))
+        results.append(result)
+    return results
+
+
+def write_report(results, output, **params):
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'params': params,
+        'results': results,
+    }
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2, default=str)
+    return report
+
+
+def _format_result(result):
+    name = f'{result["group"]}: {result["name"]}'
+    if result['status'] != 'ok':
+        return f'{name} {result["status"]} ({result["reason"]})'
+    memory = result['peak_memory']
+    memory = f'{memory / 2 ** 20:.1f}MiB' if memory is not None else '-'
+    return (f'{name} {result["wall_time"]:.3f}s, '
+            f'{result["queries"]} queries, {memory}')
+
+
+# views
+
+def get_view(client, urlname, args=None, **params):
+    """Case function requesting a view and reading its whole response"""
+    def func():
+        if None in (args or []) or None in params.values():
+            raise SkipCase(f'no data for {urlname}')
+        try:
+            url = reverse(urlname, args=args)
+        except NoReverseMatch:
+            raise SkipCase(f'{urlname} is not routed')
+
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise AssertionError(f'{url} returned {response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return func
+
+
+def view_cases(client=None):
+    client = client or Client()
+    return (_mosaico_cases(client) + _geologia_cases(client) +
+            _contratos_cases(client) + _regionalizacao_cases(client))
+
+
+def _mosaico_cases(client):
+    from budget_execution.models import Execucao
+
+    execucao = Execucao.objects.filter(subgrupo__isnull=False).first()
+    grupo = execucao.subgrupo.grupo_id if execucao else None
+    subgrupo = execucao.subgrupo_id if execucao else None
+    elemento = execucao.elemento_id if execucao else None
+    subfuncao = execucao.subfuncao_id if execucao else None
+    programa = execucao.programa_id if execucao else None
+    year = Execucao.objects.get_newest_year()
+
+    cases = [
+        BenchmarkCase('mosaico', 'grupos',
+                      get_view(client, 'mosaico:grupos')),
+        BenchmarkCase('mosaico', 'subgrupos',
+                      get_view(client, 'mosaico:subgrupos', [grupo])),
+        BenchmarkCase('mosaico', 'elementos',
+                      get_view(client, 'mosaico:elementos',
+                               [grupo, subgrupo])),
+        BenchmarkCase('mosaico', 'subelementos',
+                      get_view(client, 'mosaico:subelementos',
+                               [grupo, subgrupo, elemento])),
+        BenchmarkCase('mosaico', 'subfuncoes',
+                      get_view(client, 'mosaico:subfuncoes')),
+        BenchmarkCase('mosaico', 'programas',
+                      get_view(client, 'mosaico:programas', [subfuncao])),
+        BenchmarkCase('mosaico', 'projetos',
+                      get_view(client, 'mosaico:projetos',
+                               [subfuncao, programa])),
+    ]
+    for section in MOSAICO_DOWNLOAD_SECTIONS:
+        for file_format in ('csv', 'xlsx'):
+            cases.append(BenchmarkCase(
+                'mosaico', f'download {section} {file_format}',
+                get_view(client, 'mosaico:download', [section],
+                         format=file_format)))
+        cases.append(BenchmarkCase(
+            'mosaico', f'download {section} csv filtered',
+            get_view(client, 'mosaico:download', [section], format='csv',
+                     year=year, filter=True)))
+    return cases
+
+
+def _geologia_cases(client):
+    from budget_execution.models import Execucao
+
+    execucao = Execucao.objects.first()
+    subfuncao = execucao.subfuncao_id if execucao else None
+
+    cases = [
+        BenchmarkCase('geologia', 'home', get_view(client, 'geologia:home')),
+        BenchmarkCase('geologia', 'home subfuncao',
+                      get_view(client, 'geologia:home',
+                               subfuncao_id=subfuncao)),
+    ]
+    for chart in GEOLOGIA_CHARTS:
+        cases.append(BenchmarkCase(
+            'geologia', f'download {chart}',
+            get_view(client, 'geologia:download', [chart], format='csv')))
+    return cases
+
+
+def _contratos_cases(client):
+    from contratos.models import ExecucaoContrato
+
+    years = ExecucaoContrato.objects.get_years()
+    cases = [
+        BenchmarkCase('contratos', 'home', get_view(client, 'contratos:home')),
+    ]
+    if years:
+        cases.append(BenchmarkCase(
+            'contratos', 'home oldest year',
+            get_view(client, 'contratos:home', year=years[0])))
+    return cases
+
+
+def _regionalizacao_cases(client):
+    from regionalizacao.models import EscolaInfo
+
+    info = EscolaInfo.objects \
+        .filter(rede='DIR', tipoesc__etapa__isnull=False) \
+        .select_related('distrito', 'dre', 'escola').order_by('-year').first()
+    if not info:
+        return [BenchmarkCase('regionalizacao', 'home',
+                              get_view(client, 'regionalizacao:home'))]
+
+    levels = [
+        ('home', {}),
+        ('zona', {'zona': info.distrito.zona}),
+        ('dre', {'localidade': 'dre', 'dre': info.dre.code}),
+        ('distrito', {'zona': info.distrito.zona,
+                      'distrito': info.distrito.coddist}),
+        ('escola', {'zona': info.distrito.zona,
+                    'distrito': info.distrito.coddist,
+                    'escola': info.escola.codesc}),
+    ]
+    return [
+        BenchmarkCase('regionalizacao', name,
+                      get_view(client, 'regionalizacao:home', year=info.year,
+                               **params))
+        for name, params in levels
+    ]
+
+
+# ETL stages. They change the data, so they run in this order, once.
+
+def etl_cases():
+    return _budget_etl_cases() + _contratos_etl_cases() + \
+        _regionalizacao_etl_cases()
+
+
+def _budget_etl_cases():
+    from budget_execution import services
+    from mosaico.services import generate_download_files
+
+    stages = [
+        services.erase_data_to_be_updated,
+        services.load_data_from_orcamento_raw,
+        services.load_data_from_empenhos_raw,
+        services.import_minimo_legal,
+        services.import_orcamentos,
+        services.import_empenhos,
+        services.update_execucao_table_from_execucao_temp,
+        services.apply_fromto,
+        services.update_execucoes_metadata,
+        generate_download_files,
+    ]
+    return [BenchmarkCase('budget_execution', stage.__name__, stage)
+            for stage in stages]
+
+
+def _contratos_etl_cases():
+    # the stages fetching the SOF API depend on the network, so the temp
+    # table is filled from the cache before the stages that read it
+    from contratos.dao.models_dao import (
+        EmpenhosSOFCacheDao, EmpenhosSOFCacheTempDao)
+    from contratos.services import domain, sof_api
+
+    daos = {'empenhos_dao': EmpenhosSOFCacheDao(),
+            'empenhos_temp_dao': EmpenhosSOFCacheTempDao()}
+    return [
+        BenchmarkCase(
+            'contratos', 'verify_table_lines_count',
+            lambda: sof_api.verify_table_lines_count(**daos),
+            setup=_fill_empenhos_sof_temp_table),
+        BenchmarkCase(
+            'contratos', 'update_empenho_sof_cache_from_temp_table',
+            lambda: sof_api.update_empenho_sof_cache_from_temp_table(**daos)),
+        BenchmarkCase('contratos', 'generate_execucoes_contratos',
+                      domain.generate_execucoes_contratos),
+        BenchmarkCase('contratos', 'generate_xlsx_files',
+                      domain.generate_xlsx_files),
+    ]
+
+
+def _fill_empenhos_sof_temp_table():
+    from contratos.models import EmpenhoSOFCache, EmpenhoSOFCacheTemp
+    from global_app.dumps import insert_objects
+
+    cache_fields = {field.name for field in EmpenhoSOFCache._meta.fields}
+    fields = [field.name for field in EmpenhoSOFCacheTemp._meta.fields
+              if not field.primary_key and field.name in cache_fields]
+    EmpenhoSOFCacheTemp.objects.all().delete()
+    insert_objects(EmpenhoSOFCacheTemp, (
+        EmpenhoSOFCacheTemp(**values) for values in
+        EmpenhoSOFCache.objects.values(*fields).iterator()))
+
+
+def _regionalizacao_etl_cases():
+    # the EOL API stage depends on the network and isn't measured
+    from regionalizacao import services
+
+    stages = [
+        services.extract_ptrf_and_recursos_spreadsheets,
+        services.apply_fromtos,
+        services.populate_escola_info_budget_data,
+        services.generate_xlsx_files,
+        services.update_dataset_metadata,
+    ]
+    return [BenchmarkCase('regionalizacao', stage.__name__, stage)
+            for stage in stages]
+
+
+def seed(execucoes, empenhos, escolas, years, random_seed=0):
+    """Loads the synthetic data measured by the view cases"""
+    from global_app import synthetic
+
+    print(f'Seeding {execucoes} execucoes')
+    synthetic.seed_execucoes(execucoes, years, seed=random_seed)
+    print(f'Seeding {empenhos} empenhos SOF cache')
+    synthetic.seed_empenhos_sof_cache(empenhos, years, seed=random_seed)
+    print(f'Seeding {escolas} escolas for {years} years')
+    synthetic.seed_escolas(escolas, years, seed=random_seed)
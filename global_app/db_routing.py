@@ -0,0 +1,101 @@
+"""
+Optional read replica, configured by DATABASE_REPLICA_URL. GET and HEAD
+requests to the views of DATABASE_REPLICA_APPS read from it, while the ETL,
+the admin and every write use the default (primary) database.
+
+After a write the client reads from the primary for
+DATABASE_REPLICA_PIN_SECONDS, while the replica catches up, and
+`primary_database` makes a view or a block of code read from the primary
+when it must see its own writes.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+
+# alias of DATABASES['replica'] in the settings
+REPLICA_DB_ALIAS = 'replica'
+PRIMARY_COOKIE = 'read_primary_db'
+SAFE_METHODS = ('GET', 'HEAD')
+
+# None reads from the database chosen by django, the primary
+_read_database = ContextVar('read_database', default=None)
+
+
+@contextmanager
+def read_from(alias):
+    """Queries in the block read from the database `alias`. It can also
+    decorate a view."""
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def primary_database():
+    return read_from(DEFAULT_DB_ALIAS)
+
+
+def replica_database():
+    return read_from(REPLICA_DB_ALIAS)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        # even for the objects read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its tables by the replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def reads_from_replica(request):
+    match = request.resolver_match
+    return (request.method in SAFE_METHODS and
+            PRIMARY_COOKIE not in request.COOKIES and
+            match is not None and
+            any(app in settings.DATABASE_REPLICA_APPS
+                for app in match.app_names))
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of the public views to the replica. It's only used when
+    the replica is configured.
+    """
+
+    def __init__(self, get_response):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _read_database.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_database.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if reads_from_replica(request):
+            # reset by __call__ when the response is returned
+            _read_database.set(REPLICA_DB_ALIAS)
@@ -0,0 +1,326 @@
+"""
+Dumps of the raw tables, the execucoes of contratos and the from-tos.
+
+The zipped loaddata json fixtures are loaded by load_fixture_zip. Unlike
+loaddata, the json is parsed while it is read from the zip, one record at a
+time, and the records are inserted in batches, with COPY on postgres, so the
+memory used doesn't grow with the size of the dump.
+
+The columnar dumps, written by export_dump and read by import_dump, are a
+directory per dump with a manifest.json, describing the tables and their
+columns, and each table in gzipped csv partitions, which postgres reads
+directly with COPY.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import zipfile
+
+from itertools import chain, groupby, islice
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+BATCH_SIZE = 5000
+READ_SIZE = 2 ** 16
+JSON_WHITESPACE = ' \t\r\n'
+
+# models of each columnar dump, in the order they are imported
+DUMPS = {
+    'orcamento_empenhos_raw': [
+        'budget_execution.OrcamentoRaw', 'budget_execution.EmpenhoRaw'],
+    'contratos_raw': ['contratos.ContratoRaw'],
+    'execucoes_contratos': [
+        'contratos.Fornecedor', 'contratos.ObjetoContrato',
+        'contratos.ModalidadeContrato', 'contratos.CategoriaContrato',
+        'contratos.ExecucaoContrato'],
+    'fromto': [
+        'from_to_handler.DotacaoFromTo',
+        'from_to_handler.FonteDeRecursoFromTo',
+        'from_to_handler.SubelementoFromTo',
+        'from_to_handler.GNDFromTo',
+        'from_to_handler.Deflator'],
+}
+DUMP_FORMAT = 'csv.gz'
+MANIFEST_FILENAME = 'manifest.json'
+ROWS_PER_PARTITION = 100000
+CSV_NULL = '\\N'
+
+
+def iter_json_array(fh, read_size=READ_SIZE):
+    """
+    Yields the items of the json array in the text file `fh`, reading
+    `read_size` characters at a time
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    started = False
+    while True:
+        separators = JSON_WHITESPACE + (',' if started else '')
+        while pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('The dump is not a json array')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # an item ending with the buffer may go on in the next read,
+                # like a number
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+        elif eof:
+            raise ValueError('The json array is not closed')
+
+        chunk = fh.read(read_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_fixture_objects(records):
+    """Model instances of the loaddata fixture records, as loaddata builds
+    them"""
+    for deserialized in Deserializer(records, ignorenonexistent=True):
+        yield deserialized.object
+
+
+def insert_objects(model, objs, batch_size=BATCH_SIZE):
+    """
+    Inserts `objs`, any iterable, as they are, one batch at a time: with COPY
+    on postgres or bulk_create on the other databases. Objects keep their
+    primary keys, or get new ones when the first object has none. Returns
+    the number of objects inserted.
+    """
+    objs = iter(objs)
+    first = next(objs, None)
+    if first is None:
+        return 0
+    objs = chain([first], objs)
+    if connection.vendor != 'postgresql':
+        # bulk_create fills the auto_now_add fields again
+        count = 0
+        while True:
+            batch = list(islice(objs, batch_size))
+            if not batch:
+                return count
+            model.objects.bulk_create(batch)
+            count += len(batch)
+
+    fields = [field for field in model._meta.concrete_fields
+              if field is not model._meta.auto_field or first.pk is not None]
+    columns = ', '.join(connection.ops.quote_name(field.column)
+                        for field in fields)
+    sql = (f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+           f"({columns}) FROM STDIN WITH (FORMAT csv, NULL '{CSV_NULL}')")
+
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    with connection.cursor() as cursor:
+        for obj in objs:
+            writer.writerow([_copy_value(field, obj) for field in fields])
+            count += 1
+            if count % batch_size == 0:
+                _copy_buffer(cursor, sql, buffer)
+        _copy_buffer(cursor, sql, buffer)
+    return count
+
+
+def _copy_value(field, obj):
+    value = getattr(obj, field.attname)
+    if value is None:
+        # the auto_now and auto_now_add fields, as save() fills them
+        value = field.pre_save(obj, add=True)
+    value = field.get_db_prep_save(value, connection)
+    return CSV_NULL if value is None else value
+
+
+def _copy_buffer(cursor, sql, buffer):
+    if not buffer.tell():
+        return
+    buffer.seek(0)
+    cursor.copy_expert(sql, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def load_fixture_zip(filepath, batch_size=BATCH_SIZE):
+    """
+    Loads the json fixture in the zip file `filepath` (its first file),
+    without extracting it, in one transaction. Returns the number of objects
+    loaded of each model.
+    """
+    counts = {}
+    with zipfile.ZipFile(filepath) as zip_file, \
+            zip_file.open(zip_file.filelist[0]) as raw, \
+            io.TextIOWrapper(raw, encoding='utf-8') as fh, \
+            transaction.atomic():
+        objs = iter_fixture_objects(iter_json_array(fh))
+        # dumps have the objects of each model together
+        for model, model_objs in groupby(objs, key=type):
+            counts[model] = counts.get(model, 0) + insert_objects(
+                model, model_objs, batch_size)
+
+        reset_sequences(list(counts))
+
+    for model, count in counts.items():
+        print(f'{count} {model._meta.label} objects loaded')
+    return counts
+
+
+def reset_sequences(models):
+    """Moves the sequences of the models after the primary keys inserted"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def export_dump(name, output_dir, rows_per_partition=ROWS_PER_PARTITION):
+    """
+    Writes the tables of the dump `name` (see DUMPS) to `output_dir/name`,
+    with up to `rows_per_partition` rows per csv file. Returns the path of
+    the manifest.
+    """
+    dump_dir = os.path.join(output_dir, name)
+    os.makedirs(dump_dir, exist_ok=True)
+    manifest = {
+        'name': name,
+        'format': DUMP_FORMAT,
+        'created_at': timezone.now().isoformat(),
+        'tables': [],
+    }
+
+    for label in DUMPS[name]:
+        model = apps.get_model(label)
+        fields = model._meta.concrete_fields
+        table = {
+            'model': model._meta.label,
+            'table': model._meta.db_table,
+            'columns': [
+                {'name': field.column, 'type': field.get_internal_type(),
+                 'null': field.null}
+                for field in fields],
+            'rows': 0,
+            'partitions': [],
+        }
+        rows = model.objects.order_by('pk') \
+            .values_list(*[field.attname for field in fields]) \
+            .iterator(chunk_size=BATCH_SIZE)
+
+        for first_row in rows:
+            filename = (f'{model._meta.label_lower}.'
+                        f'{len(table["partitions"]):05d}.{DUMP_FORMAT}')
+            count = _write_partition(
+                os.path.join(dump_dir, filename), fields,
+                chain([first_row], islice(rows, rows_per_partition - 1)))
+            table['partitions'].append({'file': filename, 'rows': count})
+            table['rows'] += count
+
+        print(f'{table["rows"]} {model._meta.label} rows exported')
+        manifest['tables'].append(table)
+
+    manifest_path = os.path.join(dump_dir, MANIFEST_FILENAME)
+    with open(manifest_path, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest_path
+
+
+def _write_partition(filepath, fields, rows):
+    count = 0
+    with gzip.open(filepath, 'wt', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow([field.column for field in fields])
+        for row in rows:
+            writer.writerow([CSV_NULL if value is None else value
+                             for value in row])
+            count += 1
+    return count
+
+
+def import_dump(dump_dir, replace=False, batch_size=BATCH_SIZE):
+    """
+    Imports the columnar dump in `dump_dir` in one transaction, deleting the
+    rows of its tables before with `replace`. Returns the number of rows
+    imported of each model.
+    """
+    with open(os.path.join(dump_dir, MANIFEST_FILENAME)) as fh:
+        manifest = json.load(fh)
+    if manifest['format'] != DUMP_FORMAT:
+        raise ValueError(f'Unknown dump format: {manifest["format"]}')
+
+    tables = [(apps.get_model(table['model']), table)
+              for table in manifest['tables']]
+    counts = {}
+    with transaction.atomic():
+        if replace:
+            for model, _ in reversed(tables):
+                model.objects.all().delete()
+
+        for model, table in tables:
+            fields = get_dump_fields(model, table)
+            count = 0
+            for partition in table['partitions']:
+                filepath = os.path.join(dump_dir, partition['file'])
+                with gzip.open(filepath, 'rt', encoding='utf-8',
+                               newline='') as fh:
+                    count += _copy_partition(model, fields, fh, batch_size)
+            if count != table['rows']:
+                raise ValueError(
+                    f'{model._meta.label}: {count} rows imported, '
+                    f'{table["rows"]} in the manifest')
+            counts[model] = count
+
+        reset_sequences(list(counts))
+
+    for model, count in counts.items():
+        print(f'{count} {model._meta.label} rows imported')
+    return counts
+
+
+def get_dump_fields(model, table):
+    """Fields of the model with the columns of the dump table, in order"""
+    fields = {field.column: field for field in model._meta.concrete_fields}
+    missing = [column['name'] for column in table['columns']
+               if column['name'] not in fields]
+    if missing:
+        raise ValueError(f'{model._meta.label} has no columns {missing}')
+    return [fields[column['name']] for column in table['columns']]
+
+
+def _copy_partition(model, fields, fh, batch_size):
+    if connection.vendor == 'postgresql':
+        columns = ', '.join(connection.ops.quote_name(field.column)
+                            for field in fields)
+        sql = (f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+               f"({columns}) FROM STDIN WITH "
+               f"(FORMAT csv, HEADER, NULL '{CSV_NULL}')")
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, fh)
+            return cursor.rowcount
+
+    reader = csv.reader(fh)
+    next(reader)
+    objs = (
+        model(**{field.attname: (None if value == CSV_NULL
+                                 else field.to_python(value))
+                 for field, value in zip(fields, row)})
+        for row in reader)
+    return insert_objects(model, objs, batch_size)
@@ -0,0 +1,284 @@
+"""
+Instrumentation of the ETL scripts. A script runs its pipeline inside
+`etl_run` and every function decorated with `etl_stage` called meanwhile is
+recorded as a stage: duration, rows in and out, rows per second, queries and
+the peak RSS of the process while it ran. Stages called by other stages are
+recorded too, with their parent.
+
+When the run ends, successfully or not, the report is written as JSON to
+ETL_REPORTS_DIR and, when ETL_METRICS_PUSHGATEWAY_URL is set, pushed to a
+Prometheus Pushgateway. Outside a run the decorated functions are just
+called.
+"""
+import functools
+import json
+import os
+import resource
+import sys
+import time
+
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+import requests
+
+from django.conf import settings
+from django.db import connections
+
+from global_app.queries import QueryCounter
+
+
+_current_run = ContextVar('etl_run', default=None)
+
+
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+
+def get_peak_rss():
+    """
+    Highest resident set size of the process since its start or the last
+    reset_peak_rss, in bytes
+    """
+    try:
+        with open(PROC_STATUS) as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the process to its current RSS. Only linux can
+    do it; returns whether it was reset.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as fh:
+            fh.write('5')
+    except OSError:
+        return False
+    return True
+
+
+class Stage:
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.status = 'running'
+        self.error = None
+        self.started_at = datetime.now()
+        self.duration = None
+        self.rows_in = None
+        self.rows_out = None
+        self.queries = None
+        self.peak_rss = None
+
+    @property
+    def rows_per_second(self):
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        if rows is None or not self.duration:
+            return None
+        return rows / self.duration
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat(),
+            'duration': self.duration,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_second': self.rows_per_second,
+            'queries': self.queries,
+            'peak_rss': self.peak_rss,
+        }
+
+
+class EtlRun:
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.status = 'running'
+        self.error = None
+        self.started_at = datetime.now()
+        self.duration = None
+        self.stages = []
+        self._active = []
+        self._start = time.perf_counter()
+        # the peak RSS is reset by each stage, so the highest one seen by the
+        # run and by the running stages is kept here
+        self._peak_rss = get_peak_rss()
+        self._stage_peaks = {}
+
+    @property
+    def peak_rss(self):
+        return max(self._peak_rss, get_peak_rss())
+
+    def _collect_peak_rss(self):
+        peak = get_peak_rss()
+        self._peak_rss = max(self._peak_rss, peak)
+        for stage in self._active:
+            if stage in self._stage_peaks:
+                self._stage_peaks[stage] = max(self._stage_peaks[stage], peak)
+
+    @contextmanager
+    def stage(self, name):
+        parent = self._active[-1].name if self._active else None
+        stage = Stage(name, parent)
+        self.stages.append(stage)
+        # the peak of the running stages is taken before it's reset
+        self._collect_peak_rss()
+        if reset_peak_rss():
+            self._stage_peaks[stage] = 0
+        self._active.append(stage)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                yield stage
+            stage.status = 'ok'
+        except Exception as e:
+            stage.status = 'error'
+            stage.error = repr(e)
+            raise
+        finally:
+            stage.duration = time.perf_counter() - start
+            stage.queries = counter.count
+            self._collect_peak_rss()
+            # without the reset the peak of the stage isn't known
+            stage.peak_rss = self._stage_peaks.pop(stage, None)
+            self._active.pop()
+            print(format_stage(stage))
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._start
+        self.status = 'error' if error else 'ok'
+        self.error = repr(error) if error else None
+
+    def as_dict(self):
+        return {
+            'pipeline': self.pipeline,
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat(),
+            'duration': self.duration,
+            'peak_rss': self.peak_rss,
+            'stages': [stage.as_dict() for stage in self.stages],
+        }
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        timestamp = self.started_at.strftime('%Y%m%d%H%M%S')
+        filepath = os.path.join(directory, f'{self.pipeline}_{timestamp}.json')
+        with open(filepath, 'w') as fh:
+            json.dump(self.as_dict(), fh, indent=2)
+        return filepath
+
+    def get_metrics(self):
+        """The run and its stages in the Prometheus text format"""
+        run_labels = f'pipeline="{self.pipeline}"'
+        lines = [
+            f'etl_run_duration_seconds{{{run_labels}}} {self.duration}',
+            f'etl_run_success{{{run_labels}}} {int(self.status == "ok")}',
+            f'etl_run_peak_rss_bytes{{{run_labels}}} {self.peak_rss}',
+        ]
+        metrics = [
+            ('etl_stage_duration_seconds', 'duration'),
+            ('etl_stage_rows_in', 'rows_in'),
+            ('etl_stage_rows_out', 'rows_out'),
+            ('etl_stage_rows_per_second', 'rows_per_second'),
+            ('etl_stage_queries', 'queries'),
+            ('etl_stage_peak_rss_bytes', 'peak_rss'),
+        ]
+        for stage in self.stages:
+            labels = f'{run_labels},stage="{stage.name}"'
+            for metric, attr in metrics:
+                value = getattr(stage, attr)
+                if value is not None:
+                    lines.append(f'{metric}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def push_metrics(self, url):
+        response = requests.put(
+            f'{url.rstrip("/")}/metrics/job/etl/pipeline/{self.pipeline}',
+            data=self.get_metrics(), timeout=10)
+        response.raise_for_status()
+
+
+def format_stage(stage):
+    name = f'{stage.parent} > {stage.name}' if stage.parent else stage.name
+    text = (f'[{stage.status}] {name}: {stage.duration:.2f}s, '
+            f'{stage.queries} queries')
+    if stage.peak_rss is not None:
+        text += f', peak RSS {stage.peak_rss / 2 ** 20:.0f}MiB'
+    if stage.rows_per_second is not None:
+        text += f', {stage.rows_per_second:.0f} rows/s'
+    return text
+
+
+@contextmanager
+def etl_run(pipeline):
+    """Records the stages called inside it and reports them when it ends"""
+    run = EtlRun(pipeline)
+    token = _current_run.set(run)
+    error = None
+    try:
+        yield run
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current_run.reset(token)
+        run.finish(error)
+        filepath = run.write(settings.ETL_REPORTS_DIR)
+        print(f'ETL report written to {filepath}')
+        if settings.ETL_METRICS_PUSHGATEWAY_URL:
+            try:
+                run.push_metrics(settings.ETL_METRICS_PUSHGATEWAY_URL)
+            except requests.RequestException as e:
+                print(f'ETL metrics could not be pushed: {e}')
+
+
+def etl_stage(func):
+    """
+    Records each call of `func` made inside an `etl_run` as a stage. An int
+    returned by it is taken as the rows out, unless record_rows set them.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _current_run.get()
+        if run is None:
+            return func(*args, **kwargs)
+
+        with run.stage(func.__name__) as stage:
+            result = func(*args, **kwargs)
+            if (stage.rows_out is None and isinstance(result, int) and
+                    not isinstance(result, bool)):
+                stage.rows_out = result
+            return result
+    return wrapper
+
+
+def record_rows(rows_in=None, rows_out=None):
+    """Sets the rows read and written by the running stage, if any"""
+    run = _current_run.get()
+    if run is None or not run._active:
+        return
+
+    stage = run._active[-1]
+    if rows_in is not None:
+        stage.rows_in = rows_in
+    if rows_out is not None:
+        stage.rows_out = rows_out
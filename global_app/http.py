@@ -0,0 +1,218 @@
+import csv
+import hashlib
+import os
+import re
+import tempfile
+
+from itertools import chain
+
+from django.conf import settings
+from django.http import (
+    FileResponse, HttpResponse, StreamingHttpResponse)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+from openpyxl import Workbook
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+SENDFILE_HEADERS = {
+    'nginx': 'X-Accel-Redirect',
+    'apache': 'X-Sendfile',
+}
+XLSX_CONTENT_TYPE = (
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
+def conditional_view(last_modified_func):
+    """
+    Answers conditional GETs (If-None-Match / If-Modified-Since) with a 304
+    before the view runs any query or reads any file. The ETag is derived
+    from the dataset timestamp returned by `last_modified_func` and from the
+    requested representation (full path and Accept header).
+    """
+    def get_last_modified(request, *args, **kwargs):
+        # etag_func and last_modified_func are both called by `condition`,
+        # so the timestamp is looked up only once per request
+        if not hasattr(request, '_dataset_last_modified'):
+            request._dataset_last_modified = last_modified_func(
+                request, *args, **kwargs)
+        return request._dataset_last_modified
+
+    def get_etag(request, *args, **kwargs):
+        last_modified = get_last_modified(request, *args, **kwargs)
+        if not last_modified:
+            return None
+
+        key = (f'{last_modified.isoformat()}|{request.get_full_path()}|'
+               f'{request.META.get("HTTP_ACCEPT", "")}')
+        return hashlib.md5(key.encode()).hexdigest()
+
+    return condition(etag_func=get_etag, last_modified_func=get_last_modified)
+
+
+def serve_file(request, filepath, content_type):
+    """
+    Serves a generated file without loading it in memory. Answers
+    conditional requests with the file mtime/size ETag and single byte
+    ranges with a 206. When DOWNLOADS_SENDFILE is set the file itself is
+    sent by the web server (nginx X-Accel-Redirect or apache X-Sendfile).
+    """
+    stat = os.stat(filepath)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    filename = os.path.basename(filepath)
+    if settings.DOWNLOADS_SENDFILE:
+        response = _sendfile_response(filepath, content_type)
+    else:
+        response = _file_response(request, filepath, content_type, etag,
+                                  stat.st_size)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Content-Disposition'] = f'inline; filename={filename}'
+    return response
+
+
+def _sendfile_response(filepath, content_type):
+    response = HttpResponse(content_type=content_type)
+    header = SENDFILE_HEADERS[settings.DOWNLOADS_SENDFILE]
+    if settings.DOWNLOADS_SENDFILE == 'nginx':
+        relpath = os.path.relpath(filepath, settings.DOWNLOADS_SENDFILE_ROOT)
+        location = settings.DOWNLOADS_SENDFILE_URL.rstrip('/') + '/' + relpath
+    else:
+        location = filepath
+    response[header] = location
+    return response
+
+
+def _file_response(request, filepath, content_type, etag, size):
+    byte_range = _get_byte_range(request, etag, size)
+    if byte_range is None:
+        response = FileResponse(open(filepath, 'rb'),
+                                content_type=content_type)
+    elif not byte_range:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(filepath, start, end), status=206,
+            content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _get_byte_range(request, etag, size):
+    """
+    Returns the (start, end) of the requested range, None when the whole
+    file must be sent (no Range, stale If-Range, an invalid range or a range
+    kind that isn't supported, like multiple ranges) or False when it can't
+    be satisfied.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # invalid, so ignored (RFC 7233, 3.1)
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+
+    if start > end:
+        return False
+    return start, end
+
+
+def _read_range(filepath, start, end):
+    with open(filepath, 'rb') as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class _Echo:
+    """Pseudo buffer that hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    """Yields the header and each row as an encoded CSV line"""
+    writer = csv.writer(_Echo())
+    for row in chain([header], rows):
+        yield writer.writerow(row).encode('utf-8')
+
+
+def write_xlsx(fileobj, header, rows, title='Report'):
+    """
+    Writes the rows to `fileobj` with a write-only workbook, so rows are
+    flushed as they are appended instead of kept as cells in memory.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def stream_csv(header, rows, filename):
+    """
+    Sends `rows` as CSV while they are read, without building the whole
+    file in memory first.
+    """
+    response = StreamingHttpResponse(
+        iter_csv(header, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def stream_xlsx(header, rows, filename):
+    """
+    Sends `rows` as XLSX. The workbook is written to a spooled temporary
+    file, which only goes to disk past DOWNLOADS_SPOOL_MAX_SIZE bytes.
+    """
+    tmp = tempfile.SpooledTemporaryFile(
+        max_size=settings.DOWNLOADS_SPOOL_MAX_SIZE)
+    write_xlsx(tmp, header, rows)
+    size = tmp.tell()
+    tmp.seek(0)
+
+    response = FileResponse(tmp, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Length'] = str(size)
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -0,0 +1,41 @@
+from time import monotonic
+
+from django.conf import settings
+
+from global_app.models import DatasetMetadata
+
+
+EXECUCOES_DATASET = 'execucoes'
+CONTRATOS_DATASET = 'contratos'
+REGIONALIZACAO_DATASET = 'regionalizacao'
+
+# {dataset: (loaded_at, DatasetMetadata or None)}
+_cache = {}
+
+
+def get_dataset_metadata(dataset):
+    """
+    Returns the DatasetMetadata of `dataset`, or None when its ETL hasn't
+    registered it yet. The result is kept in process for
+    DATASET_METADATA_CACHE_TIMEOUT seconds.
+    """
+    cached = _cache.get(dataset)
+    if cached:
+        loaded_at, metadata = cached
+        if monotonic() - loaded_at < settings.DATASET_METADATA_CACHE_TIMEOUT:
+            return metadata
+
+    metadata = DatasetMetadata.objects.filter(dataset=dataset).first()
+    _cache[dataset] = (monotonic(), metadata)
+    return metadata
+
+
+def update_dataset_metadata(dataset, dt_updated, years, row_count):
+    metadata = DatasetMetadata.objects.update_metadata(
+        dataset, dt_updated=dt_updated, years=years, row_count=row_count)
+    _cache[dataset] = (monotonic(), metadata)
+    return metadata
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-19 10:59
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetMetadata',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(max_length=50, unique=True)),
+                ('dt_updated', models.DateTimeField(null=True)),
+                ('years', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('newest_year', models.IntegerField(null=True)),
+                ('row_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'datasets metadata',
+            },
+        ),
+    ]
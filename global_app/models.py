@@ -0,0 +1,39 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+
+
+class DatasetMetadataManager(models.Manager):
+
+    def update_metadata(self, dataset, dt_updated, years, row_count):
+        years = sorted(set(years))
+        metadata, _ = self.update_or_create(
+            dataset=dataset,
+            defaults={
+                'dt_updated': dt_updated,
+                'years': years,
+                'newest_year': years[-1] if years else None,
+                'row_count': row_count,
+            })
+        return metadata
+
+
+class DatasetMetadata(models.Model):
+    """
+    Summary of a dataset written by its ETL at the end of each run, so the
+    views don't need to scan the data tables to know when they were updated
+    or which years are available.
+    """
+    dataset = models.CharField(max_length=50, unique=True)
+    dt_updated = models.DateTimeField(null=True)
+    years = ArrayField(models.IntegerField(), default=list)
+    newest_year = models.IntegerField(null=True)
+    row_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DatasetMetadataManager()
+
+    class Meta:
+        verbose_name_plural = 'datasets metadata'
+
+    def __str__(self):
+        return self.dataset
@@ -0,0 +1,379 @@
+"""
+Pre-rendered pages of the public views. After each ETL, `prerender_app`
+crawls the pages of an app with the test client, starting from its root
+pages with each filter (year, fonte, categoria, rede...) and following the
+urls in the json of each page, and writes their html and json to a new
+version of the app tree under PRERENDER_ROOT:
+
+    <app>/<version>/<url path>/<sorted query string or index>.<html|json>
+    <app>/current -> <version>
+
+PrerenderedPagesMiddleware answers the requests with the pre-rendered file
+while the dataset of the app is the one it was rendered from. The file is
+sent by the web server when DOWNLOADS_SENDFILE is set, so with nginx
+PRERENDER_ROOT must be inside DOWNLOADS_SENDFILE_ROOT. Everything else is
+rendered by the views.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.test import Client, override_settings
+from django.urls import NoReverseMatch, Resolver404, resolve, reverse
+from django.utils import timezone
+
+from global_app.db_routing import PRIMARY_COOKIE, SAFE_METHODS
+from global_app.http import serve_file
+from global_app.metadata import (
+    CONTRATOS_DATASET, EXECUCOES_DATASET, REGIONALIZACAO_DATASET,
+    get_dataset_metadata)
+from global_app.models import DatasetMetadata
+
+
+# dataset shown by each app
+APP_DATASETS = {
+    'mosaico': EXECUCOES_DATASET,
+    'geologia': EXECUCOES_DATASET,
+    'contratos': CONTRATOS_DATASET,
+    'regionalizacao': REGIONALIZACAO_DATASET,
+}
+# views linked by the pages that aren't pre-rendered
+SKIPPED_VIEWS = ['download']
+FORMATS = ['html', 'json']
+CONTENT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'json': 'application/json',
+}
+CURRENT_LINK = 'current'
+MANIFEST_FILENAME = 'manifest.json'
+INDEX_KEY = 'index'
+MAX_KEY_LENGTH = 200
+# requests with this header are always rendered by the views
+BYPASS_HEADER = 'HTTP_X_PRERENDER'
+
+
+def get_page_key(params):
+    """
+    Name of the page file of the query `params`, (key, value) pairs: the
+    query string with the keys sorted and without `format`
+    """
+    query = urlencode(sorted((key, value) for key, value in params
+                             if key != 'format'))
+    if len(query) > MAX_KEY_LENGTH:
+        return hashlib.md5(query.encode()).hexdigest()
+    return query or INDEX_KEY
+
+
+def get_page_filepath(version_dir, path, params, page_format):
+    return os.path.join(version_dir, path.strip('/'),
+                        f'{get_page_key(params)}.{page_format}')
+
+
+def get_dataset_version(app):
+    """When the ETL last updated the dataset of `app`"""
+    metadata = get_dataset_metadata(APP_DATASETS[app])
+    return metadata.updated_at.isoformat() if metadata else None
+
+
+# pages
+
+def get_app_name(path):
+    """App of the pre-rendered views `path` is routed to, or None"""
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    if match.url_name in SKIPPED_VIEWS:
+        return None
+    return next((app for app in match.app_names if app in APP_DATASETS),
+                None)
+
+
+def iter_linked_pages(data):
+    """(path, params) of the urls in the json `data` of a page"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, str) and (key == 'url' or
+                                           key.endswith('_url')):
+                url = urlsplit(value)
+                yield url.path, parse_qsl(url.query, keep_blank_values=True)
+            else:
+                yield from iter_linked_pages(value)
+    elif isinstance(data, list):
+        for item in data:
+            yield from iter_linked_pages(item)
+
+
+def crawl(client, app, seeds, max_pages=None):
+    """
+    Yields (path, params, format, content) of the pages of `app` reachable
+    from the `seeds`, (path, params) pairs, that the views answer with 200
+    """
+    queue = deque(seeds)
+    seen = set()
+    while queue and (max_pages is None or len(seen) < max_pages):
+        path, params = queue.popleft()
+        params = [(key, value) for key, value in params if key != 'format']
+        page = (path, get_page_key(params))
+        if page in seen or get_app_name(path) != app:
+            continue
+        seen.add(page)
+
+        query = urlencode(params)
+        contents = {}
+        for page_format in FORMATS:
+            format_query = urlencode(params + [('format', page_format)])
+            response = client.get(f'{path}?{format_query}',
+                                  **{BYPASS_HEADER: '1'})
+            if response.status_code != 200:
+                print(f'{path}?{query} returned {response.status_code}')
+                break
+            contents[page_format] = response.content
+        else:
+            for page_format, content in contents.items():
+                yield path, params, page_format, content
+            queue.extend(iter_linked_pages(json.loads(contents['json'])))
+
+
+def _page(urlname, **params):
+    return reverse(urlname), [(key, str(value))
+                              for key, value in params.items()
+                              if value is not None]
+
+
+def _mosaico_seeds():
+    from budget_execution.models import Execucao, FonteDeRecursoGrupo
+
+    years = [None] + list(Execucao.objects.get_years())
+    fontes = [None] + list(
+        FonteDeRecursoGrupo.objects.values_list('id', flat=True))
+    return [_page(urlname, year=year, fonte=fonte)
+            for urlname in ('mosaico:grupos', 'mosaico:subfuncoes')
+            for year in years for fonte in fontes]
+
+
+def _geologia_seeds():
+    from budget_execution.constants import SME_ORGAO_ID
+    from budget_execution.models import Execucao
+
+    subfuncoes = Execucao.objects \
+        .filter(orgao_id=SME_ORGAO_ID, is_minimo_legal=False) \
+        .order_by('subfuncao_id') \
+        .values_list('subfuncao_id', flat=True).distinct()
+    return [_page('geologia:home', subfuncao_id=subfuncao)
+            for subfuncao in [None] + list(subfuncoes)]
+
+
+def _contratos_seeds():
+    from contratos.models import CategoriaContrato, ExecucaoContrato
+
+    years = [None] + list(ExecucaoContrato.objects.get_years())
+    categorias = [None] + list(
+        CategoriaContrato.objects.values_list('id', flat=True))
+    return [_page('contratos:home', year=year, category=categoria)
+            for year in years for categoria in categorias]
+
+
+def _regionalizacao_seeds():
+    from regionalizacao.models import EscolaInfo
+
+    years = [None] + list(EscolaInfo.objects.order_by('year')
+                          .values_list('year', flat=True).distinct())
+    redes = [None] + list(EscolaInfo.objects.order_by('rede')
+                          .values_list('rede', flat=True).distinct())
+    return [_page('regionalizacao:home', year=year, rede=rede,
+                  localidade=localidade)
+            for year in years for rede in redes
+            for localidade in (None, 'zona', 'dre')]
+
+
+APP_SEEDS = {
+    'mosaico': _mosaico_seeds,
+    'geologia': _geologia_seeds,
+    'contratos': _contratos_seeds,
+    'regionalizacao': _regionalizacao_seeds,
+}
+
+
+def prerender_app(root, app, max_pages=None, keep_versions=None):
+    """
+    Writes the pages of `app` to a new version under `root/app` and makes it
+    the current one, keeping the `keep_versions` newest ones
+    (PRERENDER_KEEP_VERSIONS by default). Returns the version directory, or
+    None when the app isn't routed.
+    """
+    keep_versions = keep_versions or settings.PRERENDER_KEEP_VERSIONS
+    # read before the pages, so an ETL running meanwhile makes them stale
+    metadata = DatasetMetadata.objects.filter(
+        dataset=APP_DATASETS[app]).first()
+    try:
+        seeds = APP_SEEDS[app]()
+    except NoReverseMatch:
+        print(f'{app} is not routed')
+        return None
+
+    app_dir = os.path.join(root, app)
+    version = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    version_dir = os.path.join(app_dir, version)
+
+    # the errors of a page are reported, not raised
+    client = Client(raise_request_exception=False)
+    # the pages must have what was just written
+    client.cookies[PRIMARY_COOKIE] = '1'
+    pages = 0
+    # lets the test client reach the views whatever ALLOWED_HOSTS is
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for path, params, page_format, content in crawl(
+                client, app, seeds, max_pages):
+            filepath = get_page_filepath(version_dir, path, params,
+                                         page_format)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'wb') as fh:
+                fh.write(content)
+            if page_format == 'json':
+                pages += 1
+
+    manifest = {
+        'app': app,
+        'version': version,
+        'dataset_version': (metadata.updated_at.isoformat()
+                            if metadata else None),
+        'created_at': timezone.now().isoformat(),
+        'pages': pages,
+    }
+    os.makedirs(version_dir, exist_ok=True)
+    with open(os.path.join(version_dir, MANIFEST_FILENAME), 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+
+    _set_current_version(app_dir, version)
+    _remove_old_versions(app_dir, keep_versions)
+    print(f'{pages} {app} pages pre-rendered to {version_dir}')
+    return version_dir
+
+
+def _set_current_version(app_dir, version):
+    link = os.path.join(app_dir, CURRENT_LINK)
+    tmp_link = f'{link}.tmp'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(version, tmp_link)
+    # replacing the link is atomic, requests see one version or the other
+    os.replace(tmp_link, link)
+
+
+def _remove_old_versions(app_dir, keep_versions):
+    versions = sorted(name for name in os.listdir(app_dir)
+                      if name != CURRENT_LINK and
+                      os.path.isdir(os.path.join(app_dir, name)) and
+                      not os.path.islink(os.path.join(app_dir, name)))
+    for version in versions[:-keep_versions]:
+        shutil.rmtree(os.path.join(app_dir, version))
+
+
+def prerender_after_etl(*apps):
+    """Pre-renders the pages of `apps` when PRERENDER_ROOT is set. Run at
+    the end of the ETLs."""
+    if not settings.PRERENDER_ROOT:
+        return
+    for app in apps:
+        prerender_app(settings.PRERENDER_ROOT, app,
+                      max_pages=settings.PRERENDER_MAX_PAGES)
+
+
+# serving
+
+# {app: (version directory, manifest)}
+_manifests = {}
+
+
+def get_manifest(root, app):
+    """Manifest of the current version of `app`, or None"""
+    version_dir = os.path.realpath(os.path.join(root, app, CURRENT_LINK))
+    cached = _manifests.get(app)
+    if cached and cached[0] == version_dir:
+        return cached[1]
+
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILENAME)) as fh:
+            manifest = json.load(fh)
+    except FileNotFoundError:
+        return None
+    _manifests[app] = (version_dir, manifest)
+    return manifest
+
+
+def get_prerendered_filepath(root, app, request):
+    """Pre-rendered file of the `request` to a view of `app`, or None"""
+    page_format = request.GET.get('format')
+    if page_format is None and \
+            'application/json' not in request.META.get('HTTP_ACCEPT', ''):
+        page_format = 'html'
+    if page_format not in FORMATS:
+        return None
+
+    manifest = get_manifest(root, app)
+    if not manifest or manifest['dataset_version'] is None or \
+            manifest['dataset_version'] != get_dataset_version(app):
+        return None
+
+    version_dir = os.path.join(root, app, manifest['version'])
+    filepath = get_page_filepath(
+        version_dir, request.path,
+        [(key, value) for key, values in request.GET.lists()
+         for value in values],
+        page_format)
+    return filepath if os.path.isfile(filepath) else None
+
+
+def clear_cache():
+    _manifests.clear()
+
+
+def _is_inside(path, root):
+    path, root = os.path.realpath(path), os.path.realpath(root)
+    return os.path.commonpath([path, root]) == root
+
+
+class PrerenderedPagesMiddleware:
+    """Answers the requests to the public views with their pre-rendered
+    pages, when PRERENDER_ROOT is set"""
+
+    def __init__(self, get_response):
+        if not settings.PRERENDER_ROOT:
+            raise MiddlewareNotUsed
+        # nginx only sends the files under the root of its internal location
+        if settings.DOWNLOADS_SENDFILE == 'nginx' and not _is_inside(
+                settings.PRERENDER_ROOT, settings.DOWNLOADS_SENDFILE_ROOT):
+            raise ImproperlyConfigured(
+                'PRERENDER_ROOT must be inside DOWNLOADS_SENDFILE_ROOT')
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS or BYPASS_HEADER in request.META:
+            return None
+        match = request.resolver_match
+        if match.url_name in SKIPPED_VIEWS:
+            return None
+        app = next((app for app in match.app_names if app in APP_DATASETS),
+                   None)
+        if app is None:
+            return None
+
+        filepath = get_prerendered_filepath(settings.PRERENDER_ROOT, app,
+                                            request)
+        if filepath is None:
+            return None
+        content_type = CONTENT_TYPES[os.path.splitext(filepath)[1][1:]]
+        response = serve_file(request, filepath, content_type)
+        # FileResponse guesses the html type again, without the charset
+        response['Content-Type'] = content_type
+        return response
@@ -0,0 +1,217 @@
+"""
+Opt-in profiling of each request, turned on by REQUEST_PROFILING. It records
+the queries made on every database (count, total time and the slowest ones),
+the time spent in the view, in the sections marked with `profile_section`
+(like the serializers) and rendering the response, and the response size.
+
+The profile is sent in the Server-Timing header and logged as a JSON line by
+the `global_app.profiling` logger. Views exceeding their budget in
+REQUEST_PROFILING_BUDGETS are logged as warnings or, with
+REQUEST_PROFILING_STRICT (meant for tests), raise BudgetExceeded.
+"""
+import heapq
+import json
+import logging
+import time
+
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_current_profile = ContextVar('request_profile', default=None)
+
+# budget keys and the profile values they limit
+BUDGET_KEYS = ['queries', 'db', 'total', 'size']
+SQL_MAX_LENGTH = 300
+
+
+class BudgetExceeded(AssertionError):
+    """Raised when a view exceeds its budget and REQUEST_PROFILING_STRICT
+    is set"""
+
+
+class RequestProfile:
+    """
+    Profile of one request. It is also the execute wrapper installed on the
+    database connections, so it sees every query.
+    """
+
+    def __init__(self, slowest=3):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+        self.slowest_max = slowest
+        self.sections = defaultdict(float)
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.view_end = None
+        self.end = None
+        self.size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, time.perf_counter() - start)
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        # min-heap of the slowest queries; the order breaks ties without
+        # comparing the sql
+        item = (duration, self.queries, sql[:SQL_MAX_LENGTH])
+        if len(self.slowest) < self.slowest_max:
+            heapq.heappush(self.slowest, item)
+        elif self.slowest and duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def finish(self, response):
+        self.end = time.perf_counter()
+        if not response.streaming:
+            self.size = len(response.content)
+        elif response.has_header('Content-Length'):
+            self.size = int(response['Content-Length'])
+
+    def get_timings(self):
+        """Durations in milliseconds"""
+        timings = {'db': self.db_time * 1000}
+        if self.view_start is not None:
+            view_end = self.view_end or self.end
+            timings['view'] = (view_end - self.view_start) * 1000
+            if self.view_end is not None:
+                timings['render'] = (self.end - self.view_end) * 1000
+        for name, duration in self.sections.items():
+            timings[name] = duration * 1000
+        timings['total'] = (self.end - self.start) * 1000
+        return timings
+
+    def get_server_timing(self):
+        metrics = []
+        for name, duration in self.get_timings().items():
+            metric = f'{name};dur={duration:.1f}'
+            if name == 'db':
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'size': self.size,
+            'timings': {name: round(duration, 2) for name, duration
+                        in self.get_timings().items()},
+            'slowest_queries': [
+                {'duration': round(duration * 1000, 2), 'sql': sql}
+                for duration, _, sql in sorted(self.slowest, reverse=True)],
+        }
+
+    def get_exceeded(self, budget):
+        """Descriptions of the values over the `budget` limits"""
+        timings = self.get_timings()
+        values = {
+            'queries': self.queries,
+            'db': timings['db'],
+            'total': timings['total'],
+            'size': self.size,
+        }
+        return [f'{key} {values[key]:.0f} > {budget[key]}'
+                for key in BUDGET_KEYS
+                if key in budget and values[key] is not None and
+                values[key] > budget[key]]
+
+
+@contextmanager
+def profile_section(name):
+    """Adds the time spent in the block to the `name` timing of the
+    current request profile, if there is one"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += time.perf_counter() - start
+
+
+def get_view_name(match):
+    """Url name with the application namespaces, as used by reverse"""
+    if match is None:
+        return None
+    if not match.url_name:
+        return match.view_name
+    return ':'.join(match.app_names + [match.url_name])
+
+
+def get_budget(view_name):
+    budgets = settings.REQUEST_PROFILING_BUDGETS
+    return budgets.get(view_name, budgets.get('*'))
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles each request when REQUEST_PROFILING is set. It should be the
+    first middleware, so the whole request is measured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile(settings.REQUEST_PROFILING_SLOWEST_QUERIES)
+        request._profile = profile
+        token = _current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+
+        profile.finish(response)
+        response['Server-Timing'] = profile.get_server_timing()
+        self.report(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profile.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # called as soon as the view returns, before the response is rendered
+        request._profile.view_end = time.perf_counter()
+        return response
+
+    def report(self, request, response, profile):
+        view_name = get_view_name(request.resolver_match)
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view_name,
+            'status': response.status_code,
+            **profile.as_dict(),
+        }
+        logger.info(json.dumps(record))
+
+        budget = get_budget(view_name)
+        exceeded = profile.get_exceeded(budget) if budget else []
+        if not exceeded:
+            return
+
+        message = (f'{view_name or request.path} exceeded its budget: '
+                   f'{", ".join(exceeded)}')
+        logger.warning(message)
+        if settings.REQUEST_PROFILING_STRICT:
+            raise BudgetExceeded(message)
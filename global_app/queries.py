@@ -0,0 +1,15 @@
+"""
+Database execute wrappers shared by the benchmarks and the ETL metrics,
+kept apart so the ETL workers don't import the benchmark cases.
+"""
+
+
+class QueryCounter:
+    """Database execute wrapper counting every query, even with DEBUG off"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
@@ -0,0 +1,838 @@
+"""
+Synthetic data used to measure the tools at production-like volumes.
+SyntheticSources generates the source data: the raw tables loaded by the
+ETLs and the files they read (raw tables dumps, SOF and EOL API payloads and
+from-to spreadsheets). load_sources and write_sources feed the whole load
+with them, while the seed_* functions write, from the same data, the tables
+read by the views as the ETLs would generate them.
+
+Budget lines are unique keys (orgao, projeto, elemento, fonte, modalidade)
+and every empenho, contrato empenho and categoria from-to points to one of
+the orcamentos lines of its year, so the joins of the ETLs find their rows.
+`skew` concentrates empenhos in a few lines and contratos the way the real
+data does: 0 spreads them evenly, higher values concentrate more.
+
+Everything is deterministic for a given `seed` and inserted in batches, so
+millions of rows can be loaded without keeping them in memory. It changes
+the data, so it must only be run against a database created for that.
+"""
+import io
+import json
+import os
+import random
+import zipfile
+
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from budget_execution import models as budget_models
+from budget_execution.constants import SME_ORGAO_ID
+from budget_execution.models import EmpenhoRaw, OrcamentoRaw
+from contratos.models import (
+    CategoriaContratoFromTo, ContratoRaw, EmpenhoSOFCache,
+    EmpenhoSOFCacheTemp)
+from global_app.dumps import insert_objects
+from global_app.http import write_xlsx
+from regionalizacao import models as regionalizacao_models
+
+
+BATCH_SIZE = 5000
+
+# dimension sizes of the budget tables
+GRUPOS = 4
+SUBGRUPOS_PER_GRUPO = 5
+ELEMENTOS = 40
+SUBELEMENTOS_PER_ELEMENTO = 5
+FONTES = 10
+FONTE_GRUPOS = 4
+MODALIDADES = [50, 71, 90, 91, 93]
+SUBFUNCOES = 10
+PROGRAMAS = 30
+PROJETOS = 300
+OTHER_ORGAOS = 5
+UNIDADES = 20
+
+# contratos
+CONTRATO_MODALIDADES = 8
+
+# schools
+DRES = 13
+DISTRITOS = 96
+ZONAS = ['Norte', 'Sul', 'Leste', 'Oeste', 'Centro']
+TIPOS_ESCOLA = ['EMEI', 'EMEF', 'CEI DIRET', 'CEU EMEF', 'EMEFM', 'CIEJA']
+RECURSOS_GRUPOS = {
+    'Materiais': ['Uniforme', 'Material escolar'],
+    'Alimentação': ['Merenda', None],
+    'Verbas': ['PTRF', 'Locação'],
+}
+
+BudgetLine = namedtuple('BudgetLine', [
+    'orgao', 'unidade', 'subfuncao', 'programa', 'projeto', 'categoria',
+    'gnd', 'modalidade', 'elemento', 'fonte'])
+
+
+def skewed_sampler(rng, size, skew):
+    """
+    Returns a function choosing an index of range(size). Index `i` is chosen
+    with weight 1 / (i + 1) ** skew, a Zipf distribution.
+    """
+    population = range(size)
+    cum_weights = list(accumulate(
+        1 / rank ** skew for rank in range(1, size + 1)))
+
+    def choose():
+        return rng.choices(population, cum_weights=cum_weights)[0]
+    return choose
+
+
+class SyntheticSources:
+    """
+    Generates the source data of the last `years` years. Counts are totals
+    split evenly over the years; `sof_empenhos` are the empenhos returned by
+    the SOF API for all the contratos.
+    """
+
+    def __init__(self, years=1, orcamentos=10000, empenhos=50000,
+                 contratos=2000, sof_empenhos=20000, escolas=3000,
+                 projetos=PROJETOS, elementos=ELEMENTOS, fontes=FONTES,
+                 skew=1.0, seed=0):
+        self.last_year = date.today().year
+        self.years = list(range(self.last_year - years + 1,
+                                self.last_year + 1))
+        self.orcamentos = orcamentos
+        self.empenhos = empenhos
+        self.contratos = contratos
+        self.sof_empenhos = sof_empenhos
+        self.escolas = escolas
+        self.projetos = projetos
+        self.elementos = elementos
+        self.fontes = fontes
+        self.skew = skew
+        self.seed = seed
+        self._lines = {}
+
+        capacity = self.get_capacity()
+        if orcamentos // years > capacity:
+            raise ValueError(f'At most {capacity} orcamentos per year')
+
+    def get_capacity(self):
+        return self.projetos * self.elementos * self.fontes * len(MODALIDADES)
+
+    def _rng(self, name):
+        # one generator per kind of data, so each one is the same whatever
+        # else is generated
+        return random.Random(f'{self.seed}-{name}')
+
+    # budget
+
+    def get_line(self, index):
+        index, modalidade = divmod(index, len(MODALIDADES))
+        index, fonte = divmod(index, self.fontes)
+        projeto, elemento = divmod(index, self.elementos)
+
+        # projetos belong to one orgao, unidade, subfuncao and programa
+        if projeto % 10:
+            orgao = SME_ORGAO_ID
+        else:
+            orgao = SME_ORGAO_ID + 100 + projeto // 10 % OTHER_ORGAOS
+        if elemento < self.elementos // 10:
+            categoria, gnd = 3, 1
+        elif elemento < self.elementos * 4 // 5:
+            categoria, gnd = 3, 3
+        else:
+            categoria, gnd = 4, 4
+
+        return BudgetLine(
+            orgao=orgao,
+            unidade=10 + projeto % UNIDADES,
+            subfuncao=361 + projeto % SUBFUNCOES,
+            programa=3000 + projeto % PROGRAMAS,
+            projeto=2000 + projeto,
+            categoria=categoria,
+            gnd=gnd,
+            modalidade=MODALIDADES[modalidade],
+            elemento=10 + elemento,
+            fonte=fonte,
+        )
+
+    def get_year_lines(self, year):
+        """Indexes of the budget lines with orcamento in `year`"""
+        if year not in self._lines:
+            rng = self._rng(f'lines-{year}')
+            self._lines[year] = rng.sample(
+                range(self.get_capacity()), self.orcamentos // len(self.years))
+        return self._lines[year]
+
+    def iter_orcamentos_raw(self, first_id=1):
+        rng = self._rng('orcamentos')
+        extracted_at = timezone.now()
+        id_ = first_id
+        for year in self.years:
+            for index in self.get_year_lines(year):
+                line = self.get_line(index)
+                orcado = round(rng.lognormvariate(12, 1.5), 2)
+                yield dict(
+                    id=id_,
+                    cd_ano_execucao=year,
+                    cd_exercicio=year,
+                    cd_orgao=line.orgao,
+                    sg_orgao=f'O{line.orgao}',
+                    ds_orgao=f'Órgão {line.orgao}',
+                    cd_unidade=line.unidade,
+                    ds_unidade=f'Unidade {line.unidade}',
+                    cd_funcao=12,
+                    ds_funcao='Educação',
+                    cd_subfuncao=line.subfuncao,
+                    ds_subfuncao=f'Subfunção {line.subfuncao}',
+                    cd_programa=line.programa,
+                    ds_programa=f'Programa {line.programa}',
+                    tp_projeto_atividade=('Projeto' if line.projeto % 2
+                                          else 'Atividade'),
+                    cd_projeto_atividade=line.projeto,
+                    ds_projeto_atividade=f'Projeto {line.projeto}',
+                    ds_categoria_despesa=line.categoria,
+                    ds_categoria=f'Categoria {line.categoria}',
+                    cd_grupo_despesa=line.gnd,
+                    ds_grupo_despesa=f'GND {line.gnd}',
+                    cd_modalidade=line.modalidade,
+                    ds_modalidade=f'Modalidade {line.modalidade}',
+                    cd_elemento=line.elemento,
+                    cd_fonte=line.fonte,
+                    ds_fonte=f'Fonte {line.fonte}',
+                    vl_orcado_inicial=orcado,
+                    vl_orcado_atualizado=round(
+                        orcado * rng.uniform(0.8, 1.2), 2),
+                    dt_extracao=extracted_at,
+                    dt_data_loaded=extracted_at,
+                )
+                id_ += 1
+
+    def iter_empenhos_raw(self, first_id=1):
+        rng = self._rng('empenhos')
+        extracted_at = timezone.now()
+        id_ = first_id
+        for year in self.years:
+            lines = self.get_year_lines(year)
+            if not lines:
+                continue
+            choose = skewed_sampler(rng, len(lines), self.skew)
+            for _ in range(self.empenhos // len(self.years)):
+                line = self.get_line(lines[choose()])
+                subelemento = (line.elemento * 100 +
+                               rng.randrange(1, SUBELEMENTOS_PER_ELEMENTO + 1))
+                empresa = rng.randrange(5000)
+                empenhado = round(rng.lognormvariate(9, 1.5), 2)
+                mes = rng.randrange(1, 13)
+                yield dict(
+                    id=id_,
+                    an_empenho=year,
+                    cd_orgao=str(line.orgao),
+                    dc_orgao=f'Órgão {line.orgao}',
+                    cd_unidade=str(line.unidade),
+                    dc_unidade=f'Unidade {line.unidade}',
+                    cd_funcao='12',
+                    dc_funcao='Educação',
+                    cd_subfuncao=str(line.subfuncao),
+                    dc_subfuncao=f'Subfunção {line.subfuncao}',
+                    cd_programa=str(line.programa),
+                    dc_programa=f'Programa {line.programa}',
+                    cd_projeto_atividade=str(line.projeto),
+                    dc_projeto_atividade=f'Projeto {line.projeto}',
+                    cd_categoria=line.categoria,
+                    dc_categoria_economica=f'Categoria {line.categoria}',
+                    cd_grupo=line.gnd,
+                    dc_grupo_despesa=f'GND {line.gnd}',
+                    cd_modalidade=line.modalidade,
+                    dc_modalidade=f'Modalidade {line.modalidade}',
+                    cd_elemento=str(line.elemento),
+                    dc_elemento=f'Elemento {line.elemento}',
+                    cd_fonte_de_recurso=str(line.fonte),
+                    dc_fonte_de_recurso=f'Fonte {line.fonte}',
+                    cd_subelemento=str(subelemento),
+                    dc_subelemento=f'Subelemento {subelemento}',
+                    cd_empenho=id_,
+                    dt_empenho=timezone.make_aware(datetime(year, mes, 1)),
+                    mes_empenho=mes,
+                    cd_empresa=str(empresa),
+                    nm_empresa=f'Empresa {empresa}',
+                    dc_razao_social=f'Empresa {empresa}',
+                    dc_cpf_cnpj=f'{empresa:014}',
+                    vl_empenhado=empenhado,
+                    vl_empenho_anulado=0.0,
+                    vl_empenho_liquido=empenhado,
+                    vl_liquidado=round(empenhado * rng.random(), 2),
+                    vl_pago=round(empenhado * rng.random(), 2),
+                    dt_data_loaded=extracted_at,
+                )
+                id_ += 1
+
+    def iter_execucoes(self, subgrupos):
+        """
+        Execucoes of the orcamentos lines, with the from-tos applied, as
+        generated by the budget ETL. `subgrupos` are the ids of the
+        mosaico subgrupos the elementos are spread over.
+        """
+        rng = self._rng('execucoes')
+        for year in self.years:
+            for index in self.get_year_lines(year):
+                line = self.get_line(index)
+                subelemento = (line.elemento * 100 +
+                               rng.randrange(1, SUBELEMENTOS_PER_ELEMENTO + 1))
+                orcado = min(rng.lognormvariate(10, 2), 10 ** 12)
+                empenhado = orcado * rng.random()
+                pago = empenhado * rng.random()
+                execucao = budget_models.Execucao(
+                    year=date(year, 1, 1),
+                    orgao_id=line.orgao,
+                    projeto_id=line.projeto,
+                    categoria_id=line.categoria,
+                    gnd_id=line.gnd,
+                    modalidade_id=line.modalidade,
+                    elemento_id=line.elemento,
+                    fonte_id=line.fonte,
+                    subelemento_id=subelemento,
+                    subfuncao_id=line.subfuncao,
+                    programa_id=line.programa,
+                    orcado_atualizado=Decimal(f'{orcado:.2f}'),
+                    empenhado_liquido=Decimal(f'{empenhado:.2f}'),
+                    vl_pago=Decimal(f'{pago:.2f}'),
+                    subgrupo_id=subgrupos[line.elemento % len(subgrupos)],
+                    fonte_grupo_id=line.fonte % FONTE_GRUPOS + 1,
+                    gnd_geologia_id=line.gnd % 3 + 1,
+                    subelemento_friendly_id=subelemento,
+                )
+                execucao.indexer = execucao.build_indexer()
+                yield execucao
+
+    # contratos
+
+    def iter_contratos_raw(self, first_id=1):
+        rng = self._rng('contratos')
+        today = date.today()
+        loaded_at = timezone.now().isoformat()[:26]
+        for index in range(self.contratos):
+            year = self.years[index % len(self.years)]
+            modalidade = index % CONTRATO_MODALIDADES + 1
+            empresa = rng.randrange(2000)
+            principal = round(rng.lognormvariate(12, 1.5), 2)
+            yield dict(
+                id=first_id + index,
+                codContrato=index + 1,
+                anoExercicioContrato=year,
+                codModalidadeContrato=modalidade,
+                txtDescricaoModalidadeContrato=f'Modalidade {modalidade}',
+                txtObjetoContrato=f'Objeto {index % 500}',
+                codEmpresaContrato=empresa,
+                codOrgaoContrato=SME_ORGAO_ID,
+                txtDescricaoOrgaoContrato=f'Órgão {SME_ORGAO_ID}',
+                codProcessoContrato=6016_0000_0000 + index,
+                codTipoContratacaoContrato=index % 3 + 1,
+                txtTipoContratacaoContrato=f'Tipo {index % 3 + 1}',
+                datAssinaturaContrato=f'{year}-{index % 12 + 1:02}-01',
+                datPublicacaoContrato=f'{year}-{index % 12 + 1:02}-10',
+                datVigenciaContrato=f'{year + 1}-{index % 12 + 1:02}-01',
+                numOriginalContrato=f'{index + 1}/SME/{year}',
+                txtRazaoSocialContrato=f'Empresa {empresa}',
+                valPrincipalContrato=principal,
+                valAditamentosContrato=0.0,
+                valReajustesContrato=0.0,
+                valAnulacaoContrato=0.0,
+                valTotalEmpenhadoContrato=principal,
+                dataExtracaoContrato=today.isoformat(),
+                dtDataLoadedContrato=loaded_at,
+            )
+
+    def iter_sof_payloads(self):
+        """
+        Yields (contrato, ano_empenho, empenhos) for each request the
+        contratos ETL makes to the SOF API that has empenhos. The empenhos of
+        a contrato in a year share the same budget line.
+        """
+        rng = self._rng('sof')
+        counts = Counter()
+        if self.contratos:
+            choose = skewed_sampler(rng, self.contratos, self.skew)
+            counts.update(choose() for _ in range(self.sof_empenhos))
+
+        cod_empenho = 1
+        for index, contrato in enumerate(self.iter_contratos_raw()):
+            by_year = defaultdict(list)
+            first_year = contrato['anoExercicioContrato']
+            for _ in range(counts[index]):
+                by_year[rng.randint(first_year, self.last_year)].append(
+                    cod_empenho)
+                cod_empenho += 1
+
+            for year, cod_empenhos in sorted(by_year.items()):
+                lines = self.get_year_lines(year)
+                line = self.get_line(lines[rng.randrange(len(lines))]
+                                     if lines else
+                                     rng.randrange(self.get_capacity()))
+                empenhos = [self._build_sof_empenho(rng, contrato, year, line,
+                                                    cod)
+                            for cod in cod_empenhos]
+                yield contrato, year, empenhos
+
+    def _build_sof_empenho(self, rng, contrato, year, line, cod_empenho):
+        empenhado = round(rng.lognormvariate(9, 1.5), 2)
+        mes = rng.randrange(1, 13)
+        subelemento = rng.randrange(1, SUBELEMENTOS_PER_ELEMENTO + 1)
+        return dict(
+            anoEmpenho=year,
+            codCategoria=line.categoria,
+            txtCategoriaEconomica=f'Categoria {line.categoria}',
+            codGrupo=line.gnd,
+            txtGrupoDespesa=f'GND {line.gnd}',
+            codModalidade=line.modalidade,
+            txtModalidadeAplicacao=f'Modalidade {line.modalidade}',
+            codElemento=line.elemento,
+            txtDescricaoElemento=f'Elemento {line.elemento}',
+            codSubElemento=subelemento,
+            txtDescricaoSubElemento=f'Subelemento {subelemento}',
+            codFonteRecurso=line.fonte,
+            txtDescricaoFonteRecurso=f'Fonte {line.fonte}',
+            codFuncao=12,
+            txtDescricaoFuncao='Educação',
+            codSubFuncao=line.subfuncao,
+            txtDescricaoSubFuncao=f'Subfunção {line.subfuncao}',
+            codPrograma=line.programa,
+            txtDescricaoPrograma=f'Programa {line.programa}',
+            codProjetoAtividade=line.projeto,
+            txtDescricaoProjetoAtividade=f'Projeto {line.projeto}',
+            codOrgao=line.orgao,
+            txtDescricaoOrgao=f'Órgão {line.orgao}',
+            codUnidade=line.unidade,
+            txtDescricaoUnidade=f'Unidade {line.unidade}',
+            codEmpenho=cod_empenho,
+            datEmpenho=f'{year}-{mes:02}-01',
+            mesEmpenho=mes,
+            codEmpresa=contrato['codEmpresaContrato'],
+            nomEmpresa=contrato['txtRazaoSocialContrato'],
+            txtRazaoSocial=contrato['txtRazaoSocialContrato'],
+            numCpfCnpj=f'{contrato["codEmpresaContrato"]:014}',
+            codProcesso=contrato['codProcessoContrato'],
+            valTotalEmpenhado=empenhado,
+            valAnuladoEmpenho=0.0,
+            valEmpenhadoLiquido=empenhado,
+            valLiquidado=round(empenhado * rng.random(), 2),
+            valPagoExercicio=round(empenhado * rng.random(), 2),
+            valPagoRestos=0.0,
+        )
+
+    def iter_categorias_fromto(self, indexers):
+        """Rows of the categorias from-to spreadsheet. One every ten
+        indexers is left without categoria, like new contratos are"""
+        for index, indexer in enumerate(sorted(indexers)):
+            if index % 10:
+                yield [indexer, f'Categoria {index % 6}',
+                       f'Descrição da categoria {index % 6}']
+
+    # escolas
+
+    def iter_eol_escolas(self, year):
+        """Escolas as returned by the EOL API for `year`. Escolas keep
+        their codes and regions over the years."""
+        rng = self._rng(f'escolas-{year}')
+        for index in range(self.escolas):
+            coddist = index % DISTRITOS + 1
+            dre = coddist % DRES
+            yield {
+                'dre': f'D{dre:02}',
+                'diretoria': f'DRE {dre}',
+                'codesc': f'{index + 1:06}',
+                'tipoesc': TIPOS_ESCOLA[index % len(TIPOS_ESCOLA)],
+                'nomesc': f'Escola {index}',
+                'endereco': f'Rua {index}',
+                'numero': str(index % 1000),
+                'bairro': f'Bairro {index % 300}',
+                'cep': 1000000 + index,
+                'situacao': 'Ativa',
+                'coddist': coddist,
+                'distrito': f'Distrito {coddist}',
+                'rede': 'DIR' if index % 4 else 'CON',
+                'latitude': f'{-23.5 + rng.uniform(-0.3, 0.3):.6f}',
+                'longitude': f'{-46.6 + rng.uniform(-0.3, 0.3):.6f}',
+                'total_vagas': rng.randrange(50, 2000),
+                'total_matriculados': rng.randrange(50, 2000),
+                'total_servidores': rng.randrange(5, 200),
+            }
+
+    def iter_ptrf_fromto(self, year):
+        rng = self._rng(f'ptrf-{year}')
+        for index in range(self.escolas):
+            yield [f'{index + 1:06}', round(rng.uniform(1000, 50000), 2)]
+
+    def iter_unidade_recursos_fromto(self, year):
+        rng = self._rng(f'recursos-{year}')
+        subgrupos = [(grupo, subgrupo)
+                     for grupo, names in RECURSOS_GRUPOS.items()
+                     for subgrupo in names if subgrupo]
+        for index in range(self.escolas):
+            for grupo, subgrupo in rng.sample(subgrupos, 3):
+                yield [f'{index + 1:06}', grupo, subgrupo,
+                       rng.randrange(1, 100), 'unidades']
+
+    def iter_distrito_zona_fromto(self):
+        for coddist in range(1, DISTRITOS + 1):
+            yield [coddist, ZONAS[coddist % len(ZONAS)]]
+
+    def iter_etapa_tipo_escola_fromto(self):
+        for index, tipoesc in enumerate(TIPOS_ESCOLA):
+            yield [tipoesc, tipoesc, f'Etapa {index % 3}']
+
+
+def load_sources(sources, batch_size=BATCH_SIZE):
+    """
+    Loads the raw tables, as Airflow does, and the SOF empenhos in the
+    empenhos temp table, as the contratos ETL does after requesting the SOF
+    API. Ids continue after the rows already in the raw tables.
+    """
+    def first_id(model):
+        return (model.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+
+    counts = {}
+    with transaction.atomic():
+        counts['orcamentos'] = insert_objects(OrcamentoRaw, (
+            OrcamentoRaw(**row) for row in
+            sources.iter_orcamentos_raw(first_id(OrcamentoRaw))), batch_size)
+        counts['empenhos'] = insert_objects(EmpenhoRaw, (
+            EmpenhoRaw(**row) for row in
+            sources.iter_empenhos_raw(first_id(EmpenhoRaw))), batch_size)
+        counts['contratos'] = insert_objects(ContratoRaw, (
+            ContratoRaw(**row) for row in
+            sources.iter_contratos_raw(first_id(ContratoRaw))), batch_size)
+        counts['sof_empenhos'] = insert_objects(EmpenhoSOFCacheTemp, (
+            EmpenhoSOFCacheTemp(**empenho, **_get_contrato_fields(contrato))
+            for contrato, _, empenhos in sources.iter_sof_payloads()
+            for empenho in empenhos), batch_size)
+    return counts
+
+
+def _get_contrato_fields(contrato):
+    fields = {field.name for field in EmpenhoSOFCache._meta.fields
+              if not field.primary_key}
+    return {name: value for name, value in contrato.items()
+            if name in fields}
+
+
+def write_sources(sources, output_dir):
+    """
+    Writes the files the ETLs read, in their formats:
+    - the raw tables dumps, zipped loaddata fixtures;
+    - the SOF API responses,
+      `sof/<codContrato>_<anoExercicio>_<anoEmpenho>.json`;
+    - the EOL API responses, `eol/<year>.json`;
+    - the from-to spreadsheets uploaded on the admin.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = [
+        _write_fixture_zip(
+            os.path.join(output_dir, 'orcamento_empenhos_raw_dump.zip'),
+            [('budget_execution.orcamentoraw', sources.iter_orcamentos_raw()),
+             ('budget_execution.empenhoraw', sources.iter_empenhos_raw())]),
+        _write_fixture_zip(
+            os.path.join(output_dir, 'contratos_raw_dump.zip'),
+            [('contratos.contratoraw', sources.iter_contratos_raw())]),
+    ]
+
+    sof_dir = os.path.join(output_dir, 'sof')
+    os.makedirs(sof_dir, exist_ok=True)
+    indexers = set()
+    for contrato, year, empenhos in sources.iter_sof_payloads():
+        filename = (f'{contrato["codContrato"]}_'
+                    f'{contrato["anoExercicioContrato"]}_{year}.json')
+        with open(os.path.join(sof_dir, filename), 'w') as fh:
+            json.dump({'lstEmpenhos': empenhos}, fh)
+        indexers.add(EmpenhoSOFCache(**empenhos[0]).build_indexer())
+    written.append(sof_dir)
+
+    eol_dir = os.path.join(output_dir, 'eol')
+    os.makedirs(eol_dir, exist_ok=True)
+    for year in sources.years:
+        filepath = os.path.join(eol_dir, f'{year}.json')
+        with open(filepath, 'w') as fh:
+            json.dump({'results': list(sources.iter_eol_escolas(year))}, fh)
+    written.append(eol_dir)
+
+    spreadsheets = [
+        ('CategoriaContratoFromToSpreadsheet.xlsx',
+         ['indexer', 'categoria_name', 'categoria_desc'],
+         sources.iter_categorias_fromto(indexers)),
+        ('DistritoZonaFromToSpreadsheet.xlsx', ['coddist', 'zona'],
+         sources.iter_distrito_zona_fromto()),
+        ('EtapaTipoEscolaFromToSpreadsheet.xlsx',
+         ['tipoesc', 'desctipoesc', 'etapa'],
+         sources.iter_etapa_tipo_escola_fromto()),
+    ]
+    for year in sources.years:
+        spreadsheets += [
+            (f'PtrfFromToSpreadsheet_{year}.xlsx', ['codesc', 'vlrepasse'],
+             sources.iter_ptrf_fromto(year)),
+            (f'UnidadeRecursosFromToSpreadsheet_{year}.xlsx',
+             ['codesc', 'grupo', 'subgrupo', 'valor', 'label'],
+             sources.iter_unidade_recursos_fromto(year)),
+        ]
+    for filename, header, rows in spreadsheets:
+        filepath = os.path.join(output_dir, filename)
+        with open(filepath, 'wb') as fh:
+            write_xlsx(fh, header, rows, title='De-Para')
+        written.append(filepath)
+
+    return written
+
+
+def _write_fixture_zip(filepath, models_rows):
+    """Writes the rows as a loaddata json fixture, without keeping them in
+    memory, zipped like the dumps read by the populate_*_with_dump
+    functions"""
+    json_filename = os.path.basename(filepath).replace('.zip', '.json')
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        with zip_file.open(json_filename, 'w', force_zip64=True) as raw, \
+                io.TextIOWrapper(raw, encoding='utf-8') as fh:
+            fh.write('[')
+            separator = '\n'
+            for model, rows in models_rows:
+                for row in rows:
+                    fields = dict(row)
+                    pk = fields.pop('id')
+                    fh.write(separator)
+                    json.dump({'model': model, 'pk': pk, 'fields': fields},
+                              fh, cls=DjangoJSONEncoder)
+                    separator = ',\n'
+            fh.write('\n]\n')
+    return filepath
+
+
+def seed_execucoes(count, years, seed=0, batch_size=BATCH_SIZE):
+    """
+    Creates the Execucao of `count` orcamentos lines spread over the last
+    `years` years, and the dimension tables they point to. As in the real
+    data, some lines belong to other orgaos and aren't shown by the views.
+    """
+    sources = SyntheticSources(years=years, orcamentos=count, empenhos=0,
+                               contratos=0, sof_empenhos=0, escolas=0,
+                               seed=seed)
+    with transaction.atomic():
+        subgrupos = _seed_budget_dimensions(sources)
+        created = insert_objects(budget_models.Execucao,
+                                 sources.iter_execucoes(subgrupos),
+                                 batch_size)
+    budget_models.Execucao.objects.update_metadata()
+    return created
+
+
+def _seed_budget_dimensions(sources):
+    models = budget_models
+
+    def create(model, objs):
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+
+    orgaos = [SME_ORGAO_ID] + [SME_ORGAO_ID + 100 + i
+                               for i in range(OTHER_ORGAOS)]
+    create(models.Orgao, [models.Orgao(id=id_, desc=f'Órgão {id_}',
+                                       initials=f'O{id_}')
+                          for id_ in orgaos])
+    create(models.Categoria, [models.Categoria(id=id_, desc=f'Categoria {id_}')
+                              for id_ in (3, 4)])
+    create(models.Gnd, [models.Gnd(id=id_, desc=f'GND {id_}')
+                        for id_ in range(1, 7)])
+    create(models.Modalidade, [models.Modalidade(id=id_,
+                                                 desc=f'Modalidade {id_}')
+                               for id_ in MODALIDADES])
+    create(models.GndGeologia, [
+        models.GndGeologia(id=id_, desc=f'Camada {id_}', slug=f'camada{id_}')
+        for id_ in range(1, 4)])
+
+    grupos = range(1, GRUPOS + 1)
+    create(models.Grupo, [models.Grupo(id=id_, desc=f'Grupo {id_}')
+                          for id_ in grupos])
+    if not models.Subgrupo.objects.exists():
+        models.Subgrupo.objects.bulk_create([
+            models.Subgrupo(code=code, grupo_id=grupo_id,
+                            desc=f'Subgrupo {grupo_id}.{code}')
+            for grupo_id in grupos
+            for code in range(1, SUBGRUPOS_PER_GRUPO + 1)])
+
+    elementos = range(10, 10 + sources.elementos)
+    create(models.Elemento, [models.Elemento(id=id_, desc=f'Elemento {id_}')
+                             for id_ in elementos])
+    subelementos = [elemento * 100 + i for elemento in elementos
+                    for i in range(1, SUBELEMENTOS_PER_ELEMENTO + 1)]
+    create(models.Subelemento, [
+        models.Subelemento(id=id_, desc=f'Subelemento {id_}')
+        for id_ in subelementos])
+    create(models.SubelementoFriendly, [
+        models.SubelementoFriendly(id=id_, desc=f'Subelemento {id_}')
+        for id_ in subelementos])
+
+    create(models.FonteDeRecursoGrupo, [
+        models.FonteDeRecursoGrupo(id=id_, desc=f'Fonte {id_}')
+        for id_ in range(1, FONTE_GRUPOS + 1)])
+    create(models.FonteDeRecurso, [
+        models.FonteDeRecurso(id=id_, desc=f'Fonte de recurso {id_}')
+        for id_ in range(sources.fontes)])
+
+    create(models.Subfuncao, [
+        models.Subfuncao(id=id_, desc=f'Subfunção {id_}')
+        for id_ in range(361, 361 + SUBFUNCOES)])
+    create(models.Programa, [
+        models.Programa(id=id_, desc=f'Programa {id_}')
+        for id_ in range(3000, 3000 + PROGRAMAS)])
+    create(models.ProjetoAtividade, [
+        models.ProjetoAtividade(id=id_, desc=f'Projeto {id_}', type='A')
+        for id_ in range(2000, 2000 + sources.projetos)])
+
+    return list(models.Subgrupo.objects.order_by('id')
+                .values_list('id', flat=True))
+
+
+def seed_empenhos_sof_cache(count, years, seed=0, batch_size=BATCH_SIZE):
+    """
+    Creates `count` EmpenhoSOFCache, about ten per contrato, as returned by
+    the SOF API, and their categorias from-to. Execucoes contratos are
+    generated from them by the contratos ETL.
+    """
+    from contratos.services import domain
+
+    sources = SyntheticSources(years=years, orcamentos=0, empenhos=0,
+                               contratos=max(count // 10, 1),
+                               sof_empenhos=count, escolas=0, seed=seed)
+    with transaction.atomic():
+        created = insert_objects(EmpenhoSOFCache, (
+            _build_empenho_sof_cache(contrato, empenho)
+            for contrato, _, empenhos in sources.iter_sof_payloads()
+            for empenho in empenhos), batch_size)
+
+        indexers = EmpenhoSOFCache.objects.values_list('indexer', flat=True) \
+            .distinct()
+        CategoriaContratoFromTo.objects.bulk_create([
+            CategoriaContratoFromTo(indexer=indexer, categoria_name=name,
+                                    categoria_desc=desc)
+            for indexer, name, desc in sources.iter_categorias_fromto(
+                indexers)], ignore_conflicts=True)
+
+    domain.generate_execucoes_contratos()
+    return created
+
+
+def _build_empenho_sof_cache(contrato, empenho):
+    empenho = EmpenhoSOFCache(**empenho, **_get_contrato_fields(contrato))
+    empenho.indexer = empenho.build_indexer()
+    return empenho
+
+
+def seed_escolas(count, years, seed=0, batch_size=BATCH_SIZE):
+    """
+    Creates `count` escolas with their infos, as returned by the EOL API,
+    and their budgets and recursos, as in the from-to spreadsheets, for each
+    one of the last `years` years, then fills the infos budget data as the
+    regionalizacao ETL does.
+    """
+    from regionalizacao import services
+
+    models = regionalizacao_models
+    sources = SyntheticSources(years=years, orcamentos=0, empenhos=0,
+                               contratos=0, sof_empenhos=0, escolas=count,
+                               seed=seed)
+    with transaction.atomic():
+        dres, distritos, tipos = _seed_escolas_dimensions(sources)
+        subgrupos = _seed_recursos_subgrupos()
+
+        created = insert_objects(models.Escola, (
+            models.Escola(codesc=escola['codesc'])
+            for escola in sources.iter_eol_escolas(sources.last_year)),
+            batch_size)
+        escolas = dict(models.Escola.objects.values_list('codesc', 'id'))
+
+        insert_objects(models.EscolaInfo, (
+            _build_escola_info(escola, year, escolas, dres, distritos, tipos)
+            for year in sources.years
+            for escola in sources.iter_eol_escolas(year)), batch_size)
+        insert_objects(models.Budget, (
+            models.Budget(escola_id=escolas[codesc], year=year, ptrf=ptrf)
+            for year in sources.years
+            for codesc, ptrf in sources.iter_ptrf_fromto(year)), batch_size)
+        budgets = {(escola_id, year): budget_id
+                   for budget_id, escola_id, year in models.Budget.objects
+                   .values_list('id', 'escola_id', 'year').iterator()}
+        # labels other than R$ are amounts, as the from-to is applied
+        insert_objects(models.Recurso, (
+            models.Recurso(budget_id=budgets[escolas[codesc], year],
+                           subgrupo_id=subgrupos[grupo, subgrupo],
+                           amount=valor, label=label)
+            for year in sources.years
+            for codesc, grupo, subgrupo, valor, label
+            in sources.iter_unidade_recursos_fromto(year)), batch_size)
+
+    services.populate_escola_info_budget_data()
+    services.update_updated_at_date()
+    services.update_dataset_metadata()
+    return created
+
+
+def _seed_escolas_dimensions(sources):
+    """Dres, distritos and tipos of escola of the escolas, with their
+    from-tos applied. Returns their ids by code"""
+    models = regionalizacao_models
+    dres, distritos = {}, {}
+    for escola in sources.iter_eol_escolas(sources.last_year):
+        dres[escola['dre']] = escola['diretoria']
+        distritos[escola['coddist']] = escola['distrito']
+    zonas = dict(sources.iter_distrito_zona_fromto())
+
+    models.Dre.objects.bulk_create([
+        models.Dre(code=code, name=name) for code, name in dres.items()],
+        ignore_conflicts=True)
+    models.Distrito.objects.bulk_create([
+        models.Distrito(coddist=coddist, name=name, zona=zonas.get(coddist))
+        for coddist, name in distritos.items()], ignore_conflicts=True)
+    models.TipoEscola.objects.bulk_create([
+        models.TipoEscola(code=code, desc=desc, etapa=etapa)
+        for code, desc, etapa in sources.iter_etapa_tipo_escola_fromto()],
+        ignore_conflicts=True)
+
+    return (
+        dict(models.Dre.objects.values_list('code', 'id')),
+        dict(models.Distrito.objects.values_list('coddist', 'id')),
+        dict(models.TipoEscola.objects.values_list('code', 'id')),
+    )
+
+
+def _seed_recursos_subgrupos():
+    models = regionalizacao_models
+    subgrupos = {}
+    for grupo_name, subgrupo_names in RECURSOS_GRUPOS.items():
+        grupo, _ = models.Grupo.objects.get_or_create(name=grupo_name)
+        for name in subgrupo_names:
+            subgrupo, _ = models.Subgrupo.objects.get_or_create(grupo=grupo,
+                                                                name=name)
+            subgrupos[grupo_name, name] = subgrupo.id
+    return subgrupos
+
+
+def _build_escola_info(escola, year, escolas, dres, distritos, tipos):
+    return regionalizacao_models.EscolaInfo(
+        escola_id=escolas[escola['codesc']],
+        year=year,
+        dre_id=dres[escola['dre']],
+        tipoesc_id=tipos[escola['tipoesc']],
+        distrito_id=distritos[escola['coddist']],
+        nomesc=escola['nomesc'],
+        endereco=escola['endereco'],
+        numero=escola['numero'],
+        bairro=escola['bairro'],
+        cep=escola['cep'],
+        rede=escola['rede'],
+        latitude=Decimal(escola['latitude']),
+        longitude=Decimal(escola['longitude']),
+        total_vagas=escola['total_vagas'],
+        qtd_matriculas=escola['total_matriculados'],
+        qtd_servidores=escola['total_servidores'],
+    )
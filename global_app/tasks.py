@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from global_app.prerender import prerender_after_etl
+
+
+@shared_task
+def prerender_pages(*apps):
+    prerender_after_etl(*apps)
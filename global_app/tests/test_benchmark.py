@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from django.db import connection
+
+from global_app import benchmark
+from global_app.benchmark import BenchmarkCase, SkipCase
+
+
+def query():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+@pytest.mark.django_db
+def test_measure_counts_queries_and_memory():
+    def func():
+        query()
+        query()
+        return [0] * 100000
+
+    result = benchmark.measure(func, repeat=3)
+
+    assert 3 == len(result['wall_times'])
+    assert 2 == result['queries']
+    assert result['peak_memory'] >= 100000 * 8
+
+
+@pytest.mark.django_db
+def test_measure_without_memory():
+    result = benchmark.measure(query, trace_memory=False)
+
+    assert 1 == result['queries']
+    assert result['peak_memory'] is None
+
+
+def test_run_cases_keeps_going_after_skips_and_errors():
+    calls = []
+
+    def skip():
+        raise SkipCase('no data')
+
+    def error():
+        raise ValueError('boom')
+
+    cases = [
+        BenchmarkCase('group', 'skipped', skip),
+        BenchmarkCase('group', 'error', error),
+        BenchmarkCase('group', 'ok', lambda: calls.append('run'),
+                      setup=lambda: calls.append('setup')),
+    ]
+    results = benchmark.run_cases(cases, trace_memory=False)
+
+    assert ['skipped', 'error', 'ok'] == [r['status'] for r in results]
+    assert 'no data' == results[0]['reason']
+    assert "ValueError('boom')" == results[1]['reason']
+    assert ['setup', 'run'] == calls
+
+
+def test_get_view_skips_without_data(client):
+    func = benchmark.get_view(client, 'mosaico:subgrupos', [None])
+
+    with pytest.raises(SkipCase):
+        func()
+
+
+def test_get_view_skips_not_routed_views(client):
+    func = benchmark.get_view(client, 'unknown:home')
+
+    with pytest.raises(SkipCase):
+        func()
+
+
+def test_write_report(tmpdir):
+    output = os.path.join(str(tmpdir), 'results.json')
+    results = [{'group': 'group', 'name': 'name', 'status': 'ok'}]
+
+    benchmark.write_report(results, output, scale=0.1)
+
+    with open(output) as fh:
+        report = json.load(fh)
+    assert results == report['results']
+    assert {'scale': 0.1} == report['params']
+    assert 'created_at' in report
+
+
+@pytest.mark.django_db
+def test_view_cases_run_over_seeded_data(client, tmpdir, settings):
+    settings.MEDIA_ROOT = str(tmpdir)
+    benchmark.seed(execucoes=120, empenhos=40, escolas=6, years=2)
+
+    results = benchmark.run_cases(benchmark.view_cases(client),
+                                  trace_memory=False)
+
+    statuses = {r['status'] for r in results}
+    assert 'error' not in statuses, [r for r in results
+                                     if r['status'] == 'error']
+    assert 'ok' in statuses
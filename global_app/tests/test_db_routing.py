@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router
+from django.http import HttpResponse
+from django.test import Client, override_settings
+from django.urls import include, path
+
+from global_app.db_routing import (
+    PRIMARY_COOKIE, primary_database, replica_database)
+
+
+def read_database_view(request):
+    return HttpResponse(str(router.db_for_read(User)))
+
+
+@primary_database()
+def primary_view(request):
+    return read_database_view(request)
+
+
+public_urls = ([
+    path('view/', read_database_view, name='view'),
+    path('primary/', primary_view, name='primary'),
+], 'mosaico')
+admin_urls = ([path('view/', read_database_view, name='view')], 'admin')
+
+urlpatterns = [
+    path('mosaico/', include(public_urls)),
+    path('admin/', include(admin_urls)),
+]
+
+with_replica = override_settings(
+    ROOT_URLCONF=__name__,
+    DATABASES=dict(settings.DATABASES, replica=settings.DATABASES['default']))
+
+
+def get_read_database(response):
+    return response.content.decode()
+
+
+@with_replica
+def test_public_views_read_from_replica():
+    response = Client().get('/mosaico/view/')
+
+    assert 'replica' == get_read_database(response)
+    assert PRIMARY_COOKIE not in response.cookies
+
+
+@with_replica
+def test_admin_reads_from_primary():
+    response = Client().get('/admin/view/')
+
+    assert 'default' == get_read_database(response)
+
+
+@with_replica
+def test_reads_after_a_write_go_to_primary():
+    client = Client()
+    response = client.post('/mosaico/view/')
+
+    assert 'default' == get_read_database(response)
+    assert PRIMARY_COOKIE in response.cookies
+    assert 'default' == get_read_database(client.get('/mosaico/view/'))
+
+
+@with_replica
+def test_view_pinned_to_primary():
+    response = Client().get('/mosaico/primary/')
+
+    assert 'default' == get_read_database(response)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+def test_reads_from_primary_without_replica():
+    response = Client().get('/mosaico/view/')
+
+    assert 'default' == get_read_database(response)
+
+
+def test_router():
+    assert 'default' == router.db_for_read(User)
+    with replica_database():
+        assert 'replica' == router.db_for_read(User)
+        assert 'default' == router.db_for_write(User)
+        with primary_database():
+            assert 'default' == router.db_for_read(User)
+    assert router.allow_migrate('default', 'budget_execution')
+    assert not router.allow_migrate('replica', 'budget_execution')
@@ -0,0 +1,200 @@
+import io
+import json
+import zipfile
+
+from unittest.mock import patch
+
+import pytest
+
+from django.db import connection
+from model_mommy import mommy
+
+from budget_execution.models import EmpenhoRaw, OrcamentoRaw
+from contratos.models import (
+    CategoriaContrato, ExecucaoContrato, Fornecedor, ModalidadeContrato,
+    ObjetoContrato)
+from global_app.dumps import (
+    MANIFEST_FILENAME, export_dump, import_dump, insert_objects,
+    iter_json_array, load_fixture_zip)
+from global_app.synthetic import SyntheticSources, write_sources
+
+
+ITEMS = [{'model': 'app.model', 'pk': 1, 'fields': {'desc': '[a, {b}]'}},
+         12345, 'text', [1, [2]], None, {'pk': 2}]
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 1024])
+def test_iter_json_array(read_size):
+    fh = io.StringIO(' \n' + json.dumps(ITEMS, indent=1))
+    assert ITEMS == list(iter_json_array(fh, read_size=read_size))
+
+
+def test_iter_empty_json_array():
+    assert [] == list(iter_json_array(io.StringIO('[ ]')))
+
+
+@pytest.mark.parametrize('content', ['{"a": 1}', '[{"a": 1}, {"a"', '[1, 2'])
+def test_iter_invalid_json_array(content):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(content), read_size=2))
+
+
+def write_fixture_zip(filepath, records):
+    with zipfile.ZipFile(filepath, 'w') as zip_file:
+        zip_file.writestr('dump.json', json.dumps(records))
+    return str(filepath)
+
+
+@pytest.mark.django_db
+class TestLoadFixtureZip:
+
+    def test_load_raw_tables_dump(self, tmp_path):
+        write_sources(SyntheticSources(
+            years=2, orcamentos=40, empenhos=100, contratos=0,
+            sof_empenhos=0, escolas=0), str(tmp_path))
+        filepath = str(tmp_path / 'orcamento_empenhos_raw_dump.zip')
+
+        with zipfile.ZipFile(filepath) as zip_file:
+            records = json.loads(zip_file.read(zip_file.filelist[0]))
+
+        counts = load_fixture_zip(filepath, batch_size=30)
+
+        assert {OrcamentoRaw: 40, EmpenhoRaw: 100} == counts
+        assert 40 == OrcamentoRaw.objects.count()
+        assert 100 == EmpenhoRaw.objects.count()
+        record = records[-1]
+        empenho = EmpenhoRaw.objects.get(pk=record['pk'])
+        assert record['fields']['cd_orgao'] == empenho.cd_orgao
+        # loaded as they are in the dump
+        assert record['fields']['dt_data_loaded'][:19] == \
+            empenho.dt_data_loaded.isoformat()[:19]
+
+    def test_load_keeps_primary_keys(self, tmp_path):
+        filepath = write_fixture_zip(tmp_path / 'dump.zip', [
+            {'model': 'contratos.fornecedor', 'pk': 10,
+             'fields': {'razao_social': 'Fornecedor'}},
+            {'model': 'contratos.objetocontrato', 'pk': 20,
+             'fields': {'desc': 'Objeto'}},
+            {'model': 'contratos.objetocontrato', 'pk': 21,
+             'fields': {'desc': 'Outro objeto'}},
+        ])
+
+        counts = load_fixture_zip(filepath)
+
+        assert {Fornecedor: 1, ObjetoContrato: 2} == counts
+        assert 'Fornecedor' == Fornecedor.objects.get(pk=10).razao_social
+        assert [20, 21] == list(
+            ObjetoContrato.objects.order_by('pk').values_list('pk', flat=True))
+        # the sequences continue after the loaded keys
+        assert 11 == Fornecedor.objects.create(razao_social='Novo').pk
+
+    def test_load_without_postgres(self, tmp_path):
+        filepath = write_fixture_zip(tmp_path / 'dump.zip', [
+            {'model': 'contratos.objetocontrato', 'pk': pk,
+             'fields': {'desc': f'Objeto {pk}'}} for pk in range(1, 6)])
+
+        with patch.object(connection, 'vendor', 'sqlite'):
+            counts = load_fixture_zip(filepath, batch_size=2)
+
+        assert {ObjetoContrato: 5} == counts
+        assert 'Objeto 5' == ObjetoContrato.objects.get(pk=5).desc
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('vendor', ['postgresql', 'sqlite'])
+def test_insert_objects_without_primary_keys(vendor):
+    mommy.make(ObjetoContrato)
+
+    with patch.object(connection, 'vendor', vendor):
+        count = insert_objects(ObjetoContrato, (
+            ObjetoContrato(desc=f'Objeto {index}') for index in range(5)),
+            batch_size=2)
+
+    assert 5 == count
+    assert 'Objeto 4' == ObjetoContrato.objects.latest('pk').desc
+    assert 6 == ObjetoContrato.objects.count()
+    assert 0 == insert_objects(ObjetoContrato, [])
+
+
+@pytest.mark.django_db
+class TestColumnarDump:
+
+    @pytest.fixture
+    def execucoes(self):
+        categoria = mommy.make(CategoriaContrato)
+        for categoria in (categoria, None):
+            mommy.make(ExecucaoContrato, categoria=categoria, empenho=None,
+                       _quantity=3)
+
+    def get_rows(self):
+        return {model: list(model.objects.order_by('pk').values_list())
+                for model in (ExecucaoContrato, CategoriaContrato, Fornecedor,
+                              ModalidadeContrato, ObjetoContrato)}
+
+    def export(self, tmp_path):
+        export_dump('execucoes_contratos', str(tmp_path),
+                    rows_per_partition=4)
+        return tmp_path / 'execucoes_contratos'
+
+    def test_export(self, tmp_path, execucoes):
+        dump_dir = self.export(tmp_path)
+
+        with open(dump_dir / MANIFEST_FILENAME) as fh:
+            manifest = json.load(fh)
+        tables = {table['model']: table for table in manifest['tables']}
+        execucoes_table = tables['contratos.ExecucaoContrato']
+        assert 'csv.gz' == manifest['format']
+        assert 6 == execucoes_table['rows']
+        assert [4, 2] == [partition['rows']
+                          for partition in execucoes_table['partitions']]
+        assert {'name': 'categoria_id', 'type': 'ForeignKey',
+                'null': True} in execucoes_table['columns']
+        assert 1 == tables['contratos.CategoriaContrato']['rows']
+
+    def test_import(self, tmp_path, execucoes):
+        dump_dir = self.export(tmp_path)
+        expected = self.get_rows()
+        for model in expected:
+            model.objects.all().delete()
+
+        counts = import_dump(str(dump_dir))
+
+        assert 6 == counts[ExecucaoContrato]
+        assert expected == self.get_rows()
+        # the sequences continue after the imported keys
+        assert mommy.make(Fornecedor).pk > max(
+            row[0] for row in expected[Fornecedor])
+
+    def test_import_replacing_rows(self, tmp_path, execucoes):
+        dump_dir = self.export(tmp_path)
+        expected = self.get_rows()
+
+        import_dump(str(dump_dir), replace=True)
+
+        assert expected == self.get_rows()
+
+    def test_import_without_postgres(self, tmp_path, execucoes):
+        dump_dir = self.export(tmp_path)
+        expected = self.get_rows()
+
+        with patch.object(connection, 'vendor', 'sqlite'), \
+                patch.object(connection.ops, 'sequence_reset_sql',
+                             return_value=[]):
+            import_dump(str(dump_dir), replace=True, batch_size=4)
+
+        rows = self.get_rows()
+        # bulk_create fills dt_created again
+        assert [row[:-2] for row in expected.pop(ExecucaoContrato)] == \
+            [row[:-2] for row in rows.pop(ExecucaoContrato)]
+        assert expected == rows
+
+    def test_import_unknown_column(self, tmp_path, execucoes):
+        dump_dir = self.export(tmp_path)
+        with open(dump_dir / MANIFEST_FILENAME) as fh:
+            manifest = json.load(fh)
+        manifest['tables'][0]['columns'][1]['name'] = 'unknown'
+        with open(dump_dir / MANIFEST_FILENAME, 'w') as fh:
+            json.dump(manifest, fh)
+
+        with pytest.raises(ValueError):
+            import_dump(str(dump_dir))
@@ -0,0 +1,160 @@
+import json
+import os
+
+from unittest.mock import patch
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from global_app.etl_metrics import (
+    EtlRun, etl_run, etl_stage, record_rows, reset_peak_rss)
+
+
+pytestmark = pytest.mark.django_db
+
+
+@etl_stage
+def load(rows):
+    record_rows(rows_in=rows)
+    User.objects.count()
+    return transform(rows) // 2
+
+
+@etl_stage
+def transform(rows):
+    User.objects.count()
+    User.objects.count()
+    return rows
+
+
+@etl_stage
+def check():
+    return True
+
+
+@etl_stage
+def fail():
+    raise ValueError('bad data')
+
+
+MIB = 2 ** 20
+
+
+@etl_stage
+def allocate(size):
+    data = b'x' * size
+    return len(data)
+
+
+@etl_stage
+def load_allocating(size):
+    return allocate(size)
+
+
+@pytest.fixture
+def reports_dir(tmp_path):
+    with override_settings(ETL_REPORTS_DIR=str(tmp_path),
+                           ETL_METRICS_PUSHGATEWAY_URL=''):
+        yield tmp_path
+
+
+def read_report(reports_dir):
+    filenames = os.listdir(reports_dir)
+    assert 1 == len(filenames)
+    with open(reports_dir / filenames[0]) as fh:
+        return json.load(fh)
+
+
+def test_stage_outside_a_run():
+    assert 5 == load(10)
+
+
+def test_run_records_stages(reports_dir):
+    with etl_run('pipeline') as run:
+        load(10)
+        check()
+
+    load_stage, transform_stage, check_stage = run.stages
+    assert 'transform' == transform_stage.name
+    assert 'load' == transform_stage.parent
+    assert 10 == transform_stage.rows_out
+    assert 2 == transform_stage.queries
+
+    assert 'load' == load_stage.name
+    assert load_stage.parent is None
+    assert 10 == load_stage.rows_in
+    assert 5 == load_stage.rows_out
+    assert 3 == load_stage.queries
+    assert 'ok' == load_stage.status
+    assert load_stage.peak_rss > 0
+    assert load_stage.duration >= transform_stage.duration
+
+    # booleans aren't rows
+    assert check_stage.rows_out is None
+    assert check_stage.rows_per_second is None
+
+
+@pytest.mark.skipif(not reset_peak_rss(),
+                    reason="the peak RSS can't be reset")
+def test_stages_record_their_own_peak_rss(reports_dir):
+    with etl_run('pipeline') as run:
+        load_allocating(200 * MIB)
+        check()
+
+    load_stage, allocate_stage, check_stage = run.stages
+    assert allocate_stage.peak_rss >= 200 * MIB
+    assert load_stage.peak_rss >= allocate_stage.peak_rss
+    # the memory freed by the previous stages isn't counted
+    assert check_stage.peak_rss < allocate_stage.peak_rss - 100 * MIB
+    assert run.peak_rss >= load_stage.peak_rss
+
+
+def test_run_writes_report(reports_dir):
+    with etl_run('pipeline'):
+        load(10)
+
+    report = read_report(reports_dir)
+    assert 'pipeline' == report['pipeline']
+    assert 'ok' == report['status']
+    assert ['load', 'transform'] == \
+        [stage['name'] for stage in report['stages']]
+    assert 10 == report['stages'][0]['rows_in']
+
+
+def test_run_records_errors(reports_dir):
+    with pytest.raises(ValueError):
+        with etl_run('pipeline'):
+            load(10)
+            fail()
+
+    report = read_report(reports_dir)
+    assert 'error' == report['status']
+    assert "ValueError('bad data')" == report['error']
+    assert ['ok', 'ok', 'error'] == \
+        [stage['status'] for stage in report['stages']]
+
+
+def test_get_metrics():
+    run = EtlRun('pipeline')
+    with run.stage('load') as stage:
+        stage.rows_out = 10
+    run.finish()
+
+    metrics = run.get_metrics()
+    assert 'etl_run_success{pipeline="pipeline"} 1\n' in metrics
+    assert 'etl_stage_rows_out{pipeline="pipeline",stage="load"} 10\n' in \
+        metrics
+    assert 'etl_stage_rows_in{' not in metrics
+
+
+@patch('global_app.etl_metrics.requests.put')
+def test_run_pushes_metrics(mock_put, reports_dir):
+    with override_settings(ETL_METRICS_PUSHGATEWAY_URL='http://gateway/'):
+        with etl_run('pipeline') as run:
+            load(10)
+
+    mock_put.assert_called_once_with(
+        'http://gateway/metrics/job/etl/pipeline/pipeline',
+        data=run.get_metrics(), timeout=10)
@@ -0,0 +1,138 @@
+import importlib
+import io
+import os
+
+import pytest
+
+from openpyxl import load_workbook
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, override_settings
+
+from core.settings import base
+
+from global_app.http import serve_file, stream_csv, stream_xlsx
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def filepath(tmpdir):
+    path = os.path.join(str(tmpdir), 'file_2019.xlsx')
+    with open(path, 'wb') as fh:
+        fh.write(CONTENT)
+    return path
+
+
+def get(filepath, **headers):
+    request = RequestFactory().get('/download/', **headers)
+    return serve_file(request, filepath, content_type='application/x-test')
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+class TestServeFile:
+
+    def test_streams_whole_file(self, filepath):
+        response = get(filepath)
+
+        assert 200 == response.status_code
+        assert response.streaming
+        assert CONTENT == content(response)
+        assert 'bytes' == response['Accept-Ranges']
+        assert 'inline; filename=file_2019.xlsx' == \
+            response['Content-Disposition']
+
+    def test_etag_from_mtime_and_size(self, filepath):
+        stat = os.stat(filepath)
+        response = get(filepath)
+        assert f'"{int(stat.st_mtime):x}-{stat.st_size:x}"' == \
+            response['ETag']
+
+    def test_not_modified(self, filepath):
+        etag = get(filepath)['ETag']
+        response = get(filepath, HTTP_IF_NONE_MATCH=etag)
+        assert 304 == response.status_code
+
+    def test_range(self, filepath):
+        response = get(filepath, HTTP_RANGE='bytes=10-19')
+
+        assert 206 == response.status_code
+        assert CONTENT[10:20] == content(response)
+        assert '10' == response['Content-Length']
+        assert f'bytes 10-19/{len(CONTENT)}' == response['Content-Range']
+
+    def test_open_and_suffix_ranges(self, filepath):
+        response = get(filepath, HTTP_RANGE='bytes=1000-')
+        assert CONTENT[1000:] == content(response)
+
+        response = get(filepath, HTTP_RANGE='bytes=-5')
+        assert CONTENT[-5:] == content(response)
+
+    def test_unsatisfiable_range(self, filepath):
+        response = get(filepath, HTTP_RANGE='bytes=5000-')
+        assert 416 == response.status_code
+        assert f'bytes */{len(CONTENT)}' == response['Content-Range']
+
+    def test_ignores_invalid_range(self, filepath):
+        response = get(filepath, HTTP_RANGE='bytes=5-2')
+        assert 200 == response.status_code
+        assert CONTENT == content(response)
+
+    def test_ignores_range_when_if_range_doesnt_match(self, filepath):
+        response = get(filepath, HTTP_RANGE='bytes=10-19',
+                       HTTP_IF_RANGE='"stale"')
+        assert 200 == response.status_code
+        assert CONTENT == content(response)
+
+    def test_sendfile_with_nginx(self, filepath, tmpdir):
+        with override_settings(DOWNLOADS_SENDFILE='nginx',
+                               DOWNLOADS_SENDFILE_ROOT=str(tmpdir),
+                               DOWNLOADS_SENDFILE_URL='/protected/'):
+            response = get(filepath)
+
+        assert '/protected/file_2019.xlsx' == response['X-Accel-Redirect']
+        assert b'' == response.content
+
+
+class TestStreamSpreadsheets:
+
+    header = ['id', 'nome']
+
+    def rows(self):
+        yield [1, 'Um']
+        yield [2, 'Dois, três']
+
+    def test_stream_csv(self):
+        response = stream_csv(self.header, self.rows(), 'file.csv')
+
+        assert response.streaming
+        assert 'attachment; filename=file.csv' == \
+            response['Content-Disposition']
+        expected = 'id,nome\r\n1,Um\r\n2,"Dois, três"\r\n'.encode('utf-8')
+        assert expected == content(response)
+
+    @override_settings(DOWNLOADS_SPOOL_MAX_SIZE=10)
+    def test_stream_xlsx(self):
+        response = stream_xlsx(self.header, self.rows(), 'file.xlsx')
+
+        data = content(response)
+        assert str(len(data)) == response['Content-Length']
+        assert 'attachment; filename=file.xlsx' == \
+            response['Content-Disposition']
+        ws = load_workbook(io.BytesIO(data)).active
+        assert [('id', 'nome'), (1, 'Um'), (2, 'Dois, três')] == \
+            list(ws.values)
+
+
+def test_unknown_sendfile_setting(monkeypatch):
+    monkeypatch.setenv('DOWNLOADS_SENDFILE', 'true')
+    try:
+        with pytest.raises(ImproperlyConfigured):
+            importlib.reload(base)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(base)
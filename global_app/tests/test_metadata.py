@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from django.test import override_settings
+
+from global_app import metadata
+from global_app.models import DatasetMetadata
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    metadata.clear_cache()
+    yield
+    metadata.clear_cache()
+
+
+@pytest.mark.django_db
+class TestUpdateDatasetMetadata:
+
+    def test_creates_metadata(self):
+        dt_updated = datetime(2019, 1, 1, tzinfo=timezone.utc)
+        ret = metadata.update_dataset_metadata(
+            'dataset', dt_updated=dt_updated, years=[2019, 2017, 2018, 2019],
+            row_count=10)
+
+        saved = DatasetMetadata.objects.get(dataset='dataset')
+        assert ret == saved
+        assert dt_updated == saved.dt_updated
+        assert [2017, 2018, 2019] == saved.years
+        assert 2019 == saved.newest_year
+        assert 10 == saved.row_count
+
+    def test_updates_existing_metadata(self):
+        metadata.update_dataset_metadata(
+            'dataset', dt_updated=None, years=[2018], row_count=1)
+        metadata.update_dataset_metadata(
+            'dataset', dt_updated=None, years=[], row_count=0)
+
+        saved = DatasetMetadata.objects.get(dataset='dataset')
+        assert [] == saved.years
+        assert saved.newest_year is None
+        assert 1 == DatasetMetadata.objects.count()
+
+
+@pytest.mark.django_db
+class TestGetDatasetMetadata:
+
+    def test_returns_none_when_not_registered(self):
+        assert metadata.get_dataset_metadata('dataset') is None
+
+    @override_settings(DATASET_METADATA_CACHE_TIMEOUT=60)
+    def test_keeps_metadata_in_process(self, django_assert_num_queries):
+        metadata.update_dataset_metadata(
+            'dataset', dt_updated=None, years=[2018], row_count=1)
+
+        with django_assert_num_queries(0):
+            ret = metadata.get_dataset_metadata('dataset')
+        assert [2018] == ret.years
+
+    @override_settings(DATASET_METADATA_CACHE_TIMEOUT=0)
+    def test_reads_database_when_cache_expires(self):
+        metadata.update_dataset_metadata(
+            'dataset', dt_updated=None, years=[2018], row_count=1)
+        DatasetMetadata.objects.filter(dataset='dataset') \
+            .update(newest_year=2042)
+
+        assert 2042 == metadata.get_dataset_metadata('dataset').newest_year
@@ -0,0 +1,192 @@
+import json
+import os
+
+from unittest.mock import patch
+
+import pytest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse, JsonResponse
+from django.test import Client, override_settings
+from django.urls import include, path, reverse
+
+from global_app import metadata, prerender
+from global_app.prerender import (
+    BYPASS_HEADER, PrerenderedPagesMiddleware, get_page_key,
+    iter_linked_pages, prerender_app)
+
+
+pytestmark = pytest.mark.django_db
+
+
+def page_view(request, page=0):
+    if page > 3:
+        raise Http404
+    data = {
+        'page': page,
+        'year': request.GET.get('year'),
+        'pages': [{'url': reverse('contratos:page', args=[next_page]) +
+                   f'?year={request.GET["year"]}&format=json'}
+                  for next_page in (page + 1, page + 10)],
+        'download_url': reverse('contratos:download'),
+    }
+    if request.GET.get('format') == 'json':
+        return JsonResponse(data)
+    return HttpResponse(f'<p>{page} {data["year"]}</p>')
+
+
+def download_view(request):
+    return HttpResponse('file')
+
+
+app_urls = ([
+    path('', page_view, name='home'),
+    path('page/<int:page>/', page_view, name='page'),
+    path('download/', download_view, name='download'),
+], 'contratos')
+
+urlpatterns = [path('contratos/', include(app_urls))]
+
+
+@pytest.fixture(autouse=True)
+def urls():
+    metadata.clear_cache()
+    prerender.clear_cache()
+    seeds = {'contratos': lambda: [('/contratos/', [('year', '2020')])]}
+    with override_settings(ROOT_URLCONF=__name__), \
+            patch.dict(prerender.APP_SEEDS, seeds):
+        yield
+    metadata.clear_cache()
+    prerender.clear_cache()
+
+
+def update_metadata():
+    metadata.update_dataset_metadata(
+        metadata.CONTRATOS_DATASET, dt_updated=None, years=[2020],
+        row_count=1)
+
+
+def get_content(response):
+    if response.streaming:
+        return b''.join(response.streaming_content).decode()
+    return response.content.decode()
+
+
+def test_get_page_key():
+    assert 'index' == get_page_key([])
+    assert 'a=1&a=2&b=x+y' == get_page_key(
+        [('b', 'x y'), ('format', 'json'), ('a', '2'), ('a', '1')])
+    assert 32 == len(get_page_key([('a', 'x' * 300)]))
+
+
+def test_iter_linked_pages():
+    data = {'breadcrumb': [{'name': 'a', 'url': '/a/?year=2020&zona='}],
+            'root_url': '/b/', 'name': '/c/'}
+
+    assert [('/a/', [('year', '2020'), ('zona', '')]), ('/b/', [])] == \
+        list(iter_linked_pages(data))
+
+
+class TestPrerenderApp:
+
+    def test_writes_the_reachable_pages(self, tmp_path):
+        update_metadata()
+
+        version_dir = prerender_app(str(tmp_path), 'contratos')
+
+        current = tmp_path / 'contratos' / 'current'
+        assert version_dir == os.path.realpath(current)
+        assert '<p>0 2020</p>' == \
+            (current / 'contratos' / 'year=2020.html').read_text()
+        pages = sorted(os.listdir(current / 'contratos' / 'page'))
+        assert ['1', '2', '3'] == pages
+        assert 3 == json.loads(
+            (current / 'contratos' / 'page' / '3' / 'year=2020.json')
+            .read_text())['page']
+        assert not (current / 'contratos' / 'download').exists()
+
+        with open(current / 'manifest.json') as fh:
+            manifest = json.load(fh)
+        assert 4 == manifest['pages']
+        assert manifest['dataset_version']
+
+    def test_keeps_the_newest_versions(self, tmp_path):
+        versions = [prerender_app(str(tmp_path), 'contratos', keep_versions=2)
+                    for _ in range(3)]
+
+        assert sorted(['current'] + [os.path.basename(version)
+                                     for version in versions[1:]]) == \
+            sorted(os.listdir(tmp_path / 'contratos'))
+
+    def test_max_pages(self, tmp_path):
+        prerender_app(str(tmp_path), 'contratos', max_pages=2)
+
+        with open(tmp_path / 'contratos' / 'current' / 'manifest.json') as fh:
+            assert 2 == json.load(fh)['pages']
+
+
+class TestPrerenderedPagesMiddleware:
+
+    @pytest.fixture
+    def page(self, tmp_path):
+        update_metadata()
+        prerender_app(str(tmp_path), 'contratos')
+        filepath = tmp_path / 'contratos' / 'current' / 'contratos' / \
+            'page' / '1' / 'year=2020.html'
+        filepath.write_text('pre-rendered')
+        with override_settings(PRERENDER_ROOT=str(tmp_path)):
+            yield filepath
+
+    def test_serves_the_prerendered_page(self, page):
+        response = Client().get('/contratos/page/1/?year=2020')
+
+        assert 'pre-rendered' == get_content(response)
+        assert 'text/html; charset=utf-8' == response['Content-Type']
+
+    def test_serves_the_prerendered_json(self, page):
+        response = Client().get('/contratos/page/1/', {'format': 'json',
+                                                       'year': 2020})
+
+        assert 'application/json' == response['Content-Type']
+        assert 1 == json.loads(get_content(response))['page']
+
+    def test_renders_pages_not_prerendered(self, page):
+        response = Client().get('/contratos/page/1/?year=2019')
+
+        assert '<p>1 2019</p>' == get_content(response)
+
+    def test_renders_pages_after_the_data_changes(self, page):
+        update_metadata()
+
+        response = Client().get('/contratos/page/1/?year=2020')
+
+        assert '<p>1 2020</p>' == get_content(response)
+
+    def test_crawler_requests_are_rendered(self, page):
+        response = Client().get('/contratos/page/1/?year=2020',
+                                **{BYPASS_HEADER: '1'})
+
+        assert '<p>1 2020</p>' == get_content(response)
+
+
+def test_middleware_is_off_by_default(tmp_path):
+    update_metadata()
+    prerender_app(str(tmp_path), 'contratos')
+
+    response = Client().get('/contratos/page/1/?year=2020')
+
+    assert not response.streaming
+
+
+def test_nginx_must_reach_the_prerendered_pages(tmp_path):
+    sendfile = dict(DOWNLOADS_SENDFILE='nginx',
+                    DOWNLOADS_SENDFILE_ROOT=str(tmp_path / 'protected'))
+
+    with override_settings(PRERENDER_ROOT=str(tmp_path / 'pages'),
+                           **sendfile):
+        with pytest.raises(ImproperlyConfigured):
+            PrerenderedPagesMiddleware(lambda request: None)
+
+    with override_settings(
+            PRERENDER_ROOT=str(tmp_path / 'protected' / 'pages'), **sendfile):
+        assert PrerenderedPagesMiddleware(lambda request: None)
@@ -0,0 +1,135 @@
+import json
+import logging
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.template import engines
+from django.template.response import SimpleTemplateResponse
+from django.test import Client, override_settings
+from django.urls import path
+
+from global_app.profiling import (
+    BudgetExceeded, RequestProfile, profile_section)
+
+
+pytestmark = pytest.mark.django_db
+
+
+def queries_view(request):
+    for _ in range(3):
+        User.objects.count()
+    return HttpResponse('ok')
+
+
+def template_view(request):
+    with profile_section('serializer'):
+        User.objects.count()
+    template = engines['django'].from_string('{{ value }}')
+    return SimpleTemplateResponse(template, {'value': 'ok'})
+
+
+urlpatterns = [
+    path('queries/', queries_view, name='queries'),
+    path('template/', template_view, name='template'),
+]
+
+profiling = override_settings(ROOT_URLCONF=__name__, REQUEST_PROFILING=True,
+                              REQUEST_PROFILING_BUDGETS={})
+
+
+@pytest.fixture
+def log(caplog):
+    # the profiling logger doesn't propagate to the root logger
+    logger = logging.getLogger('global_app.profiling')
+    logger.addHandler(caplog.handler)
+    yield caplog
+    logger.removeHandler(caplog.handler)
+
+
+def get_timings(response):
+    return {metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')}
+
+
+@override_settings(ROOT_URLCONF=__name__, REQUEST_PROFILING=False)
+def test_profiling_is_off_by_default():
+    response = Client().get('/queries/')
+
+    assert 200 == response.status_code
+    assert 'Server-Timing' not in response
+
+
+@profiling
+def test_server_timing_header():
+    response = Client().get('/queries/')
+
+    timings = get_timings(response)
+    assert {'db', 'view', 'total'} == set(timings)
+    assert timings['db'].endswith(';desc="3 queries"')
+
+
+@profiling
+def test_server_timing_header_with_sections_and_render():
+    response = Client().get('/template/')
+
+    assert b'ok' == response.content
+    assert {'db', 'view', 'render', 'serializer', 'total'} == \
+        set(get_timings(response))
+
+
+@profiling
+def test_logs_profile_as_json(log):
+    Client().get('/queries/?a=1')
+
+    record = json.loads(log.records[-1].getMessage())
+    assert 'GET' == record['method']
+    assert '/queries/?a=1' == record['path']
+    assert 'queries' == record['view']
+    assert 200 == record['status']
+    assert 3 == record['queries']
+    assert 2 == record['size']
+    assert 3 == len(record['slowest_queries'])
+    assert {'db', 'view', 'total'} == set(record['timings'])
+
+
+@profiling
+def test_budget_exceeded_raises_when_strict():
+    with override_settings(REQUEST_PROFILING_STRICT=True,
+                           REQUEST_PROFILING_BUDGETS={
+                               'queries': {'queries': 2}}):
+        with pytest.raises(BudgetExceeded, match='queries 3 > 2'):
+            Client().get('/queries/')
+
+
+@profiling
+def test_budget_exceeded_is_logged(log):
+    budgets = {'*': {'queries': 2, 'size': 1}, 'template': {'queries': 5}}
+    with override_settings(REQUEST_PROFILING_STRICT=False,
+                           REQUEST_PROFILING_BUDGETS=budgets):
+        response = Client().get('/queries/')
+        assert 200 == response.status_code
+        Client().get('/template/')
+
+    warnings = [record.getMessage() for record in log.records
+                if record.levelno == logging.WARNING]
+    assert ['queries exceeded its budget: queries 3 > 2, size 2 > 1'] == \
+        warnings
+
+
+def test_profile_keeps_slowest_queries():
+    profile = RequestProfile(slowest=2)
+    for duration, sql in [(0.1, 'a'), (0.3, 'b'), (0.2, 'c'), (0.05, 'd')]:
+        profile.add_query(sql, duration)
+    profile.end = profile.start
+
+    slowest = profile.as_dict()['slowest_queries']
+    assert 4 == profile.queries
+    assert ['b', 'c'] == [query['sql'] for query in slowest]
+    assert pytest.approx(650) == profile.get_timings()['db']
+
+
+def test_profile_section_without_profile():
+    with profile_section('serializer'):
+        pass
@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import zipfile
+
+from collections import Counter
+from datetime import date
+
+import pytest
+
+from django.core.management import call_command
+from openpyxl import load_workbook
+
+from budget_execution import services
+from budget_execution.models import (
+    Empenho, EmpenhoRaw, Execucao, Orcamento, OrcamentoRaw)
+from contratos.models import (
+    ContratoRaw, EmpenhoSOFCache, EmpenhoSOFCacheTemp, ExecucaoContrato)
+from global_app import synthetic
+from global_app.synthetic import (
+    SyntheticSources, load_sources, skewed_sampler, write_sources)
+from regionalizacao.models import Budget, EscolaInfo, Recurso
+
+
+pytestmark = pytest.mark.django_db
+
+
+def small_sources(**kwargs):
+    params = dict(years=2, orcamentos=40, empenhos=100, contratos=10,
+                  sof_empenhos=30, escolas=5)
+    params.update(kwargs)
+    return SyntheticSources(**params)
+
+
+def test_skewed_sampler():
+    choose = skewed_sampler(random.Random(0), 100, skew=1.5)
+    counts = Counter(choose() for _ in range(1000))
+
+    assert set(counts) <= set(range(100))
+    assert counts[0] > counts[50]
+
+
+def test_sources_are_deterministic():
+    first = list(small_sources(seed=1).iter_empenhos_raw())
+    second = list(small_sources(seed=1).iter_empenhos_raw())
+
+    def values(rows):
+        return [(row['cd_projeto_atividade'], row['vl_empenho_liquido'])
+                for row in rows]
+    assert values(first) == values(second)
+    assert values(first) != values(small_sources(seed=2).iter_empenhos_raw())
+
+
+def test_orcamentos_over_capacity():
+    with pytest.raises(ValueError):
+        small_sources(orcamentos=10 ** 9)
+
+
+def test_empenhos_match_orcamentos_lines():
+    sources = small_sources()
+    orcamentos = {(row['cd_ano_execucao'], row['cd_projeto_atividade'],
+                   row['cd_elemento'], row['cd_fonte'], row['cd_modalidade'])
+                  for row in sources.iter_orcamentos_raw()}
+    empenhos = {(row['an_empenho'], int(row['cd_projeto_atividade']),
+                 int(row['cd_elemento']), int(row['cd_fonte_de_recurso']),
+                 row['cd_modalidade'])
+                for row in sources.iter_empenhos_raw()}
+
+    assert 40 == len(orcamentos)
+    assert empenhos <= orcamentos
+
+
+def test_load_sources():
+    counts = load_sources(small_sources())
+
+    assert {'orcamentos': 40, 'empenhos': 100, 'contratos': 10,
+            'sof_empenhos': 30} == counts
+    assert 40 == OrcamentoRaw.objects.count()
+    assert 100 == EmpenhoRaw.objects.count()
+    assert 10 == ContratoRaw.objects.count()
+    assert 30 == EmpenhoSOFCacheTemp.objects.count()
+    assert not EmpenhoRaw.objects.filter(dt_data_loaded__isnull=True).exists()
+
+    # the current year raw data is read by the budget ETL
+    assert 20 == services.load_data_from_orcamento_raw()
+    assert 50 == services.load_data_from_empenhos_raw()
+    assert 20 == Orcamento.objects.count()
+    assert 50 == Empenho.objects.count()
+
+
+def test_load_sources_twice_continues_ids():
+    load_sources(small_sources())
+    load_sources(small_sources())
+
+    assert 80 == OrcamentoRaw.objects.count()
+    assert 200 == EmpenhoRaw.objects.count()
+
+
+def test_write_sources(tmp_path):
+    sources = small_sources()
+    write_sources(sources, str(tmp_path))
+    this_year = date.today().year
+
+    with zipfile.ZipFile(tmp_path / 'contratos_raw_dump.zip') as zip_file:
+        zip_file.extractall(tmp_path)
+    call_command('loaddata', str(tmp_path / 'contratos_raw_dump.json'),
+                 verbosity=0)
+    assert 10 == ContratoRaw.objects.count()
+
+    sof_files = os.listdir(tmp_path / 'sof')
+    empenhos = []
+    for filename in sof_files:
+        with open(tmp_path / 'sof' / filename) as fh:
+            empenhos += json.load(fh)['lstEmpenhos']
+    assert 30 == len(empenhos)
+
+    with open(tmp_path / 'eol' / f'{this_year}.json') as fh:
+        assert 5 == len(json.load(fh)['results'])
+
+    wb = load_workbook(tmp_path / f'PtrfFromToSpreadsheet_{this_year}.xlsx')
+    rows = list(wb.worksheets[0].values)
+    assert ('codesc', 'vlrepasse') == rows[0]
+    assert 5 == len(rows[1:])
+
+
+def test_seed_execucoes():
+    created = synthetic.seed_execucoes(1000, years=2)
+
+    assert 1000 == created
+    assert 1000 == Execucao.objects.count()
+    this_year = date.today().year
+    assert [this_year - 1, this_year] == Execucao.objects.get_years()
+    assert not Execucao.objects.filter(subgrupo__isnull=True).exists()
+
+
+def test_seed_execucoes_of_the_orcamentos_lines():
+    synthetic.seed_execucoes(40, years=2)
+
+    orcamentos = {(row['cd_ano_execucao'], row['cd_projeto_atividade'],
+                   row['cd_elemento'], row['cd_fonte'], row['cd_modalidade'])
+                  for row in small_sources().iter_orcamentos_raw()}
+    execucoes = {(year.year, *key) for year, *key in Execucao.objects
+                 .values_list('year', 'projeto_id', 'elemento_id', 'fonte_id',
+                              'modalidade_id')}
+    assert orcamentos == execucoes
+
+
+def test_seed_execucoes_is_deterministic():
+    synthetic.seed_execucoes(10, years=1, seed=1)
+    first = list(Execucao.objects.order_by('id')
+                 .values_list('orcado_atualizado', flat=True))
+    Execucao.objects.all().delete()
+
+    synthetic.seed_execucoes(10, years=1, seed=1)
+    second = list(Execucao.objects.order_by('id')
+                  .values_list('orcado_atualizado', flat=True))
+    assert first == second
+
+
+def test_seed_execucoes_over_capacity():
+    with pytest.raises(ValueError):
+        synthetic.seed_execucoes(10 ** 9, years=1)
+
+
+def test_seed_empenhos_sof_cache():
+    synthetic.seed_empenhos_sof_cache(50, years=2)
+
+    assert 50 == EmpenhoSOFCache.objects.count()
+    assert not EmpenhoSOFCache.objects.filter(indexer__isnull=True).exists()
+    assert 50 == ExecucaoContrato.objects.count()
+    assert ExecucaoContrato.objects.filter(categoria__isnull=False).exists()
+
+
+def test_seed_escolas():
+    created = synthetic.seed_escolas(5, years=3)
+
+    assert 5 == created
+    assert 15 == EscolaInfo.objects.count()
+    assert 15 == Budget.objects.count()
+    assert 45 == Recurso.objects.count()
+    assert not EscolaInfo.objects.filter(budget_total__isnull=True).exists()
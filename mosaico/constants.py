@@ -0,0 +1,7 @@
+import os
+
+from django.conf import settings
+
+
+MOSAICO_BASE_DIR = os.path.join(settings.BASE_DIR, '../mosaico')
+GENERATED_DOWNLOADS_PATH = os.path.join(MOSAICO_BASE_DIR, 'data')
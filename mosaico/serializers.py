@@ -1,11 +1,13 @@
 from functools import lru_cache
-from itertools import groupby
 from urllib.parse import urlencode
 
 from django.db.models import Sum
 from rest_framework import serializers
 
-from budget_execution.models import Execucao, FonteDeRecurso
+from budget_execution import labels
+from budget_execution.models import (
+    Elemento, Execucao, FonteDeRecurso, Grupo, ProjetoAtividade, Programa,
+    SubelementoFriendly, Subfuncao, Subgrupo)
 from from_to_handler.models import Deflator
 
 
@@ -15,27 +17,29 @@ class TimeseriesSerializer:
         self.queryset = queryset
         self._deflate = deflate
 
-    def deflate(self, value, year):
-        if self._deflate:
-            try:
-                deflator = Deflator.objects.get(year=year)
-                value = value / deflator.index_number
-            except Deflator.DoesNotExist:
-                pass
-        return value
+    def get_deflators(self, years):
+        """Index numbers of the years with a deflator"""
+        if not self._deflate:
+            return {}
+        return dict(Deflator.objects.filter(year__in=years)
+                    .values_list('year', 'index_number'))
 
     @property
     def data(self):
-        qs = self.queryset
+        # the sums of each year are done by the database
+        totals = self.queryset.order_by().values('year').annotate(
+            orcado=Sum('orcado_atualizado'),
+            empenhado=Sum('empenhado_liquido'),
+        ).order_by('year')
+        totals = list(totals)
+        deflators = self.get_deflators([total['year'] for total in totals])
+
         ret = {}
-        for year, execucoes in groupby(qs, lambda e: e.year):
-            execucoes = list(execucoes)
-            orcado_total = sum(e.orcado_atualizado for e in execucoes)
-            empenhado_total = sum(e.empenhado_liquido for e in execucoes
-                                  if e.empenhado_liquido)
-            ret[year.strftime('%Y')] = {
-                "orcado": self.deflate(orcado_total, year),
-                "empenhado": self.deflate(empenhado_total, year),
+        for total in totals:
+            index_number = deflators.get(total['year'], 1)
+            ret[total['year'].strftime('%Y')] = {
+                "orcado": total['orcado'] / index_number,
+                "empenhado": (total['empenhado'] or 0) / index_number,
             }
 
         return ret
@@ -115,9 +119,8 @@ class BaseExecucaoSerializer(serializers.ModelSerializer):
 
 class GrupoSerializer(BaseExecucaoSerializer):
 
-    grupo_id = serializers.IntegerField(source='subgrupo.grupo_id',
-                                        read_only=True)
-    nome = serializers.CharField(source='subgrupo.grupo.desc', read_only=True)
+    grupo_id = serializers.SerializerMethodField()
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -128,16 +131,22 @@ class GrupoSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'subgrupo__grupo'
 
+    def get_grupo_id(self, obj):
+        return labels.get_grupo_id(obj.subgrupo_id)
+
+    def get_nome(self, obj):
+        return labels.get_label(Grupo, self.get_grupo_id(obj))
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
         return execs.filter(
-            subgrupo__grupo_id=obj.subgrupo.grupo_id)
+            subgrupo__grupo_id=self.get_grupo_id(obj))
 
 
 class SubgrupoSerializer(BaseExecucaoSerializer):
 
-    nome = serializers.CharField(source='subgrupo.desc', read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -148,6 +157,9 @@ class SubgrupoSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'subgrupo'
 
+    def get_nome(self, obj):
+        return labels.get_label(Subgrupo, obj.subgrupo_id)
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
@@ -157,7 +169,7 @@ class SubgrupoSerializer(BaseExecucaoSerializer):
 
 class ElementoSerializer(BaseExecucaoSerializer):
 
-    nome = serializers.CharField(source='elemento.desc', read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -168,6 +180,9 @@ class ElementoSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'elemento'
 
+    def get_nome(self, obj):
+        return labels.get_label(Elemento, obj.elemento_id)
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
@@ -178,8 +193,7 @@ class ElementoSerializer(BaseExecucaoSerializer):
 
 class SubelementoSerializer(ElementoSerializer):
 
-    nome = serializers.CharField(source='subelemento_friendly.desc',
-                                 read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -189,12 +203,16 @@ class SubelementoSerializer(ElementoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'subelemento'
 
+    def get_nome(self, obj):
+        return labels.get_label(SubelementoFriendly,
+                                obj.subelemento_friendly_id)
+
 
 # `Técnico` visualization serializers
 
 class SubfuncaoSerializer(BaseExecucaoSerializer):
 
-    nome = serializers.CharField(source='subfuncao.desc', read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -205,6 +223,9 @@ class SubfuncaoSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'subfuncao'
 
+    def get_nome(self, obj):
+        return labels.get_label(Subfuncao, obj.subfuncao_id)
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
@@ -213,7 +234,7 @@ class SubfuncaoSerializer(BaseExecucaoSerializer):
 
 class ProgramaSerializer(BaseExecucaoSerializer):
 
-    nome = serializers.CharField(source='programa.desc', read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -224,6 +245,9 @@ class ProgramaSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'programa'
 
+    def get_nome(self, obj):
+        return labels.get_label(Programa, obj.programa_id)
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
@@ -234,7 +258,7 @@ class ProgramaSerializer(BaseExecucaoSerializer):
 
 class ProjetoAtividadeSerializer(BaseExecucaoSerializer):
 
-    nome = serializers.CharField(source='projeto.desc', read_only=True)
+    nome = serializers.SerializerMethodField()
 
     class Meta:
         model = Execucao
@@ -244,6 +268,9 @@ class ProjetoAtividadeSerializer(BaseExecucaoSerializer):
         list_serializer_class = ExecucaoListSerializer
         distinct_field = 'projeto'
 
+    def get_nome(self, obj):
+        return labels.get_label(ProjetoAtividade, obj.projeto_id)
+
     @lru_cache(maxsize=10)
     def _execucoes(self, obj):
         execs = self.instance
@@ -1,5 +1,66 @@
+import os
+import shutil
+
 import pandas as pd
 
+from django.db.models import F, Sum
+from django.urls import NoReverseMatch, reverse
+
+from budget_execution.constants import SME_ORGAO_ID
+from budget_execution.models import Execucao
+from global_app.etl_metrics import etl_stage
+from global_app.http import iter_csv, write_xlsx
+from mosaico.constants import GENERATED_DOWNLOADS_PATH
+
+
+# Each download section is grouped by the fields that identify its rows in
+# the drill-down (which are also the args of the next level url), so each row
+# totals what the mosaico page shows for it
+DOWNLOAD_SECTIONS = {
+    'grupos': {
+        'id_field': 'grupo_id',
+        'keys': ['subgrupo__grupo_id'],
+        'nome': 'subgrupo__grupo__desc',
+        'next_level': 'subgrupos',
+    },
+    'subgrupos': {
+        'id_field': 'subgrupo_id',
+        'keys': ['subgrupo__grupo_id', 'subgrupo_id'],
+        'nome': 'subgrupo__desc',
+        'next_level': 'elementos',
+    },
+    'elementos': {
+        'id_field': 'elemento_id',
+        'keys': ['subgrupo__grupo_id', 'subgrupo_id', 'elemento_id'],
+        'nome': 'elemento__desc',
+        'next_level': 'subelementos',
+    },
+    'subelementos': {
+        'id_field': 'subelemento_id',
+        'keys': ['subgrupo_id', 'elemento_id', 'subelemento_id'],
+        'nome': 'subelemento_friendly__desc',
+        'next_level': None,
+    },
+    'subfuncoes': {
+        'id_field': 'subfuncao_id',
+        'keys': ['subfuncao_id'],
+        'nome': 'subfuncao__desc',
+        'next_level': 'programas',
+    },
+    'programas': {
+        'id_field': 'programa_id',
+        'keys': ['subfuncao_id', 'programa_id'],
+        'nome': 'programa__desc',
+        'next_level': 'projetos',
+    },
+    'projetos': {
+        'id_field': 'projeto_id',
+        'keys': ['subfuncao_id', 'programa_id', 'projeto_id'],
+        'nome': 'projeto__desc',
+        'next_level': None,
+    },
+}
+
 
 # EXTRAIR COLUNAS: F, H I
 # COLUNA F: SEPARAR OS VALORES
@@ -63,3 +124,153 @@ def extract_minimo_legal_from_spreadsheet(spreadsheet_obj):
 
     ret_df = pd.concat(dfs)
     return ret_df[['Código', 'Descrição', 'Dotação', 'Despesa']]
+
+
+def get_download_header(section):
+    """
+    Retorna as colunas do download da seção, as mesmas dos serializers
+    :param section: nome da seção do mosaico
+    """
+    spec = DOWNLOAD_SECTIONS[section]
+    header = [spec['id_field'], 'nome', 'orcado_total', 'empenhado_total',
+              'percentual_empenhado', 'pago_total', 'percentual_pago']
+    if spec['next_level']:
+        header.append('url')
+    return header
+
+
+def iter_download_rows(queryset, section, query_string=''):
+    """
+    Gera as linhas do download da seção a partir de uma única consulta
+    agrupada, lida do banco aos poucos
+    :param queryset: execuções já filtradas
+    :param section: nome da seção do mosaico
+    :param query_string: parâmetros adicionados às urls das linhas
+    """
+    spec = DOWNLOAD_SECTIONS[section]
+    keys = spec['keys']
+    rows = queryset.order_by() \
+        .values(*keys, nome=F(spec['nome'])) \
+        .annotate(orcado_total=Sum('orcado_atualizado'),
+                  empenhado_total=Sum('empenhado_liquido'),
+                  pago_total=Sum('vl_pago')) \
+        .order_by(F('orcado_total').desc(nulls_last=True), *keys)
+
+    for row in rows.iterator():
+        orcado = row['orcado_total']
+        empenhado = row['empenhado_total']
+        pago = row['pago_total']
+        line = [
+            row[keys[-1]],
+            row['nome'],
+            orcado,
+            empenhado,
+            empenhado / orcado if empenhado and orcado else 0,
+            pago,
+            pago / empenhado if empenhado and pago else 0,
+        ]
+        if spec['next_level']:
+            args = [row[key] for key in keys]
+            url = reverse(f'mosaico:{spec["next_level"]}', args=args)
+            line.append(url + query_string)
+        yield line
+
+
+def get_downloads_version():
+    """
+    Versão dos downloads gerados, a partir da data de atualização das
+    execuções. Muda a cada execução do ETL
+    """
+    last_modified = Execucao.objects.get_last_modified()
+    if last_modified:
+        return last_modified.strftime('%Y%m%d%H%M%S%f')
+    return None
+
+
+def get_download_filepath(section, extension, year=None, version=None):
+    """
+    Caminho do download gerado para a seção e o ano (ou todos os anos)
+    :param section: nome da seção do mosaico
+    :param extension: csv ou xlsx
+    :param year: ano dos dados. None para todos os anos
+    :param version: versão dos downloads. Por padrão, a atual
+    """
+    version = version or get_downloads_version()
+    if not version:
+        return None
+
+    filename = f'mosaico_{section}'
+    if year:
+        filename += f'_{year}'
+    filename += f'.{extension}'
+    return os.path.join(GENERATED_DOWNLOADS_PATH, version, filename)
+
+
+def get_default_download_queryset(section):
+    """Execuções do download sem filtros, as mesmas do DownloadView"""
+    queryset = Execucao.objects.filter(
+        subgrupo_id__isnull=False, orgao_id=SME_ORGAO_ID,
+        is_minimo_legal=False)
+    if section == 'subelementos':
+        queryset = queryset.filter(subelemento__isnull=False)
+    return queryset
+
+
+@etl_stage
+def generate_download_files():
+    """
+    Gera os downloads em csv e xlsx de cada seção, para cada ano e para
+    todos os anos, no diretório da versão atual. Os arquivos são escritos em
+    um diretório temporário, que só é renomeado ao final. Versões anteriores
+    são removidas. Nada é gerado enquanto o mosaico não estiver nas urls,
+    pois as linhas têm as urls das suas páginas.
+    """
+    try:
+        reverse('mosaico:grupos')
+    except NoReverseMatch:
+        print('mosaico is not routed, the downloads are not generated')
+        return None
+
+    version = get_downloads_version()
+    if not version:
+        return None
+
+    version_dir = os.path.join(GENERATED_DOWNLOADS_PATH, version)
+    tmp_dir = version_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    years = [None] + Execucao.objects.get_years()
+    for section in DOWNLOAD_SECTIONS:
+        queryset = get_default_download_queryset(section)
+        header = get_download_header(section)
+        for year in years:
+            if year:
+                year_queryset = queryset.filter(year__year=year)
+                query_string = f'?year={year}'
+            else:
+                year_queryset = queryset
+                query_string = ''
+
+            for extension in ('csv', 'xlsx'):
+                filepath = get_download_filepath(
+                    section, extension, year, version=version + '.tmp')
+                rows = iter_download_rows(year_queryset, section,
+                                          query_string)
+                with open(filepath, 'wb') as fh:
+                    if extension == 'csv':
+                        fh.writelines(iter_csv(header, rows))
+                    else:
+                        write_xlsx(fh, header, rows)
+
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.rename(tmp_dir, version_dir)
+    _remove_old_versions(version)
+    return version_dir
+
+
+def _remove_old_versions(version):
+    for name in os.listdir(GENERATED_DOWNLOADS_PATH):
+        path = os.path.join(GENERATED_DOWNLOADS_PATH, name)
+        if name != version and os.path.isdir(path):
+            shutil.rmtree(path)
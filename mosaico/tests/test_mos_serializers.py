@@ -119,6 +119,25 @@ class TestTimeseriesSerializer:
 
         assert expected == serializer.data
 
+    def test_serializes_years_without_empenhado(self):
+        mommy.make(Execucao, orcado_atualizado=10, empenhado_liquido=None,
+                   year=date(2019, 1, 1))
+
+        serializer = TimeseriesSerializer(
+            Execucao.objects.filter(year__year=2019))
+
+        assert {'2019': {'orcado': 10, 'empenhado': 0}} == serializer.data
+
+    def test_queries_dont_grow_with_years(self, django_assert_num_queries):
+        for year in range(2010, 2017):
+            mommy.make(Execucao, year=date(year, 1, 1), _quantity=2)
+        serializer = TimeseriesSerializer(Execucao.objects.all(),
+                                          deflate=True)
+
+        # the sums of all the years and their deflators
+        with django_assert_num_queries(2):
+            assert 9 == len(serializer.data)
+
 
 class BaseTestCase:
 
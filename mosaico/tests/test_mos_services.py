@@ -0,0 +1,94 @@
+import csv
+import io
+import os
+
+import pytest
+
+from datetime import date
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.urls import include, path
+from model_mommy.mommy import make
+
+from budget_execution.constants import SME_ORGAO_ID
+from budget_execution.models import Execucao
+from mosaico.services import (
+    DOWNLOAD_SECTIONS,
+    generate_download_files,
+    get_download_filepath,
+    get_downloads_version,
+)
+
+
+# the rows of the downloads link to the mosaico pages, which aren't routed by
+# core.urls yet
+urlpatterns = [path('mosaico/', include('mosaico.urls'))]
+
+
+@pytest.fixture
+def downloads_path(tmpdir):
+    downloads_path = str(tmpdir)
+    with patch('mosaico.services.GENERATED_DOWNLOADS_PATH', downloads_path), \
+            override_settings(ROOT_URLCONF=__name__):
+        yield downloads_path
+
+
+@pytest.fixture
+def execucoes(db):
+    for year in (2018, 2019):
+        make(Execucao, orgao__id=SME_ORGAO_ID, is_minimo_legal=False,
+             subgrupo__id=year, subgrupo__grupo__id=1, elemento__id=1,
+             subelemento__id=1, subfuncao__id=1, programa__id=1,
+             projeto__id=1,
+             year=date(year, 1, 1), orcado_atualizado=1)
+
+
+def read_csv(filepath):
+    with open(filepath, encoding='utf-8') as fh:
+        return list(csv.reader(io.StringIO(fh.read())))
+
+
+def test_generate_download_files(downloads_path, execucoes):
+    version_dir = generate_download_files()
+
+    version = get_downloads_version()
+    assert os.path.join(downloads_path, version) == version_dir
+
+    filenames = sorted(os.listdir(version_dir))
+    assert len(DOWNLOAD_SECTIONS) * 3 * 2 == len(filenames)
+    for section in DOWNLOAD_SECTIONS:
+        for year in (None, 2018, 2019):
+            for extension in ('csv', 'xlsx'):
+                filepath = get_download_filepath(section, extension, year)
+                assert os.path.exists(filepath)
+
+    rows = read_csv(get_download_filepath('subgrupos', 'csv'))
+    assert 3 == len(rows)
+
+    rows = read_csv(get_download_filepath('subgrupos', 'csv', 2018))
+    assert 2 == len(rows)
+    assert '2018' == rows[1][0]
+    assert rows[1][-1].endswith('?year=2018')
+
+
+def test_generate_download_files_removes_old_versions(downloads_path,
+                                                      execucoes):
+    old_dir = os.path.join(downloads_path, '20180101000000000000')
+    os.makedirs(old_dir)
+
+    version_dir = generate_download_files()
+
+    assert [os.path.basename(version_dir)] == os.listdir(downloads_path)
+
+
+def test_generate_download_files_without_execucoes(downloads_path, db):
+    assert generate_download_files() is None
+    assert [] == os.listdir(downloads_path)
+
+
+@override_settings(ROOT_URLCONF='core.urls')
+def test_generate_download_files_when_mosaico_isnt_routed(downloads_path,
+                                                          execucoes):
+    assert generate_download_files() is None
+    assert [] == os.listdir(downloads_path)
@@ -1,18 +1,26 @@
+import csv
+import io
 import pytest
+import tempfile
 
 from datetime import date
+from decimal import Decimal
 from unittest.mock import patch
 
 from freezegun import freeze_time
 from model_mommy.mommy import make
+from openpyxl import load_workbook
 from rest_framework.test import APITestCase
 
+from django.db.models import Sum
 from django.test import RequestFactory
 from django.urls import reverse
 
 from budget_execution.constants import SME_ORGAO_ID
 from budget_execution.models import (Execucao, FonteDeRecursoGrupo, Subfuncao,
                                      Grupo, Subgrupo)
+from global_app.http import XLSX_CONTENT_TYPE
+from mosaico.services import generate_download_files, get_download_filepath
 from mosaico.views import (
     SimplesViewMixin,
     TecnicoViewMixin,
@@ -183,6 +191,22 @@ class TestBaseListView(APITestCase):
         assert 1 == len(response.data['execucoes'])
 
 
+    def test_registered_newest_year_as_default(self):
+        subgrupo = make(Subgrupo, grupo=make(Grupo, id=1))
+        make('Execucao', subgrupo=subgrupo, year=date(2018, 1, 1),
+             orgao__id=SME_ORGAO_ID)
+        Execucao.objects.update_metadata()
+        # not seen until the metadata is updated again
+        make('Execucao', subgrupo=subgrupo, year=date(2019, 1, 1),
+             orgao__id=SME_ORGAO_ID)
+
+        response = self.get()
+        assert 2018 == response.data['year']
+
+        # the filtered pages find their newest year
+        response = self.get(minimo_legal=False)
+        assert 2019 == response.data['year']
+
     @patch('mosaico.views.TimeseriesSerializer')
     def test_calls_serializer_with_deflate_true(self, mock_serializer):
         make(Execucao, orgao__id=SME_ORGAO_ID, subgrupo__id=1, _quantity=2)
@@ -213,6 +237,31 @@ class TestBaseListView(APITestCase):
         assert 0 == len(response.data['execucoes'])
 
 
+class TestBaseListViewConditionalGet(APITestCase):
+    def get(self, **headers):
+        url = reverse('mosaico:grupos')
+        return self.client.get(url, **headers)
+
+    def test_returns_not_modified_when_etag_matches(self):
+        subgrupo = make(Subgrupo, grupo__id=1)
+        make('Execucao', subgrupo=subgrupo, orgao__id=SME_ORGAO_ID)
+
+        response = self.get()
+        assert 200 == response.status_code
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        assert 304 == response.status_code
+
+    def test_returns_not_modified_when_not_modified_since(self):
+        subgrupo = make(Subgrupo, grupo__id=1)
+        with freeze_time('2019-01-01'):
+            make('Execucao', subgrupo=subgrupo, orgao__id=SME_ORGAO_ID)
+
+        response = self.get(
+            HTTP_IF_MODIFIED_SINCE='Wed, 02 Jan 2019 00:00:00 GMT')
+        assert 304 == response.status_code
+
+
 class TestMinimoLegalFilter(APITestCase):
 
     def get(self, **kwargs):
@@ -892,106 +941,158 @@ class TestDownloadView(APITestCase):
              orcado_atualizado=1,
              _quantity=2)
 
-    def prepare_expected_data(self, section, year=None):
-        factory = RequestFactory()
-        if year:
-            execucoes = Execucao.objects.filter(year=date(year, 1, 1))
-            request = factory.get(self.base_url(section), {'year': year})
-        else:
-            execucoes = Execucao.objects.all()
-            request = factory.get(self.base_url(section))
-
-        serializer_class = SERIALIZERS_BY_SECTION[section]
-        return serializer_class(
-            execucoes, many=True, context={'request': request}).data
+    def get_rows(self, view_name, **query_params):
+        response = self.get(view_name, format='csv', **query_params)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        header, *rows = csv.reader(io.StringIO(content))
+        return header, rows
 
     def test_uses_correct_renderer(self):
         response = self.get('grupos', format='csv')
-        assert 'csv' == response.accepted_renderer.format
+        assert response['Content-Type'].startswith('text/csv')
+        assert 'attachment; filename=mosaico_grupos.csv' == \
+            response['Content-Disposition']
 
         response = self.get('grupos', format='xlsx')
-        assert 'xlsx' == response.accepted_renderer.format
+        assert XLSX_CONTENT_TYPE == response['Content-Type']
+        assert 'attachment; filename=mosaico_grupos.xlsx' == \
+            response['Content-Disposition']
+
+    def test_filtered_filename(self):
+        response = self.get('grupos', format='csv', year=2018, filter=True)
+        assert 'attachment; filename=mosaico_grupos_filtrado.csv' == \
+            response['Content-Disposition']
+
+    def test_unknown_section(self):
+        response = self.get('unknown', format='csv')
+        assert 404 == response.status_code
 
     def test_downloads_grupos_data(self):
-        expected = self.prepare_expected_data('grupos')
-        data = self.get('grupos').data
-        assert 2 == len(data)
-        assert expected == data
+        Execucao.objects.update(empenhado_liquido=1, vl_pago=1)
+        header, rows = self.get_rows('grupos')
+        assert ['grupo_id', 'nome', 'orcado_total', 'empenhado_total',
+                'percentual_empenhado', 'pago_total', 'percentual_pago',
+                'url'] == header
+        assert 2 == len(rows)
+
+        execucoes = Execucao.objects.filter(subgrupo__grupo_id=1)
+        totals = execucoes.aggregate(orcado=Sum('orcado_atualizado'),
+                                     empenhado=Sum('empenhado_liquido'))
+        row = rows[0]
+        assert '1' == row[0]
+        assert Grupo.objects.get(id=1).desc == row[1]
+        assert totals['orcado'] == Decimal(row[2])
+        assert totals['empenhado'] == Decimal(row[3])
+        assert totals['empenhado'] / totals['orcado'] == Decimal(row[4])
+        assert reverse('mosaico:subgrupos', args=[1]) == row[7]
 
     def test_downloads_grupos_filtered_data(self):
-        expected = self.prepare_expected_data('grupos', year=2018)
-        data = self.get('grupos', year=2018).data
-        assert 1 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('grupos', year=2018)
+        assert 1 == len(rows)
+        assert '1' == rows[0][0]
+        assert reverse('mosaico:subgrupos', args=[1]) + '?year=2018' == \
+            rows[0][7]
+
+    def test_rows_sorted_by_orcado_total(self):
+        Execucao.objects.filter(subgrupo_id=3).update(orcado_atualizado=10)
+        header, rows = self.get_rows('grupos')
+        assert ['2', '1'] == [row[0] for row in rows]
 
     def test_downloads_subgrupos_data(self):
-        expected = self.prepare_expected_data('subgrupos')
-        data = self.get('subgrupos').data
-        assert 3 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subgrupos')
+        assert 3 == len(rows)
 
     def test_downloads_subgrupos_filtered_data(self):
-        expected = self.prepare_expected_data('subgrupos', year=2018)
-        data = self.get('subgrupos', year=2018).data
-        assert 2 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subgrupos', year=2018)
+        assert 2 == len(rows)
+        assert {'1', '2'} == {row[0] for row in rows}
 
     def test_downloads_elementos_data(self):
-        expected = self.prepare_expected_data('elementos')
-        data = self.get('elementos').data
-        assert 2 == len(data)
-        assert expected == data
+        # elemento 1 is under two subgrupos, one row for each drill-down page
+        header, rows = self.get_rows('elementos')
+        assert 3 == len(rows)
+        assert ['1', '1', '2'] == sorted(row[0] for row in rows)
+        urls = {row[7] for row in rows}
+        assert reverse('mosaico:subelementos', args=[1, 1, 1]) in urls
+        assert reverse('mosaico:subelementos', args=[1, 2, 1]) in urls
 
     def test_downloads_elementos_filtered_data(self):
-        expected = self.prepare_expected_data('elementos', year=2018)
-        data = self.get('elementos', year=2018).data
-        assert 1 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('elementos', year=2018)
+        assert 2 == len(rows)
 
     def test_downloads_subelementos_data(self):
-        expected = self.prepare_expected_data('subelementos')
-        data = self.get('subelementos').data
-        assert 3 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subelementos')
+        assert 'url' not in header
+        assert 3 == len(rows)
 
     def test_downloads_subelementos_filtered_data(self):
-        expected = self.prepare_expected_data('subelementos', year=2018)
-        data = self.get('subelementos', year=2018).data
-        assert 2 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subelementos', year=2018)
+        assert 2 == len(rows)
 
     def test_downloads_subfuncoes_data(self):
-        expected = self.prepare_expected_data('subfuncoes')
-        data = self.get('subfuncoes').data
-        assert 2 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subfuncoes')
+        assert 2 == len(rows)
 
     def test_downloads_subfuncoes_filtered_data(self):
-        expected = self.prepare_expected_data('subfuncoes', year=2018)
-        data = self.get('subfuncoes', year=2018).data
-        assert 1 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('subfuncoes', year=2018)
+        assert 1 == len(rows)
+        assert ['1', 'sub'] == rows[0][:2]
 
     def test_downloads_programas_data(self):
-        expected = self.prepare_expected_data('programas')
-        data = self.get('programas').data
-        assert 2 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('programas')
+        assert 2 == len(rows)
 
     def test_downloads_programas_filtered_data(self):
-        expected = self.prepare_expected_data('programas', year=2018)
-        data = self.get('programas', year=2018).data
-        assert 1 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('programas', year=2018)
+        assert 1 == len(rows)
+        assert reverse('mosaico:projetos', args=[1, 1]) + '?year=2018' == \
+            rows[0][7]
 
     def test_downloads_projetos_data(self):
-        expected = self.prepare_expected_data('projetos')
-        data = self.get('projetos').data
-        assert 3 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('projetos')
+        assert 'url' not in header
+        assert 3 == len(rows)
 
     def test_downloads_projetos_filtered_data(self):
-        expected = self.prepare_expected_data('projetos', year=2018)
-        data = self.get('projetos', year=2018).data
-        assert 2 == len(data)
-        assert expected == data
+        header, rows = self.get_rows('projetos', year=2018)
+        assert 2 == len(rows)
+
+    def test_serves_generated_file_when_not_filtered(self):
+        with tempfile.TemporaryDirectory() as path:
+            with patch('mosaico.services.GENERATED_DOWNLOADS_PATH', path):
+                generate_download_files()
+
+                response = self.get('grupos', format='csv')
+                assert 'attachment; filename=mosaico_grupos.csv' == \
+                    response['Content-Disposition']
+                assert response['ETag']
+                assert response.streaming
+
+                filepath = get_download_filepath('grupos', 'csv')
+                with open(filepath, 'rb') as fh:
+                    assert fh.read() == b''.join(response.streaming_content)
+
+                response = self.get('grupos', format='xlsx', year=2018)
+                assert 'attachment; filename=mosaico_grupos_2018.xlsx' == \
+                    response['Content-Disposition']
+
+    def test_streams_filtered_download_even_if_generated(self):
+        with tempfile.TemporaryDirectory() as path:
+            with patch('mosaico.services.GENERATED_DOWNLOADS_PATH', path):
+                generate_download_files()
+
+                response = self.get('grupos', format='csv', year=2018,
+                                    filter=True)
+                assert 'attachment; filename=mosaico_grupos_filtrado.csv' == \
+                    response['Content-Disposition']
+                assert 'Accept-Ranges' not in response
+
+    def test_downloads_xlsx(self):
+        response = self.get('subgrupos', format='xlsx')
+        content = b''.join(response.streaming_content)
+        assert str(len(content)) == response['Content-Length']
+
+        ws = load_workbook(io.BytesIO(content)).active
+        rows = list(ws.values)
+        assert 'subgrupo_id' == rows[0][0]
+        assert 4 == len(rows)
@@ -1,3 +1,5 @@
+import os
+
 from urllib.parse import urlencode
 
 from django_filters import rest_framework as filters
@@ -7,10 +9,19 @@ from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
 from rest_framework.response import Response
 from rest_framework_csv.renderers import CSVRenderer
 
+from django.db.models import Max
+from django.http import Http404
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 
+from budget_execution import labels
 from budget_execution.constants import SME_ORGAO_ID
-from budget_execution.models import Execucao, FonteDeRecursoGrupo
+from budget_execution.models import (
+    Elemento, Execucao, FonteDeRecursoGrupo, Grupo, Programa, Subfuncao,
+    Subgrupo)
+from global_app.http import (
+    XLSX_CONTENT_TYPE, conditional_view, serve_file, stream_csv, stream_xlsx)
+from global_app.profiling import profile_section
 from mosaico.serializers import (
     ElementoSerializer,
     FonteDeRecursoSerializer,
@@ -22,27 +33,16 @@ from mosaico.serializers import (
     SubgrupoSerializer,
     TimeseriesSerializer,
 )
+from mosaico.services import (
+    DOWNLOAD_SECTIONS,
+    get_download_filepath,
+    get_download_header,
+    iter_download_rows,
+)
 
 
-SERIALIZERS_BY_SECTION = {
-    'grupos': GrupoSerializer,
-    'subgrupos': SubgrupoSerializer,
-    'elementos': ElementoSerializer,
-    'subelementos': SubelementoSerializer,
-    'subfuncoes': SubfuncaoSerializer,
-    'programas': ProgramaSerializer,
-    'projetos': ProjetoAtividadeSerializer,
-}
-
-DISTINCT_FIELD_BY_SECTION = {
-    'grupos': 'subgrupo__grupo_id',
-    'subgrupos': 'subgrupo',
-    'elementos': 'elemento',
-    'subelementos': 'subelemento',
-    'subfuncoes': 'subfuncao',
-    'programas': 'programa',
-    'projetos': 'projeto',
-}
+def execucoes_last_modified(request, *args, **kwargs):
+    return Execucao.objects.get_last_modified()
 
 
 class ExecucaoFilter(filters.FilterSet):
@@ -90,6 +90,7 @@ class TecnicoViewMixin:
 
 # `Simples` visualization views
 
+@method_decorator(conditional_view(execucoes_last_modified), name='dispatch')
 class BaseListView(generics.ListAPIView):
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
     filter_backends = (filters.DjangoFilterBackend, )
@@ -104,11 +105,23 @@ class BaseListView(generics.ListAPIView):
             self.year = int(year)
             return queryset
         else:
-            last = queryset.order_by('year').last()
-            self.year = last.year.year if last else None
+            self.year = self.get_default_year(queryset)
             self.filters['year'] = self.year
             return queryset.filter(year__year=self.year)
 
+    def get_default_year(self, queryset):
+        # the registered newest year is the one of the root sections without
+        # filters, read without queries. Anything else may narrow the years
+        # available.
+        filtered = set(self.filters) & set(self.filterset_class.base_filters)
+        if not self.kwargs and not filtered:
+            year = Execucao.objects.get_newest_year()
+            if year:
+                return year
+
+        newest = queryset.aggregate(newest=Max('year'))['newest']
+        return newest.year if newest else None
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
@@ -123,13 +136,16 @@ class BaseListView(generics.ListAPIView):
         deflate = bool(self.request.GET.get('deflate', None))
         tseries_qs = self.get_timeseries_queryset().order_by('year')
         tseries_serializer = TimeseriesSerializer(tseries_qs, deflate=deflate)
+        with profile_section('serializer'):
+            execucoes = serializer.data
+            timeseries = tseries_serializer.data
 
         return Response({
             'deflate': deflate,
             'year': self.year,
             'breadcrumb': breadcrumb,
-            'execucoes': serializer.data,
-            'timeseries': tseries_serializer.data,
+            'execucoes': execucoes,
+            'timeseries': timeseries,
             'tecnico': self.tecnico,
             'minimo_legal': self.filters.get('minimo_legal') == 'True',
             'root_url': self.get_root_url(),
@@ -208,15 +224,15 @@ class SubgruposListView(BaseListView, SimplesViewMixin):
 
     def create_breadcrumb(self, queryset):
         execucao = queryset[0]
-        subgrupo = execucao.subgrupo
-        grupo = subgrupo.grupo
+        grupo_id = labels.get_grupo_id(execucao.subgrupo_id)
         year = execucao.year.year
         params = self.request.query_params
         qs = querystring(params)
 
         return [
             {"name": f'Ano {year}', 'url': execucao.get_url('grupos') + qs},
-            {"name": grupo.desc, 'url': execucao.get_url('subgrupos') + qs}
+            {"name": labels.get_label(Grupo, grupo_id),
+             'url': execucao.get_url('subgrupos') + qs}
         ]
 
 
@@ -230,16 +246,17 @@ class ElementosListView(BaseListView, SimplesViewMixin):
 
     def create_breadcrumb(self, queryset):
         execucao = queryset[0]
-        subgrupo = execucao.subgrupo
-        grupo = subgrupo.grupo
+        grupo_id = labels.get_grupo_id(execucao.subgrupo_id)
         year = execucao.year.year
         params = self.request.query_params
         qs = querystring(params)
 
         return [
             {"name": f'Ano {year}', 'url': execucao.get_url('grupos') + qs},
-            {"name": grupo.desc, 'url': execucao.get_url('subgrupos') + qs},
-            {"name": subgrupo.desc, 'url': execucao.get_url('elementos') + qs}
+            {"name": labels.get_label(Grupo, grupo_id),
+             'url': execucao.get_url('subgrupos') + qs},
+            {"name": labels.get_label(Subgrupo, execucao.subgrupo_id),
+             'url': execucao.get_url('elementos') + qs}
         ]
 
 
@@ -255,18 +272,18 @@ class SubelementosListView(BaseListView, SimplesViewMixin):
 
     def create_breadcrumb(self, queryset):
         execucao = queryset[0]
-        subgrupo = execucao.subgrupo
-        grupo = subgrupo.grupo
-        elemento = execucao.elemento
+        grupo_id = labels.get_grupo_id(execucao.subgrupo_id)
         year = execucao.year.year
         params = self.request.query_params
         qs = querystring(params)
 
         return [
             {"name": f'Ano {year}', 'url': execucao.get_url('grupos') + qs},
-            {"name": grupo.desc, 'url': execucao.get_url('subgrupos') + qs},
-            {"name": subgrupo.desc, 'url': execucao.get_url('elementos') + qs},
-            {"name": elemento.desc,
+            {"name": labels.get_label(Grupo, grupo_id),
+             'url': execucao.get_url('subgrupos') + qs},
+            {"name": labels.get_label(Subgrupo, execucao.subgrupo_id),
+             'url': execucao.get_url('elementos') + qs},
+            {"name": labels.get_label(Elemento, execucao.elemento_id),
              'url': execucao.get_url('subelementos') + qs},
         ]
 
@@ -301,12 +318,12 @@ class ProgramasListView(BaseListView, TecnicoViewMixin):
     def create_breadcrumb(self, queryset):
         year = self.year
         execucao = queryset[0]
-        subfuncao = execucao.subfuncao
         params = self.request.query_params
         qs = querystring(params)
         return [
             {"name": f'Ano {year}', 'url': execucao.get_url('subfuncoes') + qs},
-            {"name": subfuncao.desc, 'url': execucao.get_url('programas') + qs},
+            {"name": labels.get_label(Subfuncao, execucao.subfuncao_id),
+             'url': execucao.get_url('programas') + qs},
         ]
 
 
@@ -323,28 +340,27 @@ class ProjetosAtividadesListView(BaseListView, TecnicoViewMixin):
     def create_breadcrumb(self, queryset):
         year = self.year
         execucao = queryset[0]
-        subfuncao = execucao.subfuncao
-        programa = execucao.programa
         params = self.request.query_params
         qs = querystring(params)
         return [
             {"name": f'Ano {year}', 'url': execucao.get_url('subfuncoes') + qs},
-            {"name": subfuncao.desc, 'url': execucao.get_url('programas') + qs},
-            {"name": programa.desc, 'url': execucao.get_url('projetos') + qs},
+            {"name": labels.get_label(Subfuncao, execucao.subfuncao_id),
+             'url': execucao.get_url('programas') + qs},
+            {"name": labels.get_label(Programa, execucao.programa_id),
+             'url': execucao.get_url('projetos') + qs},
         ]
 
 
+@method_decorator(conditional_view(execucoes_last_modified), name='dispatch')
 class DownloadView(generics.ListAPIView):
+    # the renderers only take part in the format negotiation, the files are
+    # streamed by `list`
     renderer_classes = [XLSXRenderer, CSVRenderer]
     filter_backends = (filters.DjangoFilterBackend, )
     filterset_class = ExecucaoFilter
 
-    def get_serializer_class(self):
-        return SERIALIZERS_BY_SECTION[self.section]
-
     def get_queryset(self):
-        return Execucao.objects.filter(subgrupo_id__isnull=False) \
-            .order_by(self.distinct_field, 'year')
+        return Execucao.objects.filter(subgrupo_id__isnull=False)
 
     def filter_queryset(self, qs):
         qs = super().filter_queryset(qs)
@@ -354,11 +370,14 @@ class DownloadView(generics.ListAPIView):
 
     def list(self, request, *args, **kwargs):
         self.section = self.kwargs['section']
-        self.distinct_field = self._get_distinct_field_name()
+        if self.section not in DOWNLOAD_SECTIONS:
+            raise Http404
 
-        queryset = self.filter_queryset(self.get_queryset())
+        filepath = self._get_generated_filepath()
+        if filepath:
+            return self._serve_generated_file(filepath)
 
-        serializer = self.get_serializer(queryset, many=True)
+        queryset = self.filter_queryset(self.get_queryset())
 
         filename = f'mosaico_{self.kwargs["section"]}'
         if self.request.GET.get('filter'):
@@ -366,14 +385,46 @@ class DownloadView(generics.ListAPIView):
         file_extension = request.accepted_renderer.format
         filename += f'.{file_extension}'
 
-        headers = {
-            'Content-Disposition': f'attachment; filename={filename}'
-        }
-        response = Response(serializer.data, headers=headers)
+        header = get_download_header(self.section)
+        rows = iter_download_rows(queryset, self.section,
+                                  self._get_url_query_string())
+        if file_extension == 'csv':
+            return stream_csv(header, rows, filename)
+        return stream_xlsx(header, rows, filename)
+
+    def _get_generated_filepath(self):
+        """
+        Path of the file pre-generated by the ETL for this download, if it
+        isn't filtered by anything but the year and the file exists
+        """
+        params = set(self.request.GET) - {'format', 'year'}
+        year = self.request.GET.get('year')
+        if params or (year is not None and not year.isdigit()):
+            return None
+
+        filepath = get_download_filepath(
+            self.section, self.request.accepted_renderer.format, year)
+        if filepath and os.path.exists(filepath):
+            return filepath
+        return None
+
+    def _serve_generated_file(self, filepath):
+        if filepath.endswith('.csv'):
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            content_type = XLSX_CONTENT_TYPE
+        response = serve_file(self.request, filepath, content_type)
+        filename = os.path.basename(filepath)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
-    def _get_distinct_field_name(self):
-        return DISTINCT_FIELD_BY_SECTION[self.section]
+    def _get_url_query_string(self):
+        params = self.request.GET.copy()
+        params.pop('format', None)
+        params.pop('filter', None)
+        if params:
+            return '?{}'.format(params.urlencode())
+        return ''
 
 
 class SobreView(generics.ListAPIView):
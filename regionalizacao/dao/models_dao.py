@@ -374,6 +374,13 @@ class EscolaInfoDao:
         last = self.model.objects.all().order_by('year').last()
         return last.year if last else None
 
+    def get_years(self):
+        return list(self.model.objects.order_by('year')
+                    .values_list('year', flat=True).distinct())
+
+    def count(self):
+        return self.model.objects.count()
+
     def filter_etapa_is_not_null(self):
         return self.model.objects \
             .filter(tipoesc__etapa__isnull=False) \
@@ -593,7 +600,13 @@ class UpdateHistoryDao:
         self.model.objects.create()
 
     def get_last_update_date(self):
+        last_update = self.get_last_update_datetime()
+        if not last_update:
+            return None
+        return last_update.date()
+
+    def get_last_update_datetime(self):
         last_register = self.model.objects.order_by('created_at').last()
         if not last_register:
             return None
-        return last_register.created_at.date()
+        return last_register.created_at
@@ -1,4 +1,5 @@
 from ..models import EscolaInfo, Dre
+from ..services import update_dataset_metadata, update_updated_at_date
 
 # pega todas as escolas
 es = EscolaInfo.objects.all()
@@ -45,3 +46,7 @@ escolas_dre_ip_zl.update(dre=dre_ip_zl)
 escolas_dre_ip_zs = es.filter(dre__code="IP CE", distrito__zona="ZONA SUL")
 # atualiza a DRE dessas escolas
 escolas_dre_ip_zs.update(dre=dre_ip_zs)
+
+# registra a atualização, lida pelas views
+update_updated_at_date()
+update_dataset_metadata()
@@ -3,3 +3,7 @@ from regionalizacao import services
 
 def run(*args):
     services.populate_escola_info_budget_data()
+    # the pages cached by the clients and the metadata read by the views
+    # change with the data
+    services.update_updated_at_date()
+    services.update_dataset_metadata()
@@ -32,4 +32,7 @@ def update_2018_create_2019():
     update_dres_por_zona()
     print("# normalizar DREs")
     normalize_dres()
+    print("# registrar a atualização")
+    update_updated_at_date()
+    update_dataset_metadata()
 
@@ -1,5 +1,17 @@
-from regionalizacao import services
+from global_app.etl_metrics import etl_run
+from global_app.prerender import prerender_after_etl
+from regionalizacao import services, tasks
 
 
 def run(*args):
-    services.update_regionalizacao_data()
+    if 'celery' in args:
+        result = tasks.start_regionalizacao_update()
+        if result:
+            print('Regionalizacao pipeline sent to the Celery workers: '
+                  f'{result.id}')
+        return
+
+    with etl_run('regionalizacao'):
+        services.update_regionalizacao_data()
+
+    prerender_after_etl('regionalizacao')
@@ -2,6 +2,8 @@ import openpyxl
 
 from datetime import date
 
+from global_app import metadata
+from global_app.etl_metrics import etl_stage
 from regionalizacao.dao import eol_api_dao
 from regionalizacao.dao.models_dao import (
     DistritoDao, DistritoZonaFromToDao, EtapaTipoEscolaFromToDao,
@@ -36,6 +38,7 @@ def update_regionalizacao_data():
     print('## Generating download spreadsheets ##')
     generate_xlsx_files()
     update_updated_at_date()
+    update_dataset_metadata()
 
 
 def update_regionalizacao_data_forced():
@@ -57,10 +60,12 @@ def update_regionalizacao_data_forced():
     print('## Generating download spreadsheets ##')
     generate_xlsx_files()
     update_updated_at_date()
+    update_dataset_metadata()
 
 
+@etl_stage
 def update_data_from_eol_api(years):
-    eol_api_dao.update_escola_table(years)
+    return eol_api_dao.update_escola_table(years)
 
 
 def get_years_to_be_updated():
@@ -81,6 +86,7 @@ def get_years_to_be_updated():
     return list(set(years_list))
 
 
+@etl_stage
 def extract_ptrf_and_recursos_spreadsheets():
     ptrf_sheet_dao = PtrfFromToSpreadsheetDao()
     recursos_sheet_dao = UnidadeRecursosFromToSpreadsheetDao()
@@ -91,6 +97,7 @@ def extract_ptrf_and_recursos_spreadsheets():
     return bool(ptrf_extracted or recursos_extracted)
 
 
+@etl_stage
 def apply_fromtos():
 
     apply_distrito_zona_fromto()
@@ -99,6 +106,7 @@ def apply_fromtos():
     apply_unidade_recursos_fromto()
 
 
+@etl_stage
 def apply_distrito_zona_fromto():
     ft_dao = DistritoZonaFromToDao()
     distrito_dao = DistritoDao()
@@ -112,6 +120,7 @@ def apply_distrito_zona_fromto():
             distrito.save()
 
 
+@etl_stage
 def apply_etapa_tipo_escola_fromto():
     ft_dao = EtapaTipoEscolaFromToDao()
     tipo_dao = TipoEscolaDao()
@@ -126,6 +135,7 @@ def apply_etapa_tipo_escola_fromto():
             tipo.save()
 
 
+@etl_stage
 def apply_ptrf_fromto():
     ft_dao = PtrfFromToDao()
     budget_dao = BudgetDao()
@@ -137,6 +147,7 @@ def apply_ptrf_fromto():
                                     ptrf=ft.vlrepasse)
 
 
+@etl_stage
 def apply_unidade_recursos_fromto():
     ft_dao = UnidadeRecursosFromToDao()
     recurso_dao = RecursoDao()
@@ -152,19 +163,25 @@ def apply_unidade_recursos_fromto():
             label=ft.label)
 
 
+@etl_stage
 def populate_escola_info_budget_data():
     budget_dao = BudgetDao()
     info_dao = EscolaInfoDao()
 
     budgets = budget_dao.get_all()
+    populated = 0
     for budget in budgets:
         recursos, total = budget_dao.build_recursos_data(budget)
         info_dao.update(
             escola_id=budget.escola.id, year=budget.year,
             budget_total=total, recursos=recursos)
+        populated += 1
 
+    return populated
 
-def generate_xlsx_files():
+
+@etl_stage
+def generate_xlsx_files(years=None):
     from regionalizacao.serializers import (EscolaInfoDownloadSerializer,
                                             UnidadeRecursosFromToSerializer)
     info_dao = EscolaInfoDao()
@@ -178,7 +195,7 @@ def generate_xlsx_files():
         data_handler=openpyxl,
     )
 
-    uc.execute()
+    uc.execute(years)
 
 
 def update_updated_at_date():
@@ -186,9 +203,40 @@ def update_updated_at_date():
     dao.create()
 
 
+@etl_stage
+def update_dataset_metadata():
+    """
+    Registra a data de atualização e os anos disponíveis, lidos pelas views
+    sem consultar as tabelas de escolas.
+    """
+    escola_info_dao = EscolaInfoDao()
+    update_history_dao = UpdateHistoryDao()
+    metadata.update_dataset_metadata(
+        metadata.REGIONALIZACAO_DATASET,
+        dt_updated=update_history_dao.get_last_update_datetime(),
+        years=escola_info_dao.get_years(),
+        row_count=escola_info_dao.count())
+
+
+def get_newest_year():
+    dataset_metadata = metadata.get_dataset_metadata(
+        metadata.REGIONALIZACAO_DATASET)
+    if dataset_metadata:
+        return dataset_metadata.newest_year
+    return EscolaInfoDao().get_newest_year()
+
+
+def get_last_update_datetime():
+    dataset_metadata = metadata.get_dataset_metadata(
+        metadata.REGIONALIZACAO_DATASET)
+    if dataset_metadata:
+        return dataset_metadata.dt_updated
+    return UpdateHistoryDao().get_last_update_datetime()
+
+
 def get_dt_updated():
-    dao = UpdateHistoryDao()
-    dt_updated = dao.get_last_update_date()
+    last_update = get_last_update_datetime()
+    dt_updated = last_update.date() if last_update else None
     if not dt_updated:
         return get_sheets_last_created_at()
     return dt_updated
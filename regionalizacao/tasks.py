@@ -0,0 +1,92 @@
+"""
+Tarefas Celery da atualização da regionalização. Após a atualização das
+escolas pela API EOL, os de-paras de distritos, tipos de escola e recursos
+(PTRF e unidade recursos, que alteram os mesmos orçamentos, em sequência)
+são aplicados em paralelo, e as planilhas de cada ano são geradas em
+paralelo ao final.
+"""
+from celery import chain, group, shared_task
+
+from global_app.tasks import prerender_pages
+from regionalizacao import services
+from regionalizacao.dao.models_dao import EscolaInfoDao
+
+
+@shared_task
+def update_data_from_eol_api(years):
+    return services.update_data_from_eol_api(years)
+
+
+@shared_task
+def apply_distrito_zona_fromto():
+    services.apply_distrito_zona_fromto()
+
+
+@shared_task
+def apply_etapa_tipo_escola_fromto():
+    services.apply_etapa_tipo_escola_fromto()
+
+
+@shared_task
+def apply_ptrf_fromto():
+    services.apply_ptrf_fromto()
+
+
+@shared_task
+def apply_unidade_recursos_fromto():
+    services.apply_unidade_recursos_fromto()
+
+
+@shared_task
+def populate_escola_info_budget_data():
+    return services.populate_escola_info_budget_data()
+
+
+@shared_task
+def generate_xlsx_file(year):
+    services.generate_xlsx_files(years=[year])
+
+
+@shared_task
+def update_dataset_metadata():
+    services.update_updated_at_date()
+    services.update_dataset_metadata()
+
+
+def build_regionalizacao_pipeline(years):
+    """
+    As planilhas são geradas para os anos já existentes e para os anos
+    atualizados
+    """
+    xlsx_years = sorted(set(EscolaInfoDao().get_years()) | set(years))
+    return chain(
+        update_data_from_eol_api.si(years),
+        group(
+            apply_distrito_zona_fromto.si(),
+            apply_etapa_tipo_escola_fromto.si(),
+            chain(apply_ptrf_fromto.si(), apply_unidade_recursos_fromto.si()),
+        ),
+        populate_escola_info_budget_data.si(),
+        group(generate_xlsx_file.si(year) for year in xlsx_years),
+        update_dataset_metadata.si(),
+        prerender_pages.si('regionalizacao'),
+    )
+
+
+def start_regionalizacao_update(forced=False):
+    """
+    Equivalente a update_regionalizacao_data (ou, com `forced`, a
+    update_regionalizacao_data_forced): as planilhas são extraídas antes do
+    envio das tarefas. Retorna o resultado assíncrono ou None, se não houver
+    novas planilhas.
+    """
+    if forced:
+        years = services.get_years_to_be_updated()
+        services.extract_ptrf_and_recursos_spreadsheets()
+    else:
+        if not services.extract_ptrf_and_recursos_spreadsheets():
+            print('No new spreadsheets were found. Exiting script.')
+            return None
+        years = services.get_years_to_be_updated()
+
+    return build_regionalizacao_pipeline(years).delay()
@@ -0,0 +1,22 @@
+import pytest
+
+from model_mommy import mommy
+
+from global_app import metadata
+from regionalizacao.models import EscolaInfo, UpdateHistory
+from regionalizacao.scripts import populate_escola_info_budget_data
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_populate_escola_info_budget_data_registers_the_update():
+    mommy.make(EscolaInfo, year=2019)
+
+    populate_escola_info_budget_data.run()
+
+    dataset_metadata = metadata.get_dataset_metadata(
+        metadata.REGIONALIZACAO_DATASET)
+    assert UpdateHistory.objects.get().created_at == \
+        dataset_metadata.dt_updated
+    assert 2019 == dataset_metadata.newest_year
@@ -23,6 +23,8 @@ from regionalizacao.services import (
     extract_ptrf_and_recursos_spreadsheets,
     get_years_to_be_updated,
     get_dt_updated,
+    get_newest_year,
+    update_dataset_metadata,
 )
 
 
@@ -347,3 +349,28 @@ class TestGetDtUpdate:
         sheet3.save()
 
         assert date(2019, 12, 1) == get_dt_updated()
+
+    def test_returns_registered_dataset_update_date(self):
+        history = mommy.make(UpdateHistory)
+        update_dataset_metadata()
+
+        # not seen until the metadata is updated again
+        new_history = mommy.make(UpdateHistory)
+        new_history.created_at = date(2042, 1, 1)
+        new_history.save()
+
+        assert history.created_at.date() == get_dt_updated()
+
+
+@pytest.mark.django_db
+class TestUpdateDatasetMetadata:
+
+    def test_registers_years_and_row_count(self):
+        mommy.make(UpdateHistory)
+        mommy.make(EscolaInfo, year=2019, _quantity=2)
+        mommy.make(EscolaInfo, year=2020)
+
+        update_dataset_metadata()
+
+        assert 2020 == get_newest_year()
+        assert date.today() == get_dt_updated()
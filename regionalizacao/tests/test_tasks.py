@@ -0,0 +1,54 @@
+import os
+
+from unittest.mock import patch
+
+import pytest
+
+from model_mommy import mommy
+
+from global_app.models import DatasetMetadata
+from regionalizacao import services, tasks
+from regionalizacao.models import (
+    Budget, Distrito, DistritoZonaFromTo, Escola, EscolaInfo, PtrfFromTo,
+    UpdateHistory)
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def xlsx_path(tmpdir):
+    path = str(tmpdir)
+    with patch('regionalizacao.use_cases.GENERATED_XLSX_PATH', path):
+        yield path
+
+
+@patch.object(services.eol_api_dao, 'update_escola_table')
+def test_regionalizacao_pipeline(mock_update_escolas, xlsx_path):
+    mommy.make(Distrito, coddist=1, zona=None)
+    mommy.make(DistritoZonaFromTo, coddist=1, zona='Norte')
+    escola = mommy.make(Escola, codesc='01')
+    for year in (2019, 2020):
+        mommy.make(EscolaInfo, escola=escola, year=year, budget_total=None)
+    mommy.make(PtrfFromTo, codesc='01', year=2020, vlrepasse=10)
+
+    tasks.build_regionalizacao_pipeline([2020]).delay()
+
+    mock_update_escolas.assert_called_once_with([2020])
+    assert 'Norte' == Distrito.objects.get(coddist=1).zona
+    assert 10 == Budget.objects.get(escola=escola, year=2020).ptrf
+    assert 10 == EscolaInfo.objects.get(year=2020).budget_total
+    assert ['regionalizacao_2019.xlsx', 'regionalizacao_2020.xlsx'] == \
+        sorted(os.listdir(xlsx_path))
+    assert UpdateHistory.objects.exists()
+    assert DatasetMetadata.objects.filter(dataset='regionalizacao').exists()
+
+
+@patch.object(tasks, 'build_regionalizacao_pipeline')
+def test_start_without_new_spreadsheets(mock_build):
+    assert tasks.start_regionalizacao_update() is None
+    mock_build.assert_not_called()
+
+    tasks.start_regionalizacao_update(forced=True)
+    mock_build.assert_called_once_with([])
+    mock_build.return_value.delay.assert_called_once_with()
@@ -1,11 +1,12 @@
 from datetime import date
 
+from django.test import override_settings
 from django.urls import reverse
 from model_mommy import mommy
 from rest_framework.test import APITestCase
 
 from regionalizacao.models import (
-    Escola, EscolaInfo, TipoEscola, Distrito, Dre)
+    Escola, EscolaInfo, TipoEscola, Distrito, Dre, UpdateHistory)
 
 
 class HomeViewTestCase(APITestCase):
@@ -662,6 +663,42 @@ class TestHomeViewBreadcrumb(HomeViewTestCase):
         assert expected == response.data['breadcrumb']
 
 
+class TestHomeViewConditionalGet(HomeViewTestCase):
+
+    def test_no_etag_when_theres_no_update_history(self):
+        response = self.get()
+        assert 200 == response.status_code
+        assert not response.has_header('ETag')
+
+    def test_returns_not_modified_when_etag_matches(self):
+        mommy.make(UpdateHistory)
+        response = self.get()
+        assert 200 == response.status_code
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert 304 == response.status_code
+
+    def test_etag_changes_with_query_string(self):
+        mommy.make(UpdateHistory)
+        response = self.get(year=self.year)
+        other_response = self.get(year=self.year - 1)
+        assert response['ETag'] != other_response['ETag']
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_STRICT=True,
+                   REQUEST_PROFILING_BUDGETS={
+                       'regionalizacao:home': {'queries': 25}})
+class TestHomeViewQueryBudget(HomeViewTestCase):
+
+    def test_levels_within_budget(self):
+        self.get(format='json')
+        self.get(format='json', zona='Sul')
+        self.get(format='json', localidade='dre', dre='x')
+        self.get(format='json', zona='Sul', distrito=1)
+        self.get(format='json', zona='Sul', distrito=1, escola='01')
+
+
 class TestSaibaMaisView(APITestCase):
 
     def get(self, **kwargs):
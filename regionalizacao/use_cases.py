@@ -16,8 +16,9 @@ class GenerateXlsxFilesUseCase:
         self.escolas_qs = self.info_dao.get_all()
         self.recursos_qs = self.recursos_dao.get_all()
 
-    def execute(self):
-        years = self.escolas_qs.values_list('year', flat=True).distinct()
+    def execute(self, years=None):
+        if years is None:
+            years = self.escolas_qs.values_list('year', flat=True).distinct()
 
         for year in years:
             print(f'Generating spreadsheet for {year}')
@@ -3,16 +3,24 @@ import os
 from copy import deepcopy
 from datetime import date
 
-from django.http import HttpResponse, Http404
+from django.http import Http404
+from django.utils.decorators import method_decorator
 from django_filters import rest_framework as filters
 from rest_framework import generics
 from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
 from rest_framework.response import Response
 
+from global_app.http import conditional_view, serve_file
+from global_app.profiling import profile_section
 from regionalizacao.constants import GENERATED_XLSX_PATH
 from regionalizacao.dao.models_dao import EscolaInfoDao
 from regionalizacao.models import EscolaInfo
 from regionalizacao.serializers import PlacesSerializer
+from regionalizacao.services import get_last_update_datetime, get_newest_year
+
+
+def escolas_last_modified(request, *args, **kwargs):
+    return get_last_update_datetime()
 
 
 class InitialFilter(filters.FilterSet):
@@ -37,10 +45,6 @@ class InitialFilter(filters.FilterSet):
         super().__init__(data, *args, **kwargs)
 
 
-def newest_year():
-    return EscolaInfoDao().get_newest_year()
-
-
 class EscolaInfoFilter(InitialFilter):
     LOCALIDADE_CHOICES = (
         ('zona', 'Região'),
@@ -52,7 +56,7 @@ class EscolaInfoFilter(InitialFilter):
     distrito = filters.NumberFilter(field_name='distrito__coddist')
     escola = filters.CharFilter(field_name='escola__codesc')
     year = filters.AllValuesFilter(field_name='year', empty_label=None,
-                                   initial=newest_year)
+                                   initial=get_newest_year)
     rede = filters.AllValuesFilter(field_name='rede', empty_label=None,
                                    initial='DIR')
     localidade = filters.ChoiceFilter(choices=LOCALIDADE_CHOICES,
@@ -105,6 +109,7 @@ class FilteredTemplateHTMLRenderer(TemplateHTMLRenderer):
         return data
 
 
+@method_decorator(conditional_view(escolas_last_modified), name='dispatch')
 class HomeView(generics.ListAPIView):
     renderer_classes = [FilteredTemplateHTMLRenderer, JSONRenderer]
     filter_backends = (filters.DjangoFilterBackend,)
@@ -131,7 +136,19 @@ class HomeView(generics.ListAPIView):
             map_queryset=map_qs, locations_queryset=locations_qs, level=level,
             query_params=query_params,
             locations_graph_type=locations_graph_type)
-        return Response({**serializer.data})
+        with profile_section('serializer'):
+            data = serializer.data
+        return Response({**data})
+
+
+def get_download_filepath(request):
+    if 'year' in request.GET:
+        year = request.GET['year']
+    else:
+        year = get_newest_year()
+
+    filename = f'regionalizacao_{year}.xlsx'
+    return os.path.join(GENERATED_XLSX_PATH, filename)
 
 
 def download_view(request):
@@ -140,20 +157,9 @@ def download_view(request):
     extendidos utilizados na ferramenta.
     :param request: objeto HTTP request.
     """
-    if 'year' in request.GET:
-        year = request.GET['year']
-    else:
-        escolas_info_dao = EscolaInfoDao()
-        year = escolas_info_dao.get_newest_year()
-
-    filename = f'regionalizacao_{year}.xlsx'
-    filepath = os.path.join(GENERATED_XLSX_PATH, filename)
+    filepath = get_download_filepath(request)
     if not os.path.exists(filepath):
         raise Http404
 
-    with open(filepath, 'rb') as fh:
-        response = HttpResponse(
-            fh.read(), content_type="application/vnd.ms-excel")
-        response['Content-Disposition'] = (
-                'inline; filename=' + os.path.basename(filepath))
-        return response
+    return serve_file(request, filepath,
+                      content_type="application/vnd.ms-excel")
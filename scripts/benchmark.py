@@ -0,0 +1,57 @@
+"""
+Measures the public views and, with `etl`, the ETL stages. With `seed`,
+synthetic data is loaded first: 1M execucoes, 500k empenhos SOF cache and
+5k escolas over 5 years, multiplied by `scale`. Seeding and the ETL stages
+change the data, so only run them against a benchmark database.
+
+$ python manage.py runscript benchmark --script-args seed scale=0.1 \
+    repeat=3 output=benchmark.json [etl] [nomemory]
+"""
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment)
+
+from global_app import benchmark
+
+
+DEFAULTS = {
+    'scale': 1.0,
+    'repeat': 3,
+    'output': 'benchmark.json',
+    'execucoes': 1000000,
+    'empenhos': 500000,
+    'escolas': 5000,
+    'years': 5,
+}
+
+
+def run(*args):
+    flags = {arg for arg in args if '=' not in arg}
+    options = dict(DEFAULTS)
+    options.update(arg.split('=', 1) for arg in args if '=' in arg)
+
+    scale = float(options['scale'])
+    repeat = int(options['repeat'])
+    trace_memory = 'nomemory' not in flags
+
+    if 'seed' in flags:
+        benchmark.seed(
+            execucoes=int(int(options['execucoes']) * scale),
+            empenhos=int(int(options['empenhos']) * scale),
+            escolas=int(int(options['escolas']) * scale),
+            years=int(options['years']))
+
+    # lets the test client reach the views whatever ALLOWED_HOSTS is
+    setup_test_environment()
+    try:
+        results = benchmark.run_cases(benchmark.view_cases(), repeat,
+                                      trace_memory)
+    finally:
+        teardown_test_environment()
+
+    if 'etl' in flags:
+        results += benchmark.run_cases(benchmark.etl_cases(), 1,
+                                       trace_memory)
+
+    benchmark.write_report(results, options['output'], flags=sorted(flags),
+                           **options)
+    print(f'Results written to {options["output"]}')
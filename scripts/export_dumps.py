@@ -0,0 +1,13 @@
+from django.conf import settings
+
+from global_app.dumps import DUMPS, export_dump
+
+
+def run(*args):
+    # the dumps named in the args, or all of them
+    names = [name for name in args if name in DUMPS] or list(DUMPS)
+
+    for name in names:
+        print(f"Exporting {name}")
+        manifest_path = export_dump(name, settings.COLUMNAR_DUMPS_DIR)
+        print(f"{name} exported: {manifest_path}")
@@ -1,26 +1,81 @@
-from budget_execution import services
+from budget_execution import services, tasks
+from global_app.etl_metrics import etl_run
+from global_app.prerender import prerender_after_etl
+from mosaico.services import generate_download_files
 
 
 def run(*args):
     load_everything = bool("load_everything" in args)
+    # each year is imported in its own process, as done by the full reloads
+    parallel = bool("parallel" in args) or load_everything
+    # only the raw rows that changed since the last incremental load are
+    # written and only the execucoes generated from them are replaced
+    incremental = bool("incremental" in args)
+    # only the raw rows loaded after the last watermark load are read. cheap
+    # enough to run hourly
+    watermark = bool("watermark" in args)
 
-    services.erase_data_to_be_updated(load_everything)
-
-    services.load_data_from_orcamento_raw(load_everything)
-    print("Data loaded from orcamento_raw_load")
-    services.load_data_from_empenhos_raw(load_everything)
-    print("Data loaded from empenhos_raw_load")
-
-    print("Generating execucoes:")
-    print("Importing Minimo Legal")
-    services.import_minimo_legal()
-
-    print("Importing orcamentos to ExecucaoTemp")
-    services.import_orcamentos(load_everything)
-    print("Importing empenhos to ExecucaoTemp")
-    services.import_empenhos(load_everything)
-    print("Moving execucoes from ExecucaoTemp to Execucao")
-    services.update_execucao_table_from_execucao_temp(load_everything)
-    print("Applying From To")
-    services.apply_fromto()
-    print("Execucoes generated")
+    if "celery" in args:
+        result = tasks.build_execucoes_pipeline(load_everything).delay()
+        print(f"Execucoes pipeline sent to the Celery workers: {result.id}")
+        return
+
+    with etl_run('budget_execution'):
+        indexers = None
+        watermarks = None
+        if watermark:
+            indexers, watermarks = services.load_new_rows_from_raw()
+            # the promotion checks the totals of every year changed
+            load_everything = True
+            print("Importing Minimo Legal")
+            services.import_minimo_legal()
+            for year in sorted({indexer[0] for indexer in indexers}):
+                services.import_orcamentos(year=year)
+                services.import_empenhos(year=year)
+        elif incremental:
+            years = services.get_years_to_be_loaded(load_everything)
+            indexers = services.load_changes_from_raw(years)
+            print("Importing Minimo Legal")
+            services.import_minimo_legal()
+            for year in years:
+                services.import_orcamentos(year=year)
+                services.import_empenhos(year=year)
+        elif parallel:
+            services.erase_data_to_be_updated(load_everything)
+            years = services.get_years_to_be_loaded(load_everything)
+            print(f"Importing {years} to ExecucaoTemp, one process per year")
+            services.import_years_in_processes(years)
+            # after the orcamentos of its year are loaded again
+            print("Importing Minimo Legal")
+            services.import_minimo_legal()
+        else:
+            # the current year
+            services.erase_data_to_be_updated()
+            services.load_data_from_orcamento_raw()
+            print("Data loaded from orcamento_raw_load")
+            services.load_data_from_empenhos_raw()
+            print("Data loaded from empenhos_raw_load")
+
+            print("Generating execucoes:")
+            print("Importing Minimo Legal")
+            services.import_minimo_legal()
+
+            print("Importing orcamentos to ExecucaoTemp")
+            services.import_orcamentos()
+            print("Importing empenhos to ExecucaoTemp")
+            services.import_empenhos()
+
+        print("Moving execucoes from ExecucaoTemp to Execucao")
+        services.update_execucao_table_from_execucao_temp(
+            load_everything, indexers=indexers)
+        if watermarks:
+            services.save_watermarks(watermarks)
+        print("Applying From To")
+        services.apply_fromto()
+        print("Updating execucoes metadata")
+        services.update_execucoes_metadata()
+        print("Generating mosaico downloads")
+        generate_download_files()
+        print("Execucoes generated")
+
+    prerender_after_etl('mosaico', 'geologia')
@@ -0,0 +1,58 @@
+"""
+Generates synthetic source data for the ETLs. With `load`, the raw tables
+(orcamento_raw_load, empenhos_raw_load and contratos_raw_load) and the SOF
+empenhos temp table are filled, with COPY on postgres. With `files`, the raw
+tables dumps, the SOF and EOL API responses and the from-to spreadsheets are
+written to `output`. Counts are multiplied by `scale` and `skew` sets how
+concentrated empenhos are in a few budget lines and contratos (0 is even).
+Loading changes the data, so only run it against a benchmark database.
+
+$ python manage.py runscript generate_synthetic_data --script-args load \
+    files output=synthetic scale=0.1 years=2 skew=1.2 seed=0
+"""
+from global_app.synthetic import (
+    SyntheticSources, load_sources, write_sources)
+
+
+DEFAULTS = {
+    'scale': 1.0,
+    'output': 'synthetic',
+    'years': 1,
+    'orcamentos': 100000,
+    'empenhos': 1000000,
+    'contratos': 20000,
+    'sof_empenhos': 200000,
+    'escolas': 4000,
+    'projetos': 300,
+    'elementos': 40,
+    'fontes': 10,
+    'skew': 1.0,
+    'seed': 0,
+}
+SCALED = ['orcamentos', 'empenhos', 'contratos', 'sof_empenhos', 'escolas']
+
+
+def run(*args):
+    flags = {arg for arg in args if '=' not in arg}
+    options = dict(DEFAULTS)
+    options.update(arg.split('=', 1) for arg in args if '=' in arg)
+
+    scale = float(options['scale'])
+    sources = SyntheticSources(
+        years=int(options['years']),
+        projetos=int(options['projetos']),
+        elementos=int(options['elementos']),
+        fontes=int(options['fontes']),
+        skew=float(options['skew']),
+        seed=int(options['seed']),
+        **{name: int(int(options[name]) * scale) for name in SCALED})
+
+    if 'load' in flags:
+        counts = load_sources(sources)
+        for name, count in counts.items():
+            print(f'{count} {name} loaded')
+    if 'files' in flags:
+        for path in write_sources(sources, options['output']):
+            print(f'{path} written')
+    if not flags & {'load', 'files'}:
+        print('Nothing to do: pass `load` and/or `files`')
@@ -0,0 +1,25 @@
+import os
+
+from django.conf import settings
+
+from contratos.models import EmpenhoSOFCache, ExecucaoContrato
+from global_app.dumps import DUMPS, MANIFEST_FILENAME, import_dump
+
+
+def run(*args):
+    # the dumps named in the args, or all of them
+    names = [name for name in args if name in DUMPS] or list(DUMPS)
+    # deletes the rows of the tables before importing them
+    replace = bool("replace" in args)
+
+    for name in names:
+        dump_dir = os.path.join(settings.COLUMNAR_DUMPS_DIR, name)
+        if not os.path.exists(os.path.join(dump_dir, MANIFEST_FILENAME)):
+            print(f"No {name} dump in {settings.COLUMNAR_DUMPS_DIR}")
+            continue
+        print(f"Importing {name}")
+        import_dump(dump_dir, replace=replace)
+
+        if name == 'execucoes_contratos':
+            EmpenhoSOFCache.objects.fill_missing_indexers()
+            ExecucaoContrato.objects.update_metadata()
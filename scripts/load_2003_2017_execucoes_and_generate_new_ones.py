@@ -1,27 +1,33 @@
 from budget_execution import services
+from global_app.etl_metrics import etl_run
+from global_app.prerender import prerender_after_etl
+from mosaico.services import generate_download_files
 
 
 def run(*args):
-    print("Loading execucoes from 2003 to 2017")
-    services.load_2003_2017_execucoes_from_json()
-    print("2003-2017 execucoes loaded")
+    with etl_run('budget_execution'):
+        print("Loading execucoes from 2003 to 2017")
+        services.load_2003_2017_execucoes_from_json()
+        print("2003-2017 execucoes loaded")
 
-    print("Loading 2018+ data from orcamento_raw_load")
-    services.load_data_from_orcamento_raw(load_everything=True)
+        print("Generating execucoes:")
+        # 2018+ years are loaded from the raw tables and imported to
+        # ExecucaoTemp in parallel, one process per year
+        years = services.get_years_to_be_loaded(load_everything=True)
+        print(f"Importing {years} to ExecucaoTemp")
+        services.import_years_in_processes(years)
+        # after the orcamentos of its year are loaded again
+        print("Importing Minimo Legal")
+        services.import_minimo_legal()
+        print("Moving execucoes from ExecucaoTemp to Execucao")
+        services.update_execucao_table_from_execucao_temp(
+            load_everything=True)
+        print("Applying From To")
+        services.apply_fromto()
+        print("Updating execucoes metadata")
+        services.update_execucoes_metadata()
+        print("Generating mosaico downloads")
+        generate_download_files()
+        print("Execucoes generated")
 
-    print("Loading 2018+ data from empenhos_raw_load")
-    services.load_data_from_empenhos_raw(load_everything=True)
-
-    print("Generating execucoes:")
-    print("Importing Minimo Legal")
-    services.import_minimo_legal()
-
-    print("Importing orcamentos to ExecucaoTemp")
-    services.import_orcamentos(load_everything=True)
-    print("Importing empenhos to ExecucaoTemp")
-    services.import_empenhos(load_everything=True)
-    print("Moving execucoes from ExecucaoTemp to Execucao")
-    services.update_execucao_table_from_execucao_temp(load_everything=True)
-    print("Applying From To")
-    services.apply_fromto()
-    print("Execucoes generated")
+    prerender_after_etl('mosaico', 'geologia')
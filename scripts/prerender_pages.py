@@ -0,0 +1,26 @@
+"""
+Pre-renders the pages of the public views to `output` (PRERENDER_ROOT by
+default): the pages of every app or of the apps given. The ETLs run it by
+themselves when PRERENDER_ROOT is set.
+
+$ python manage.py runscript prerender_pages --script-args [mosaico] \
+    [geologia] [contratos] [regionalizacao] [output=prerendered] \
+    [max_pages=1000]
+"""
+from django.conf import settings
+
+from global_app import prerender
+
+
+def run(*args):
+    options = dict(arg.split('=', 1) for arg in args if '=' in arg)
+    apps = [arg for arg in args if arg in prerender.APP_DATASETS] or \
+        list(prerender.APP_DATASETS)
+    root = options.get('output', settings.PRERENDER_ROOT)
+    if not root:
+        print('Set PRERENDER_ROOT or the output directory')
+        return
+    max_pages = int(options.get('max_pages', settings.PRERENDER_MAX_PAGES))
+
+    for app in apps:
+        prerender.prerender_app(root, app, max_pages=max_pages)